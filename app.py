@@ -1,72 +1,214 @@
-from flask import Flask, send_from_directory, send_file, request
+import atexit
+from flask import Blueprint, Flask, Response, current_app, send_from_directory, send_file, request
 from flask_cors import CORS
-from flask_expects_json import expects_json
-from pymysql import cursors
 from os import PathLike, path
-import boto3
-import pymysql
+from typing import Any, Optional
 from config import Config
+from db import ConnectionPool, create_pool, get_db_conn, init_app as init_db
+from avatar import read_avatar_upload
+from cache import EmployeeCache, create_cache
+from document import init_employee_documents
+from hashing import get_hashing_service, init_hashing_service
+from storage import AvatarUploadQueue, create_storage
+from metrics import get_metrics, init_metrics, init_app as init_metrics_app
+from serializer import create_compression, create_json_provider, init_app as init_serializer
 from error import blueprint as error_blueprint
-from handler import handle_create_one_employee, handle_delete_one_employee, handle_fetch_many_employee, handle_fetch_one_employee, handle_update_one_employee
-from schema import create_employee_schema, update_employee_schema
+from handler import bulk_create_max_bytes, bulk_create_max_size, handle_avatar_uploaded, handle_batch_get_employees, handle_bulk_create_employees, handle_create_one_employee, handle_delete_one_employee, handle_export_employees, handle_fetch_employee_stats, handle_fetch_many_employee, handle_fetch_one_employee, handle_readiness, handle_search_employees, handle_update_one_employee, handle_upload_employee_avatar
+from helper import parse_employee_fields, parse_json_list_body
+from validation import expects_json, validate_batch_get_employees, validate_create_employee, validate_update_employee
+from werkzeug.exceptions import NotFound
 
 bundleExist = path.isfile('./web/dist/index.html')
 
-# initialize the config (setup environment var)
-config = Config()
+blueprint = Blueprint('api', __name__)
 
-# setup flask
-app = Flask(__name__)
-cors = CORS(app, origins=["http://localhost:3333"] if config.app_env != "production" else None)
 
-# register blueprints
-app.register_blueprint(error_blueprint)
+def create_app(config: Optional[Config] = None, start: bool = True) -> Flask:
+    """
+    Create the flask app. The pools, caches and background workers it uses
+    are created by `start_app`, which has to run in the process serving the
+    app, so with `start=False` (a preloading server) it is left to be called
+    after the worker has been forked.
+    """
+    # initialize the config (setup environment var)
+    config = config if config is not None else Config()
 
-# connect to rds (mysql)
-db_conn = pymysql.connect(
-    host=config.database_host,
-    port=3306,
-    user=config.database_user,
-    password=config.database_password,
-    db=config.database_db,
-    charset='utf8mb4',
-    cursorclass=cursors.DictCursor
-)
+    # setup flask
+    app = Flask(__name__)
+    CORS(app, origins=["http://localhost:3333"] if config.app_env != "production" else None)
+    app.extensions['app_config'] = config
 
-@app.route("/", methods=['GET'])
+    # register blueprints
+    app.register_blueprint(error_blueprint)
+    app.register_blueprint(blueprint)
+
+    # time every request (once metrics are enabled by `start_app`), including
+    # the compression registered below
+    init_metrics_app(app)
+
+    # setup the json encoding of responses and the compression of large ones
+    init_serializer(app, create_json_provider(config), create_compression(config))
+
+    if start:
+        start_app(app)
+    return app
+
+
+def start_app(app: Flask) -> None:
+    config: Config = app.extensions['app_config']
+
+    # setup the metrics first, the pool's cursors are instrumented if enabled
+    init_metrics(config)
+
+    # setup the connection pool to rds (mysql), connections are checked out per request
+    db_pool = create_pool(config)
+    init_db(app, db_pool)
+
+    start_services(app.extensions, config, db_pool)
+
+
+def start_services(extensions: dict[str, Any], config: Config, db_pool: ConnectionPool) -> None:
+    """
+    Start what both the flask and the asgi app (asgi.py) use next to their
+    connection pool, registering it in the app's `extensions`.
+    """
+    # setup the password hashing workers (started on first use)
+    init_hashing_service(config)
+
+    # setup the materialized employee documents (read through the view if disabled)
+    init_employee_documents(config)
+
+    # setup the employee document cache (None if disabled)
+    employee_cache = create_cache(config)
+    extensions['employee_cache'] = employee_cache
+
+    def record_avatar_upload(username: str, avatar_url: Optional[str], avatar_variants: Optional[str]) -> None:
+        with db_pool.connection() as db_conn:
+            handle_avatar_uploaded(db_conn, username, avatar_url, avatar_variants, employee_cache)
+
+    # setup the background avatar uploads, sharing one s3 client
+    extensions['avatar_uploads'] = AvatarUploadQueue(
+        create_storage(config), config.s3_upload_workers, config.avatar_max_size, config.avatar_variant_sizes, record_avatar_upload)
+
+
+def stop_app(app: Flask) -> None:
+    """
+    Drain the background work of a started app and close its pools: queued
+    avatar uploads are finished (and recorded) before the connections they
+    need are closed. The asgi app is stopped the same way.
+    """
+    if 'avatar_uploads' in app.extensions:
+        app.extensions.pop('avatar_uploads').close()
+    get_hashing_service().close()
+    if 'db_pool' in app.extensions:
+        app.extensions.pop('db_pool').close()
+
+
+def _config() -> Config:
+    return current_app.extensions['app_config']
+
+
+def _employee_cache() -> Optional[EmployeeCache]:
+    return current_app.extensions['employee_cache']
+
+
+def _avatar_uploads() -> AvatarUploadQueue:
+    return current_app.extensions['avatar_uploads']
+
+
+@blueprint.route("/", methods=['GET'])
 def index_page():
     return send_file('web/dist/index.html')
 
 
-@app.route("/<path:path>", methods=['GET'])
+@blueprint.route("/<path:path>", methods=['GET'])
 def send_static_files(path: PathLike):
     return send_from_directory('web/dist', path) if bundleExist else 'No html files'
 
 
-@app.route("/employee/<string:username>", methods=['GET', 'PUT', 'DELETE'])
-@expects_json(update_employee_schema, ignore_for=['GET', 'DELETE'])
+@blueprint.route("/healthz", methods=['GET'])
+def healthz():
+    # the process is up and serving requests
+    return {'status': 'ok'}
+
+
+@blueprint.route("/readyz", methods=['GET'])
+def readyz():
+    return handle_readiness(current_app.extensions['db_pool'])
+
+
+@blueprint.route("/metrics", methods=['GET'])
+def metrics():
+    if not get_metrics().enabled:
+        raise NotFound("metrics are disabled")
+    body, content_type = get_metrics().render()
+    return Response(body, content_type=content_type)
+
+
+@blueprint.route("/employee/<string:username>", methods=['GET', 'PUT', 'DELETE'])
+@expects_json(validate_update_employee, ignore_for=['GET', 'DELETE'])
 def employee(username: str):
     if request.method == "GET":
-        return handle_fetch_one_employee(db_conn, username)
+        return handle_fetch_one_employee(get_db_conn(), username, _employee_cache(), request.if_none_match, parse_employee_fields(request.args))
     elif request.method == "DELETE":
-        return handle_delete_one_employee(db_conn, username)
+        return handle_delete_one_employee(get_db_conn(), username, _employee_cache(), request.if_match)
     else:
-        return handle_update_one_employee(db_conn, username, request.json, config.s3_bucket_id)
+        return handle_update_one_employee(get_db_conn(), username, request.json, _avatar_uploads(), _employee_cache(), request.if_match)
+
 
+@blueprint.route("/employee/<string:username>/avatar", methods=['PUT'])
+def employee_avatar(username: str):
+    avatar = read_avatar_upload(request, _avatar_uploads().max_size)
+    return handle_upload_employee_avatar(get_db_conn(), username, avatar, _avatar_uploads(), _employee_cache())
 
-@app.route("/employee", methods=['POST'])
-@expects_json(create_employee_schema)
+
+@blueprint.route("/employee", methods=['POST'])
+@expects_json(validate_create_employee)
 def create_employee():
-    return handle_create_one_employee(db_conn, request.json, config.s3_bucket_id)
+    return handle_create_one_employee(get_db_conn(), request.json, _avatar_uploads(), _employee_cache())
 
 
-@app.route("/employees", methods=['GET'])
+@blueprint.route("/employees", methods=['GET'])
 def employees():
-    return handle_fetch_many_employee(db_conn, request.args)
+    return handle_fetch_many_employee(get_db_conn(), request.args, request.if_none_match)
+
+
+@blueprint.route("/employees/search", methods=['GET'])
+def search_employees():
+    return handle_search_employees(get_db_conn(), request.args, _config().search_timeout_ms)
+
+
+@blueprint.route("/employees/batch-get", methods=['POST'])
+@expects_json(validate_batch_get_employees)
+def batch_get_employees():
+    return handle_batch_get_employees(get_db_conn(), request.json, _employee_cache())
+
+
+@blueprint.route("/employees/bulk", methods=['POST'])
+def bulk_create_employees():
+    return handle_bulk_create_employees(get_db_conn(), parse_json_list_body(request, bulk_create_max_size, bulk_create_max_bytes), _employee_cache())
+
+
+@blueprint.route("/employees/export", methods=['GET'])
+def export_employees():
+    return handle_export_employees(get_db_conn(), request.args)
+
+
+@blueprint.route("/employees/stats", methods=['GET'])
+def employee_stats():
+    return handle_fetch_employee_stats(get_db_conn(), request.args, _employee_cache())
+
+
+@blueprint.route("/cache/stats", methods=['GET'])
+def cache_stats():
+    return _employee_cache().stats() if _employee_cache() is not None else {}
 
 
 if __name__ == '__main__':
     # TODO: Check whether web/dist folder exists
 
-    debug = False if config.app_env == "production" else True
+    # development server only, production runs under gunicorn (see gunicorn.conf.py)
+    app = create_app()
+    atexit.register(stop_app, app)
+    debug = False if app.extensions['app_config'].app_env == "production" else True
     app.run(host='0.0.0.0', port=5000, debug=debug)
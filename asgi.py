@@ -0,0 +1,256 @@
+"""
+Optional asyncio variant of the app, served by uvicorn workers under
+gunicorn (see gunicorn_asgi.conf.py). Its packages are not installed with the
+app's, add them first:
+
+    pip install -r requirements-async.txt   # or `pipenv install --categories async`
+    make prod-async
+
+The reads (one employee, batch gets, pages, search, stats) are awaited on
+an aiomysql pool, so a single worker holds as many of them in flight as that
+pool has connections (ASYNC_DATABASE_POOL_MAX_SIZE) rather than one per
+thread. The writes run the handlers of handler.py unchanged on threads, over
+the same blocking pool, hashing processes and avatar upload queue as the
+flask app. Avatars reach s3 from the upload queue in both apps, no request
+waits on s3.
+
+The web bundle, CORS for the dev server and the csv/ndjson export are only
+served by the flask app (app.py).
+"""
+import asyncio
+import io
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional
+from pymysql import OperationalError
+from quart import Blueprint, Quart, current_app, g, request
+from quart.utils import run_sync
+from quart.wrappers import Response
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound, RequestEntityTooLarge, ServiceUnavailable
+from app import start_services, stop_app
+from avatar import Avatar, check_avatar_upload_length, read_avatar_stream
+from cache import EmployeeCache
+from config import Config
+from db import ConnectionPool, DatabaseUnavailable, create_async_pool, create_pool
+from helper import parse_employee_fields, parse_json_list
+from metrics import get_metrics, init_metrics
+from serializer import create_compression, create_json_provider, set_default_json_provider
+from storage import AvatarUploadQueue
+from validation import validate_batch_get_employees, validate_create_employee, validate_update_employee, validation_error
+import async_handler
+import handler
+
+blueprint = Blueprint('api', __name__)
+
+
+def create_asgi_app(config: Optional[Config] = None) -> Quart:
+    config = config if config is not None else Config()
+
+    app = Quart(__name__)
+    app.extensions['app_config'] = config
+    app.register_blueprint(blueprint)
+    app.register_error_handler(HTTPException, _http_error)
+
+    # time every request (once metrics are enabled on start), including the
+    # compression registered below
+    @app.before_request
+    async def start_timer() -> None:
+        if get_metrics().enabled:
+            g.request_start = time.perf_counter()
+
+    @app.after_request
+    async def observe_request(response: Response) -> Response:
+        start: Optional[float] = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            get_metrics().observe_request(request.method, route, response.status_code, time.perf_counter() - start)
+        return response
+
+    # the handlers encode outside of a flask app, with the default provider
+    set_default_json_provider(create_json_provider(config))
+
+    compression = create_compression(config)
+    if compression is not None:
+        @app.after_request
+        async def compress_response(response: Response) -> Response:
+            return await compression.compress_async(response, request.accept_encodings)
+
+    @app.before_serving
+    async def start() -> None:
+        init_metrics(config)
+        app.extensions['async_db_pool'] = await create_async_pool(config)
+        db_pool = create_pool(config)
+        app.extensions['db_pool'] = db_pool
+        start_services(app.extensions, config, db_pool)
+
+    @app.after_serving
+    async def stop() -> None:
+        # drain the uploads off the loop, they record into the blocking pool
+        await run_sync(stop_app)(app)
+        async_db_pool = app.extensions.pop('async_db_pool')
+        async_db_pool.close()
+        await async_db_pool.wait_closed()
+
+    return app
+
+
+async def _http_error(e: HTTPException):
+    return {"error": e.description}, e.code
+
+
+def _config() -> Config:
+    return current_app.extensions['app_config']
+
+
+def _employee_cache() -> Optional[EmployeeCache]:
+    return current_app.extensions['employee_cache']
+
+
+def _avatar_uploads() -> AvatarUploadQueue:
+    return current_app.extensions['avatar_uploads']
+
+
+@asynccontextmanager
+async def _db_conn() -> AsyncIterator[Any]:
+    # a connection of the async pool, held for the rest of the block
+    db_pool = current_app.extensions['async_db_pool']
+    timeout = _config().database_pool_timeout
+    try:
+        db_conn = await asyncio.wait_for(db_pool.acquire(), timeout)
+    except asyncio.TimeoutError:
+        raise ServiceUnavailable(f"unable to acquire a database connection within {timeout}s")
+    except OperationalError as e:
+        raise ServiceUnavailable(f"unable to connect to the database: {e}")
+    try:
+        yield db_conn
+    finally:
+        db_pool.release(db_conn)
+
+
+async def _run_handler(handle: Callable[..., Any], *args: Any) -> Response:
+    """
+    Run a blocking handler of handler.py on a thread, with a connection of the
+    blocking pool, and turn its flask response into one of this app.
+    """
+    db_pool: ConnectionPool = current_app.extensions['db_pool']
+
+    def run() -> Any:
+        try:
+            with db_pool.connection() as db_conn:
+                return handle(db_conn, *args)
+        except DatabaseUnavailable as e:
+            raise ServiceUnavailable(str(e))
+
+    resp = await run_sync(run)()
+    return Response(resp.get_data(), status=resp.status_code, headers=resp.headers)
+
+
+async def _json_body(validate: Callable[[Any], Any]) -> Any:
+    # what `expects_json` does for the flask routes
+    data = await request.get_json(silent=True)
+    if data is None:
+        raise BadRequest("Failed to decode JSON object")
+    error = validation_error(validate, data)
+    if error is not None:
+        raise BadRequest(error)
+    return data
+
+
+async def _json_list_body(max_rows: int, max_size: int) -> list[Any]:
+    # what `parse_json_list_body` does for the flask routes, the body is
+    # received first (bounded by the declared length) and then read like a stream
+    if request.content_length is not None and request.content_length > max_size:
+        raise RequestEntityTooLarge(f"request body cannot be larger than {max_size} bytes")
+    body = await request.get_data()
+    return parse_json_list(io.BytesIO(body), request.mimetype, max_rows, max_size, len(body))
+
+
+async def _avatar_upload(max_size: int) -> Avatar:
+    # what `read_avatar_upload` does for the flask routes, the body is
+    # received first and then read like a stream
+    check_avatar_upload_length(request.content_length, request.mimetype, max_size)
+    if request.mimetype == 'multipart/form-data':
+        files = await request.files
+        if 'avatar' not in files:
+            raise BadRequest("missing 'avatar' file in multipart form")
+        return read_avatar_stream(files['avatar'].stream, max_size)
+    body = await request.get_data()
+    return read_avatar_stream(io.BytesIO(body), max_size, len(body))
+
+
+@blueprint.route("/healthz", methods=['GET'])
+async def healthz():
+    return {'status': 'ok'}
+
+
+@blueprint.route("/readyz", methods=['GET'])
+async def readyz():
+    return await async_handler.handle_readiness(current_app.extensions['async_db_pool'])
+
+
+@blueprint.route("/metrics", methods=['GET'])
+async def metrics():
+    if not get_metrics().enabled:
+        raise NotFound("metrics are disabled")
+    body, content_type = get_metrics().render()
+    return Response(body, content_type=content_type)
+
+
+@blueprint.route("/employee/<string:username>", methods=['GET', 'PUT', 'DELETE'])
+async def employee(username: str):
+    if request.method == "GET":
+        async with _db_conn() as db_conn:
+            return await async_handler.handle_fetch_one_employee(db_conn, username, _employee_cache(), request.if_none_match, parse_employee_fields(request.args))
+    elif request.method == "DELETE":
+        return await _run_handler(handler.handle_delete_one_employee, username, _employee_cache(), request.if_match)
+    else:
+        body = await _json_body(validate_update_employee)
+        return await _run_handler(handler.handle_update_one_employee, username, body, _avatar_uploads(), _employee_cache(), request.if_match)
+
+
+@blueprint.route("/employee/<string:username>/avatar", methods=['PUT'])
+async def employee_avatar(username: str):
+    avatar = await _avatar_upload(_avatar_uploads().max_size)
+    return await _run_handler(handler.handle_upload_employee_avatar, username, avatar, _avatar_uploads(), _employee_cache())
+
+
+@blueprint.route("/employee", methods=['POST'])
+async def create_employee():
+    body = await _json_body(validate_create_employee)
+    return await _run_handler(handler.handle_create_one_employee, body, _avatar_uploads(), _employee_cache())
+
+
+@blueprint.route("/employees", methods=['GET'])
+async def employees():
+    async with _db_conn() as db_conn:
+        return await async_handler.handle_fetch_many_employee(db_conn, request.args, request.if_none_match)
+
+
+@blueprint.route("/employees/search", methods=['GET'])
+async def search_employees():
+    async with _db_conn() as db_conn:
+        return await async_handler.handle_search_employees(db_conn, request.args, _config().search_timeout_ms)
+
+
+@blueprint.route("/employees/batch-get", methods=['POST'])
+async def batch_get_employees():
+    body = await _json_body(validate_batch_get_employees)
+    async with _db_conn() as db_conn:
+        return await async_handler.handle_batch_get_employees(db_conn, body, _employee_cache())
+
+
+@blueprint.route("/employees/bulk", methods=['POST'])
+async def bulk_create_employees():
+    rows = await _json_list_body(handler.bulk_create_max_size, handler.bulk_create_max_bytes)
+    return await _run_handler(handler.handle_bulk_create_employees, rows, _employee_cache())
+
+
+@blueprint.route("/employees/stats", methods=['GET'])
+async def employee_stats():
+    async with _db_conn() as db_conn:
+        return await async_handler.handle_fetch_employee_stats(db_conn, request.args, _employee_cache())
+
+
+@blueprint.route("/cache/stats", methods=['GET'])
+async def cache_stats():
+    return _employee_cache().stats() if _employee_cache() is not None else {}
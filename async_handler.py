@@ -0,0 +1,168 @@
+"""
+The read handlers of handler.py as coroutines, for the asgi app (asgi.py).
+They run the same queries and build the same responses through the same
+helpers, only the round trips to mysql are awaited on an aiomysql connection
+instead of blocking a thread. Writes are not duplicated here, the asgi app
+runs the handlers of handler.py for them on threads.
+"""
+import asyncio
+from typing import Any, Optional
+from pymysql import OperationalError
+from quart.wrappers import Response
+from werkzeug.datastructures import ETags, MultiDict
+from werkzeug.exceptions import InternalServerError, NotFound, ServiceUnavailable
+from query import build_select_employee_page_query, build_select_employees_by_sql, build_select_employees_by_id_sql, build_search_employees_query, build_select_employee_stats_sql
+from helper import EmployeeFields, parse_cursor_pagination, parse_employee_fields, parse_employee_filters, parse_search_query
+from model import decode_employee_projection, decode_employee_row
+from cache import EmployeeCache
+from document import get_employee_documents
+from serializer import json_response
+from handler import _batch_get_result, _cached_employees, _conditional_response, _employee_page, _employee_page_source, _employee_response, _missing_employees, _parse_batch_get, _select_employee_sql, _execution_time_exceeded, _parse_stats_group_by, _search_page, readiness_timeout, search_max_candidates
+
+
+def _pool_stats(db_pool: Any) -> dict[str, int]:
+    return {
+        'size': db_pool.size,
+        'idle': db_pool.freesize,
+        'in_use': db_pool.size - db_pool.freesize,
+        'max_size': db_pool.maxsize,
+    }
+
+
+async def handle_readiness(db_pool: Any) -> Response:
+    # ready only if a connection can be checked out and reaches the server
+    try:
+        db_conn = await asyncio.wait_for(db_pool.acquire(), readiness_timeout)
+        try:
+            await db_conn.ping(reconnect=False)
+        finally:
+            db_pool.release(db_conn)
+    except Exception as e:
+        return json_response({'status': 'unavailable', 'error': str(e), 'pool': _pool_stats(db_pool)}, 503, response_class=Response)
+    return json_response({'status': 'ready', 'pool': _pool_stats(db_pool)}, response_class=Response)
+
+
+async def handle_fetch_one_employee(db_conn: Any, username: str, cache: Optional[EmployeeCache] = None, if_none_match: Optional[ETags] = None,
+                                    fields: Optional[EmployeeFields] = None) -> Response:
+    # the cache is called on the event loop, the memory backend never blocks
+    # and a redis round trip is short next to the query it saves
+    resp, version = cache.get(username) if cache is not None else (None, None)
+    if resp is not None:
+        return _employee_response(resp, fields, if_none_match, Response)
+
+    cursor = await db_conn.cursor()
+
+    try:
+        await cursor.execute(_select_employee_sql(fields), (username))
+        result = await cursor.fetchone()
+        if result is None:
+            raise NotFound(
+                f"unable to find employee with username '{username}'")
+        resp = decode_employee_row(result) if fields is None else decode_employee_projection(result)
+    except NotFound as e:
+        raise e
+    except Exception as e:
+        raise InternalServerError(str(e))
+    finally:
+        await cursor.close()
+
+    if cache is not None and fields is None:
+        cache.set(username, resp, version)
+
+    return _employee_response(resp, fields, if_none_match, Response)
+
+
+async def handle_fetch_many_employee(db_conn: Any, args: MultiDict[str, str], if_none_match: Optional[ETags] = None) -> Response:
+    pagination = parse_cursor_pagination(args)
+    filters = parse_employee_filters(args)
+    fields = parse_employee_fields(args)
+    cursor = await db_conn.cursor()
+
+    try:
+        # fetch one extra row to know whether there is a next page
+        query, params = build_select_employee_page_query(
+            pagination['cursor'], pagination['limit'] + 1, filters, *_employee_page_source(fields))
+        await cursor.execute(query, params)
+        result = list(await cursor.fetchall())
+    except Exception as e:
+        raise InternalServerError(str(e))
+    finally:
+        await cursor.close()
+
+    return _conditional_response(*_employee_page(result, pagination['limit'], fields), if_none_match, Response)
+
+
+async def handle_batch_get_employees(db_conn: Any, body: dict[str, Any], cache: Optional[EmployeeCache] = None) -> Response:
+    key, values = _parse_batch_get(body)
+    found, versions = _cached_employees(key, values, cache)
+    missing = _missing_employees(key, values, found)
+
+    result = []
+    if len(missing) > 0:
+        cursor = await db_conn.cursor()
+
+        try:
+            await cursor.execute(build_select_employees_by_sql(
+                key, len(missing), get_employee_documents().source), tuple(missing))
+            result = list(await cursor.fetchall())
+        except Exception as e:
+            raise InternalServerError(str(e))
+        finally:
+            await cursor.close()
+
+    return json_response(_batch_get_result(key, values, found, result, cache, versions), response_class=Response)
+
+
+async def handle_search_employees(db_conn: Any, args: MultiDict[str, str], timeout_ms: int) -> Response:
+    search = parse_search_query(args)
+    cursor = await db_conn.cursor()
+
+    try:
+        query, params = build_search_employees_query(
+            search['q'], search_max_candidates, search['limit'] + 1, search['offset'], timeout_ms)
+        await cursor.execute(query, params)
+        employee_ids = [row['employee_id'] for row in await cursor.fetchall()]
+
+        has_more = len(employee_ids) > search['limit']
+        employee_ids = employee_ids[:search['limit']]
+
+        result = []
+        if len(employee_ids) > 0:
+            await cursor.execute(build_select_employees_by_id_sql(
+                len(employee_ids), get_employee_documents().source), tuple(employee_ids))
+            result = list(await cursor.fetchall())
+    except OperationalError as e:
+        if e.args[0] == _execution_time_exceeded:
+            raise ServiceUnavailable(f"search for '{search['q']}' took longer than {timeout_ms}ms")
+        raise InternalServerError(str(e))
+    except Exception as e:
+        raise InternalServerError(str(e))
+    finally:
+        await cursor.close()
+
+    return json_response(_search_page(search, employee_ids, result, has_more), response_class=Response)
+
+
+async def handle_fetch_employee_stats(db_conn: Any, args: MultiDict[str, str], cache: Optional[EmployeeCache] = None) -> Response:
+    group_by = _parse_stats_group_by(args)
+
+    if cache is not None:
+        resp = cache.get_analytics(group_by)
+        if resp is not None:
+            return json_response(resp, response_class=Response)
+
+    cursor = await db_conn.cursor()
+
+    try:
+        await cursor.execute(build_select_employee_stats_sql(group_by), ())
+        result = list(await cursor.fetchall())
+    except Exception as e:
+        raise InternalServerError(str(e))
+    finally:
+        await cursor.close()
+
+    resp = {'group_by': group_by, 'groups': result}
+    if cache is not None:
+        cache.set_analytics(group_by, resp)
+
+    return json_response(resp, response_class=Response)
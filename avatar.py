@@ -0,0 +1,174 @@
+import binascii
+import io
+import logging
+from typing import IO, List, NamedTuple, Optional
+from werkzeug.exceptions import BadRequest, LengthRequired, RequestEntityTooLarge
+from werkzeug.wrappers import Request
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # variants are only generated when pillow is installed
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# base64 characters decoded per step, a multiple of 4 so every chunk decodes on its own
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# bytes read per step from an uploaded file or request body
+READ_CHUNK_SIZE = 64 * 1024
+
+# a data url header is tiny, never look further than this for its comma
+_max_header_length = 128
+
+# room for the boundaries and part headers around an avatar in a multipart form
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class Avatar(NamedTuple):
+    extension: str
+    content_type: str
+    body: bytes
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Detect the image type from the leading bytes of the image rather than
+    trusting the declared mime type. Returns the file extension or None if
+    the image type is not supported.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'GIF87a') or head.startswith(b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    text = head.lstrip().lower()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+        return 'svg'
+    return None
+
+
+def _to_avatar(body: bytes) -> Avatar:
+    extension = sniff_image_type(body[:512])
+    if extension is None:
+        raise BadRequest("avatar is not a supported image (jpeg, png, gif, webp or svg)")
+    content_type = 'image/svg+xml' if extension == 'svg' else f"image/{extension}"
+    return Avatar(extension, content_type, body)
+
+
+def decode_data_url(data_url: str, max_size: int) -> Avatar:
+    """
+    Decode a `data:image/...;base64,...` url. The size is checked before
+    anything is decoded, and the payload is decoded chunk by chunk into one
+    preallocated buffer instead of splitting and copying the whole string.
+    """
+    comma = data_url.find(',', 0, _max_header_length)
+    if comma == -1 or not data_url.startswith('data:image/') or not data_url.endswith(';base64', 0, comma):
+        raise BadRequest("avatar_image must be a base64 encoded image data url")
+
+    encoded_length = len(data_url) - comma - 1
+    if encoded_length % 4 != 0:
+        raise BadRequest("avatar_image is not valid base64")
+    padding = data_url.count('=', max(comma + 1, len(data_url) - 2))
+    size = encoded_length // 4 * 3 - padding
+    if size > max_size:
+        raise RequestEntityTooLarge(f"avatar cannot be larger than {max_size} bytes")
+
+    body = bytearray(size)
+    offset = 0
+    try:
+        for start in range(comma + 1, len(data_url), DECODE_CHUNK_SIZE):
+            chunk = binascii.a2b_base64(data_url[start:start + DECODE_CHUNK_SIZE])
+            body[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+    except binascii.Error:
+        raise BadRequest("avatar_image is not valid base64")
+    # a2b_base64 skips characters outside the alphabet, so a short decode
+    # means the payload was not clean base64
+    if offset != size:
+        raise BadRequest("avatar_image is not valid base64")
+
+    return _to_avatar(bytes(body))
+
+
+def read_avatar_stream(stream: IO[bytes], max_size: int, content_length: Optional[int] = None) -> Avatar:
+    """
+    Read a raw (multipart file or request body) avatar upload in chunks,
+    rejecting it as soon as it grows past `max_size` instead of buffering it.
+    """
+    if content_length is not None and content_length > max_size:
+        raise RequestEntityTooLarge(f"avatar cannot be larger than {max_size} bytes")
+
+    body = bytearray()
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        body += chunk
+        if len(body) > max_size:
+            raise RequestEntityTooLarge(f"avatar cannot be larger than {max_size} bytes")
+
+    if len(body) == 0:
+        raise BadRequest("avatar is empty")
+
+    return _to_avatar(bytes(body))
+
+
+def check_avatar_upload_length(content_length: Optional[int], mimetype: str, max_size: int) -> None:
+    # reject an upload by its declared length, before a form is parsed and
+    # spooled (a raw body is only limited while it is read)
+    limit = max_size
+    if mimetype == 'multipart/form-data':
+        if content_length is None:
+            raise LengthRequired("a multipart avatar upload needs a content-length")
+        limit += MULTIPART_OVERHEAD
+    if content_length is not None and content_length > limit:
+        raise RequestEntityTooLarge(f"avatar cannot be larger than {max_size} bytes")
+
+
+def read_avatar_upload(request: Request, max_size: int) -> Avatar:
+    # accept the avatar either as the 'avatar' file of a multipart form or as
+    # the raw request body
+    check_avatar_upload_length(request.content_length, request.mimetype, max_size)
+    if request.mimetype == 'multipart/form-data':
+        if 'avatar' not in request.files:
+            raise BadRequest("missing 'avatar' file in multipart form")
+        return read_avatar_stream(request.files['avatar'].stream, max_size)
+    return read_avatar_stream(request.stream, max_size, request.content_length)
+
+
+def make_variants(avatar: Avatar, sizes: List[int]) -> dict[int, bytes]:
+    """
+    Resize the avatar into square webp images of the given sizes. Vector
+    images, unreadable images, or a missing pillow install yield no variants,
+    in which case clients fall back to the original avatar.
+    """
+    if Image is None or avatar.extension == 'svg' or len(sizes) == 0:
+        return {}
+
+    try:
+        image = Image.open(io.BytesIO(avatar.body))
+        # let the jpeg decoder downscale while decoding instead of after
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    except Exception as e:
+        logger.warning("unable to read avatar for variants: %s", e)
+        return {}
+
+    variants: dict[int, bytes] = {}
+    # resize from the largest size down so every step works on a smaller image
+    try:
+        for size in sorted(sizes, reverse=True):
+            image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format='WEBP', quality=80, method=4)
+            variants[size] = buffer.getvalue()
+    except Exception as e:
+        # keep the variants made so far, the upload still has to be recorded
+        logger.warning("unable to resize avatar for variants: %s", e)
+    return variants
@@ -0,0 +1,111 @@
+"""
+Compare decoding employee_view rows with the old trial-and-error parser
+(json.loads to test every column, json.loads again to parse it, strptime on
+every nested value) against the typed decoder in model.py, with and without
+orjson.
+
+    python -m benchmarks.decoder --rows 10000
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+import model
+
+
+def old_date_hook(json_dict):
+    for (key, value) in json_dict.items():
+        try:
+            json_dict[key] = datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+        except:
+            pass
+    return json_dict
+
+
+def old_is_valid_json_string(value):
+    if not isinstance(value, str):
+        return False
+    if '{' not in value or '}' not in value:
+        return False
+    try:
+        json.loads(value)
+    except ValueError:
+        return False
+    return True
+
+
+def old_parse_nested_json(value):
+    for item in value.items():
+        if old_is_valid_json_string(item[1]):
+            value[item[0]] = json.loads(item[1], object_hook=old_date_hook)
+    return value
+
+
+def make_rows(count: int) -> list:
+    # rows as pymysql returns them from employee_view, json columns are strings
+    stamp = '2021-12-01 10:20:30.000000'
+    rows = []
+    for i in range(count):
+        rows.append({
+            'employee_id': i + 1,
+            'salary': Decimal('4200.00'),
+            'role': 'engineer',
+            'start_at': date(2020, 1, 1),
+            'end_at': None,
+            'created_at': datetime(2021, 12, 1, 10, 20, 30),
+            'updated_at': datetime(2021, 12, 1, 10, 20, 30),
+            'user': json.dumps({
+                'user_id': i + 1, 'email': f"user{i}@example.com", 'username': f"user{i}",
+                'phone_number': '+6012-3456789', 'first_name': 'Jane', 'last_name': 'Doe',
+                'dob': '1990-01-01', 'gender': 'female', 'avatar_url': None, 'avatar_status': 'none',
+                'avatar_variants': None, 'created_at': stamp, 'updated_at': stamp,
+            }),
+            'department': json.dumps({
+                'department_id': 1, 'name': 'Engineering', 'description': None,
+                'created_at': stamp, 'updated_at': stamp,
+            }),
+            'address': json.dumps({
+                'address_id': i + 1, 'city': 'Kuala Lumpur', 'line1': '1 Jalan', 'line2': None,
+                'state': 'WP', 'country': 'Malaysia', 'postal_code': '50000',
+            }),
+        })
+    return rows
+
+
+def bench(decode, rows: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        # the old parser mutates rows in place, give every run fresh copies
+        batch = [dict(row) for row in rows]
+        start = time.perf_counter()
+        decode(batch)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    results = [('parse_nested_json', bench(lambda b: [old_parse_nested_json(r) for r in b], rows, args.repeat))]
+
+    loads = model._loads
+    if loads is not json.loads:
+        results.append(('typed (orjson)', bench(model.decode_employee_rows, rows, args.repeat)))
+    model._loads = json.loads
+    try:
+        results.append(('typed (json)', bench(model.decode_employee_rows, rows, args.repeat)))
+    finally:
+        model._loads = loads
+
+    print(f"{'decoder':<20} {f'{args.rows} rows (ms)':>18} {'speedup':>8}")
+    for name, elapsed in results:
+        print(f"{name:<20} {elapsed:>18.1f} {results[0][1] / elapsed:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare serial and pooled argon2 hashing throughput at a few parameter
+settings.
+
+    python -m benchmarks.hashing --count 64 --workers 4
+"""
+import argparse
+import os
+import time
+from hashing import PasswordHashingService
+
+# (time_cost, memory_cost in KiB, parallelism)
+PARAMETER_SETS = [
+    (1, 16384, 1),
+    (2, 65536, 2),
+    (3, 65536, 4),
+    (2, 102400, 8),
+]
+
+
+def bench(service: PasswordHashingService, passwords: list[str]) -> float:
+    # warm the pool up so process start-up is not measured
+    service.hash_many(passwords[:max(1, service.workers)])
+    start = time.perf_counter()
+    service.hash_many(passwords)
+    return len(passwords) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=64, help='passwords hashed per run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='pooled hashing workers')
+    args = parser.parse_args()
+
+    passwords = [f"password-{i}" for i in range(args.count)]
+
+    print(f"{'time_cost':>9} {'memory_kib':>10} {'parallelism':>11} {'serial/s':>10} {'pooled/s':>10} {'speedup':>8}")
+    for time_cost, memory_cost, parallelism in PARAMETER_SETS:
+        serial = PasswordHashingService(time_cost, memory_cost, parallelism, workers=0)
+        pooled = PasswordHashingService(time_cost, memory_cost, parallelism, workers=args.workers)
+        try:
+            serial_rate = bench(serial, passwords)
+            pooled_rate = bench(pooled, passwords)
+        finally:
+            pooled.close()
+        print(f"{time_cost:>9} {memory_cost:>10} {parallelism:>11} {serial_rate:>10.1f} {pooled_rate:>10.1f} {pooled_rate / serial_rate:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Load test the sync (gunicorn) and the async (uvicorn) app with the same
+requests, reporting the throughput and latency percentiles of each target at
+every concurrency level.
+
+    make prod                     # flask app on :5000
+    PORT=5002 make prod-async     # asgi app on :5002
+    python -m benchmarks.load --target sync=http://localhost:5000 --target async=http://localhost:5002 \\
+        --concurrency 10,100,500 --duration 20
+
+Every concurrent client keeps one connection open and cycles through the
+paths, so with concurrency above a server's threads the sync app queues the
+requests while the async app keeps them in flight on mysql.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+default_paths = ['/employees?limit=20', '/employees/search?q=an', '/employees/stats?group_by=department']
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, bool]:
+    # just enough http/1.1 to read the (never chunked) responses of the app
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', '0'))
+    if length > 0:
+        await reader.readexactly(length)
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+def make_request(host: str, method: str, path: str, body: Optional[bytes] = None) -> bytes:
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: gzip\r\n"
+    if body is None:
+        return f"{head}\r\n".encode()
+    return f"{head}Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+
+
+async def client(host: str, port: int, next_request: Callable[[], Optional[bytes]], deadline: float,
+                 latencies: list[float], errors: list[str]) -> None:
+    """
+    Send requests one after another on a kept-alive connection until the
+    deadline, or until `next_request` has none left (None).
+    """
+    writer: Optional[asyncio.StreamWriter] = None
+    while time.monotonic() < deadline:
+        request = next_request()
+        if request is None:
+            break
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, close = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(str(status))
+            if close:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+                writer = None
+    if writer is not None:
+        writer.close()
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    if len(sorted_values) == 0:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+async def drive(url: str, next_request: Callable[[], Optional[bytes]], concurrency: int, duration: float) -> dict[str, float]:
+    """
+    Run `concurrency` clients sharing `next_request` for `duration` seconds
+    and summarize their latencies.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies: list[float] = []
+    errors: list[str] = []
+    start = time.monotonic()
+    await asyncio.gather(*(
+        client(host, port, next_request, start + duration, latencies, errors) for _ in range(concurrency)))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='name=url of a running app, repeatable')
+    parser.add_argument('--path', action='append', help='path to request, repeatable (default: a page, a search and stats)')
+    parser.add_argument('--concurrency', default='10,100,500', help='comma separated numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per target and concurrency')
+    args = parser.parse_args()
+
+    targets = [target.split('=', 1) for target in args.target]
+    paths = args.path or default_paths
+
+    print(f"{'target':>8} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        for name, url in targets:
+            host = urlsplit(url).hostname
+            requests = itertools.cycle([make_request(host, 'GET', path) for path in paths])
+            r = asyncio.run(drive(url, lambda: next(requests), concurrency, args.duration))
+            print(f"{name:>8} {concurrency:>8} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.0f} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Seed the benchmark database with a reproducible data set: the same
+`--employees` and `--seed` always produce the same rows, so baselines taken
+on different commits measure the same data. Every existing employee is
+removed first.
+
+    python -m benchmarks.seed --employees 100000
+
+Employee i has the username `bench{i:07d}`, which is how the benchmark suite
+(benchmarks/suite.py) addresses them. All of them share one precomputed
+password hash, as the benchmarks never log in.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from boto3 import client
+from pymysql import Connection
+from argon2 import PasswordHasher
+from config import Config
+from db import create_pool
+from document import backfill_if_enabled, init_employee_documents
+from query import insert_department_sql
+from seed_db import insert_employees
+
+# rows per multi-row insert (and transaction)
+CHUNK_SIZE = 2000
+
+DEPARTMENTS = 20
+ROLES = ('manager', 'admin', 'cashier', 'runner', 'engineer')
+FIRST_NAMES = ('Aisyah', 'Wei', 'Arjun', 'Nurul', 'Jia', 'Daniel', 'Siti', 'Kumar', 'Mei', 'Hafiz', 'Li', 'Priya')
+LAST_NAMES = ('Tan', 'Lim', 'Lee', 'Wong', 'Abdullah', 'Rahman', 'Singh', 'Ng', 'Chong', 'Ismail', 'Raj', 'Goh')
+CITIES = ('Kuala Lumpur', 'Penang', 'Johor Bahru', 'Ipoh', 'Kuching', 'Kota Kinabalu', 'Melaka', 'Shah Alam')
+
+
+def bench_username(i: int) -> str:
+    return f"bench{i:07d}"
+
+
+def department_name(i: int) -> str:
+    return f"bench-department-{i:02d}"
+
+
+def _clean(db_conn: Connection) -> None:
+    cursor = db_conn.cursor()
+    try:
+        # truncating restarts the ids, so employee i is employee_id i + 1
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in ('employee_document', 'employee', 'user', 'address', 'department'):
+            cursor.execute(f"TRUNCATE TABLE {table}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    finally:
+        cursor.close()
+
+
+def _seed_departments(db_conn: Connection) -> list[int]:
+    cursor = db_conn.cursor()
+    try:
+        cursor.executemany(insert_department_sql, [
+            (department_name(i), f"benchmark department {i}") for i in range(DEPARTMENTS)])
+        cursor.execute("SELECT department_id FROM department ORDER BY department_id")
+        return [row['department_id'] for row in cursor.fetchall()]
+    finally:
+        db_conn.commit()
+        cursor.close()
+
+
+def _seed_chunk(db_conn: Connection, rng: random.Random, first: int, count: int, password_hash: str, department_ids: list[int]) -> None:
+    employees = [{
+        'address': (rng.choice(CITIES), f"{rng.randint(1, 200)} Jalan {rng.choice(LAST_NAMES)}", None,
+                    'Selangor', 'Malaysia', f"{rng.randint(10000, 99999)}"),
+        'email': f"{bench_username(i)}@bench.test",
+        'username': bench_username(i),
+        'phone_number': f"+6012-{rng.randint(1000000, 9999999)}",
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': rng.choice(LAST_NAMES),
+        'dob': date(1960, 1, 1) + timedelta(days=rng.randint(0, 15000)),
+        'gender': rng.choice(('male', 'female')),
+        'avatar_url': None,
+        'salary': rng.randint(2000, 20000),
+        'role': rng.choice(ROLES),
+        'start_at': date(2000, 1, 1) + timedelta(days=rng.randint(0, 7000)),
+        'end_at': None,
+        'department': rng.randrange(len(department_ids)),
+    } for i in range(first, first + count)]
+    cursor = db_conn.cursor()
+    try:
+        insert_employees(cursor, employees, [password_hash] * count, department_ids)
+    finally:
+        db_conn.commit()
+        cursor.close()
+
+
+def create_bucket(config: Config) -> None:
+    # the avatar bucket of the s3 stand-in (moto) starts out missing
+    s3 = client('s3', endpoint_url=config.s3_endpoint_url or None, region_name=config.s3_region)
+    if config.s3_bucket_id not in [bucket['Name'] for bucket in s3.list_buckets()['Buckets']]:
+        s3.create_bucket(Bucket=config.s3_bucket_id)
+
+
+def seed(db_conn: Connection, employees: int, seed: int) -> None:
+    rng = random.Random(seed)
+    password_hash = PasswordHasher().hash('benchmark')
+
+    _clean(db_conn)
+    department_ids = _seed_departments(db_conn)
+
+    start = time.perf_counter()
+    for first in range(0, employees, CHUNK_SIZE):
+        _seed_chunk(db_conn, rng, first, min(CHUNK_SIZE, employees - first), password_hash, department_ids)
+        done = min(first + CHUNK_SIZE, employees)
+        print(f"\rseed {done}/{employees} employees ({done / (time.perf_counter() - start):.0f} rows/s)", end='', flush=True)
+    print()
+
+    documents = backfill_if_enabled(db_conn)
+    if documents is not None:
+        print(f"seed `employee_document` with {documents} documents")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42, help='seed of the generated data')
+    args = parser.parse_args()
+
+    config = Config()
+    init_employee_documents(config)
+    create_bucket(config)
+
+    pool = create_pool(config)
+    try:
+        with pool.connection() as db_conn:
+            seed(db_conn, args.employees, args.seed)
+    finally:
+        pool.close()
@@ -0,0 +1,55 @@
+"""
+Measure the throughput of encoding /employees list responses with each json
+provider, and what compressing the encoded body costs and saves.
+
+    python -m benchmarks.serializer --sizes 10,100,1000
+"""
+import argparse
+import gzip
+import time
+from flask import Flask
+from benchmarks.decoder import make_rows
+from model import decode_employee_rows
+from serializer import FlaskJSONProvider, OrjsonProvider, brotli, orjson
+
+
+def bench(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10,100,1000', help='comma separated page sizes')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    providers = [FlaskJSONProvider()]
+    if orjson is not None:
+        providers.append(OrjsonProvider())
+
+    compressors = [('gzip', lambda body: gzip.compress(body, compresslevel=6))]
+    if brotli is not None:
+        compressors.append(('br', lambda body: brotli.compress(body, quality=4)))
+
+    # flask's encoder needs an app context
+    with Flask(__name__).app_context():
+        print(f"{'rows':>6} {'encoder':<8} {'bytes':>10} {'ms':>9} {'MB/s':>9}")
+        for size in [int(s) for s in args.sizes.split(',')]:
+            page = {'data': decode_employee_rows(make_rows(size)), 'next_cursor': None, 'has_more': False}
+            for provider in providers:
+                body = provider.dumps(page)
+                elapsed = bench(lambda: provider.dumps(page), args.repeat)
+                print(f"{size:>6} {provider.name:<8} {len(body):>10} {elapsed * 1000:>9.2f} {len(body) / elapsed / 1e6:>9.1f}")
+            for name, compress in compressors:
+                compressed = compress(body)
+                elapsed = bench(lambda: compress(body), args.repeat)
+                print(f"{size:>6} {name:<8} {len(compressed):>10} {elapsed * 1000:>9.2f} {len(body) / elapsed / 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Drive the employee routes of a running app at fixed concurrency levels and
+write the throughput and latency percentiles of every scenario to a json
+baseline, optionally comparing them with an earlier one.
+
+    make bench-up bench-seed                   # mysql and moto s3 in docker, seeded
+    make bench-run                             # serves the app and writes bench_baseline.json
+    python -m benchmarks.suite --url http://localhost:5000 --employees 10000 \\
+        --output after.json --compare bench_baseline.json
+
+The read scenarios pick seeded employees (see benchmarks/seed.py) at random
+with a fixed seed. The write scenarios create their own employees, update
+and then delete them, leaving the seeded data as it was.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import urllib.request
+from typing import Any, Callable, Optional
+from urllib.parse import urlsplit
+from benchmarks.load import drive, make_request
+from benchmarks.seed import bench_username, department_name
+from helper import encode_cursor
+
+scenarios = ['get_employee', 'list_employees', 'create_employee', 'update_employee', 'delete_employee']
+
+
+def _create_body(username: str) -> bytes:
+    return json.dumps({
+        'email': f"{username}@bench.test",
+        'username': username,
+        'password': 'benchmark',
+        'phone_number': '+6012-3456789',
+        'first_name': 'Bench',
+        'last_name': 'Mark',
+        'gender': 'female',
+        'dob': '1990-01-01',
+        'salary': 5000,
+        'role': 'engineer',
+        'start_at': '2020-01-01',
+        'department': department_name(0),
+        'address': {'city': 'Penang', 'line1': '1 Jalan Bench', 'state': 'Penang', 'country': 'Malaysia', 'postal_code': '10000'},
+    }).encode()
+
+
+def _scenario_requests(scenario: str, host: str, employees: int, rng: random.Random, created: list[str], run_id: str) -> Callable[[], Optional[bytes]]:
+    """
+    The request generator of a scenario, shared by all its clients. The
+    employees created by one run are updated and deleted by the next
+    scenarios of that run.
+    """
+    if scenario == 'get_employee':
+        return lambda: make_request(host, 'GET', f"/employee/{bench_username(rng.randrange(employees))}")
+    if scenario == 'list_employees':
+        # pages starting after a random seeded employee
+        return lambda: make_request(host, 'GET', f"/employees?limit=20&cursor={encode_cursor(rng.randrange(employees))}")
+    if scenario == 'create_employee':
+        counter = itertools.count()
+
+        def create() -> bytes:
+            username = f"bc{run_id}{next(counter)}"
+            created.append(username)
+            return make_request(host, 'POST', '/employee', _create_body(username))
+        return create
+    if scenario == 'update_employee':
+        usernames = itertools.cycle(list(created))
+
+        def update() -> Optional[bytes]:
+            if len(created) == 0:
+                return None
+            body = json.dumps({'salary': rng.randint(2000, 20000), 'role': 'lead'}).encode()
+            return make_request(host, 'PUT', f"/employee/{next(usernames)}", body)
+        return update
+    if scenario == 'delete_employee':
+        # every created employee is deleted once, even past the duration
+        return lambda: make_request(host, 'DELETE', f"/employee/{created.pop()}") if len(created) > 0 else None
+    raise ValueError(f"unknown scenario '{scenario}'")
+
+
+def run_suite(url: str, employees: int, concurrency: list[int], duration: float, seed: int) -> dict[str, dict[str, Any]]:
+    host = urlsplit(url).hostname
+    rng = random.Random(seed)
+    results: dict[str, dict[str, Any]] = {scenario: {} for scenario in scenarios}
+    for level in concurrency:
+        created: list[str] = []
+        run_id = f"{os.getpid() % 1000:03d}{level}{int(time.time()) % 100000}"
+        for scenario in scenarios:
+            # deletes run until every created employee is gone
+            scenario_duration = duration if scenario != 'delete_employee' else duration * 10
+            r = asyncio.run(drive(url, _scenario_requests(scenario, host, employees, rng, created, run_id), level, scenario_duration))
+            results[scenario][str(level)] = r
+            print(f"{scenario:>16} {level:>8} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.0f} "
+                  f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any]) -> None:
+    print(f"\ncompared with {baseline['meta'].get('commit')}:")
+    print(f"{'scenario':>16} {'clients':>8} {'req/s':>9} {'p50':>8} {'p99':>8}")
+    for scenario, levels in current['results'].items():
+        for level, r in levels.items():
+            before = baseline['results'].get(scenario, {}).get(level)
+            if before is None:
+                continue
+
+            def change(key: str) -> str:
+                return f"{(r[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else 'n/a'
+            print(f"{scenario:>16} {level:>8} {change('rps'):>9} {change('p50_ms'):>8} {change('p99_ms'):>8}")
+
+
+def _serve(server: str, port: int) -> subprocess.Popen:
+    # serve the app from this tree, with the environment of this process
+    config = 'gunicorn.conf.py' if server == 'sync' else 'gunicorn_asgi.conf.py'
+    process = subprocess.Popen(['gunicorn', '-c', config, '--bind', f"127.0.0.1:{port}"],
+                               env={**os.environ, 'APP_ENV': 'production'}, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1)
+            return process
+        except Exception:
+            time.sleep(0.5)
+    process.terminate()
+    raise Exception(f"the {server} app did not become ready on port {port}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='url of a running app, unless --serve starts one')
+    parser.add_argument('--serve', choices=['sync', 'async'], help='start the sync or async app under gunicorn for the run')
+    parser.add_argument('--port', type=int, default=5090, help='port of the app started by --serve')
+    parser.add_argument('--employees', type=int, default=10000, help='number of seeded employees')
+    parser.add_argument('--concurrency', default='1,10,50', help='comma separated numbers of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario and concurrency')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the picked employees')
+    parser.add_argument('--output', default='bench_baseline.json')
+    parser.add_argument('--compare', help='an earlier baseline to compare with')
+    args = parser.parse_args()
+
+    if (args.url is None) == (args.serve is None):
+        parser.error('give exactly one of --url and --serve')
+
+    process = _serve(args.serve, args.port) if args.serve is not None else None
+    url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        print(f"{'scenario':>16} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        results = run_suite(url, args.employees, [int(c) for c in args.concurrency.split(',')], args.duration, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    current = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'server': args.serve or url,
+            'employees': args.employees,
+            'duration': args.duration,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2, sort_keys=True)
+    print(f"\nwrote {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), current)
+
+
+if __name__ == '__main__':
+    main()
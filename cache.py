@@ -0,0 +1,162 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+from config import Config
+from query import employee_stats_groups
+
+
+class CacheBackend:
+    """A store of python objects, serialized by the backend if it keeps them out of process."""
+
+    evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """An in-process LRU cache with a ttl, local to the worker."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class RedisBackend(CacheBackend):
+    """Pickled values in redis, shared by every worker (evictions are not counted)."""
+
+    def __init__(self, url: str) -> None:
+        try:
+            import redis
+        except ImportError:
+            raise Exception(
+                "CACHE_BACKEND is 'redis' but the 'redis' package is not installed")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._client.get(key)
+        return None if value is None else pickle.loads(value)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [None if value is None else pickle.loads(value) for value in self._client.mget(keys)]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._client.set(key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+
+class EmployeeCache:
+    """Read-through cache of employees by username and of the analytics, invalidated by the writes."""
+
+    def __init__(self, backend: CacheBackend, ttl: float, analytics_ttl: float) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.analytics_ttl = analytics_ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(username: str) -> str:
+        # usernames compare case-insensitively in mysql
+        return f"employee:{username.casefold()}"
+
+    @staticmethod
+    def _version_key(username: str) -> str:
+        return f"employee_version:{username.casefold()}"
+
+    @staticmethod
+    def _analytics_key(group_by: str) -> str:
+        return f"employee_stats:{group_by}"
+
+    def get(self, username: str) -> Tuple[Optional[Any], Optional[str]]:
+        # a read-through `set` is given the version read here, so a read
+        # racing a write cannot put back what the write invalidated
+        entry, version = self.backend.get_many([self._key(username), self._version_key(username)])
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None, version
+        self.hits += 1
+        return entry[1], version
+
+    def set(self, username: str, employee: Any, version: Optional[str]) -> None:
+        # a lookup mysql matched through its collation (say without accents)
+        # is not cached, the writes of the employee invalidate its own username
+        if self._key(employee.user.username) != self._key(username):
+            return
+        self.backend.set(self._key(username), (version, employee), self.ttl)
+
+    def get_analytics(self, group_by: str) -> Optional[Any]:
+        return self.backend.get(self._analytics_key(group_by))
+
+    def set_analytics(self, group_by: str, value: Any) -> None:
+        if self.analytics_ttl > 0:
+            self.backend.set(self._analytics_key(group_by), value, self.analytics_ttl)
+
+    def invalidate(self, *usernames: Optional[str]) -> None:
+        for username in {u.casefold() for u in usernames if u is not None}:
+            # the version outlives every document cached with the previous one
+            self.backend.set(self._version_key(username), uuid.uuid4().hex, 2 * self.ttl)
+            self.backend.delete(self._key(username))
+            self.invalidations += 1
+        for group_by in employee_stats_groups:
+            self.backend.delete(self._analytics_key(group_by))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+def create_cache(config: Config) -> Optional[EmployeeCache]:
+    if config.cache_backend == 'none':
+        return None
+    if config.cache_backend == 'redis':
+        return EmployeeCache(RedisBackend(config.redis_url), config.cache_ttl, config.analytics_cache_ttl)
+    if config.cache_backend == 'memory':
+        return EmployeeCache(MemoryBackend(config.cache_max_size), config.cache_ttl, config.analytics_cache_ttl)
+    raise Exception(f"unknown CACHE_BACKEND '{config.cache_backend}'")
@@ -13,6 +13,14 @@ def _get_env(key: str) -> str:
     return var
 
 
+def _get_env_or_default(key: str, default: str) -> str:
+    """
+    Get the environment variable from the given key, falling back to the
+    given default if it is not set.
+    """
+    return os.getenv(key, default)
+
+
 class Config:
     """
     This is the config class where it will load the environment variables when
@@ -28,5 +36,32 @@ class Config:
         self.database_user = _get_env('DATABASE_USER')
         self.database_password = _get_env('DATABASE_PASSWORD')
         self.database_db = _get_env('DATABASE_DB')
+        self.database_port = int(_get_env_or_default('DATABASE_PORT', '3306'))
+        self.database_pool_min_size = int(_get_env_or_default('DATABASE_POOL_MIN_SIZE', '2'))
+        self.database_pool_max_size = int(_get_env_or_default('DATABASE_POOL_MAX_SIZE', '10'))
+        self.database_pool_timeout = float(_get_env_or_default('DATABASE_POOL_TIMEOUT', '5'))
+        self.database_pool_ping_interval = float(_get_env_or_default('DATABASE_POOL_PING_INTERVAL', '30'))
+        self.async_database_pool_max_size = int(_get_env_or_default('ASYNC_DATABASE_POOL_MAX_SIZE', '50'))
+        self.cache_backend = _get_env_or_default('CACHE_BACKEND', 'memory')
+        self.cache_max_size = int(_get_env_or_default('CACHE_MAX_SIZE', '1024'))
+        self.cache_ttl = float(_get_env_or_default('CACHE_TTL', '60'))
+        self.analytics_cache_ttl = float(_get_env_or_default('ANALYTICS_CACHE_TTL', '10'))
+        self.redis_url = _get_env_or_default('REDIS_URL', 'redis://localhost:6379/0')
+        self.argon2_time_cost = int(_get_env_or_default('ARGON2_TIME_COST', '3'))
+        self.argon2_memory_cost = int(_get_env_or_default('ARGON2_MEMORY_COST', '65536'))
+        self.argon2_parallelism = int(_get_env_or_default('ARGON2_PARALLELISM', '4'))
+        self.password_hash_workers = int(_get_env_or_default('PASSWORD_HASH_WORKERS', '2'))
         self.s3_bucket_id = _get_env('S3_BUCKET_ID')
         self.s3_region = _get_env('S3_BUCKET_REGION')
+        self.s3_endpoint_url = _get_env_or_default('S3_ENDPOINT_URL', '')
+        self.s3_upload_workers = int(_get_env_or_default('S3_UPLOAD_WORKERS', '4'))
+        self.s3_upload_max_attempts = int(_get_env_or_default('S3_UPLOAD_MAX_ATTEMPTS', '3'))
+        self.avatar_variant_sizes = [int(size) for size in _get_env_or_default('AVATAR_VARIANT_SIZES', '64,128,256').split(',') if size]
+        self.avatar_max_size = int(_get_env_or_default('AVATAR_MAX_SIZE', str(5 * 1024 * 1024)))
+        self.json_provider = _get_env_or_default('JSON_PROVIDER', 'orjson')
+        self.compress_min_size = int(_get_env_or_default('COMPRESS_MIN_SIZE', str(16 * 1024)))
+        self.compress_gzip_level = int(_get_env_or_default('COMPRESS_GZIP_LEVEL', '6'))
+        self.compress_brotli_quality = int(_get_env_or_default('COMPRESS_BROTLI_QUALITY', '4'))
+        self.employee_documents = _get_env_or_default('EMPLOYEE_DOCUMENTS', 'false') == 'true'
+        self.search_timeout_ms = int(_get_env_or_default('SEARCH_TIMEOUT_MS', '500'))
+        self.metrics = _get_env_or_default('METRICS', 'false') == 'true'
@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Iterator, Optional, Tuple
+from contextlib import contextmanager
+from functools import lru_cache
+from flask import Flask, current_app, g
+from pymysql import Connection, cursors
+from pymysql.constants import CLIENT
+from werkzeug.exceptions import ServiceUnavailable
+import pymysql
+from config import Config
+from metrics import get_metrics, instrumented_async_cursor, instrumented_cursor
+
+try:
+    import aiomysql
+except ImportError:
+    # only the asgi app (asgi.py) uses the async driver
+    aiomysql = None
+
+
+class DatabaseUnavailable(Exception):
+    """
+    Raised when the pool cannot hand out a working connection, answered
+    with a 503 like a failed readiness check.
+    """
+
+
+class PoolTimeout(DatabaseUnavailable):
+    """
+    Raised when no connection could be checked out of the pool before the
+    checkout timeout expired.
+    """
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of pymysql connections. It keeps at least `min_size`
+    connections open, never opens more than `max_size`, and pings connections
+    that have been idle for longer than `ping_interval` seconds before handing
+    them out so that connections dropped by the server are reconnected instead
+    of failing the request.
+    """
+
+    def __init__(self, min_size: int, max_size: int, timeout: float, ping_interval: float, **connect_kwargs: Any) -> None:
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(
+                f"invalid pool size (min_size={min_size}, max_size={max_size})")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        self._idle: Deque[Tuple[Connection, float]] = deque()
+        self._size = 0
+        self._closed = False
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self) -> Connection:
+        return pymysql.connect(**self._connect_kwargs)
+
+    def _discard(self, conn: Optional[Connection]) -> None:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def acquire(self, timeout: Optional[float] = None) -> Connection:
+        """
+        Check a connection out of the pool, blocking for at most `timeout`
+        seconds (the pool's timeout by default). Raises `PoolTimeout` if none
+        becomes available in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn: Optional[Connection] = None
+        last_used = 0.0
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise Exception("connection pool is closed")
+                if len(self._idle) > 0:
+                    # most recently used first, so idle ones age out on the server
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"unable to acquire a database connection within {timeout}s")
+                self._cond.wait(remaining)
+
+        metrics = get_metrics()
+        if metrics.enabled:
+            metrics.observe_pool_wait(time.monotonic() - start)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - last_used > self.ping_interval:
+                conn.ping(reconnect=True)
+        except pymysql.err.OperationalError as e:
+            # the server is down or unreachable
+            self._discard(conn)
+            raise DatabaseUnavailable(f"unable to connect to the database: {e}") from e
+        except Exception as e:
+            self._discard(conn)
+            raise e
+
+        return conn
+
+    def release(self, conn: Connection) -> None:
+        """
+        Return a connection to the pool. Any transaction left open is rolled
+        back so the next borrower starts from a clean snapshot.
+        """
+        if self._closed or not conn.open:
+            self._discard(conn)
+            return
+
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Connection]:
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict[str, int]:
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+
+# one instrumented subclass per cursor class, not one per cursor
+_instrumented_cursor = lru_cache(maxsize=None)(instrumented_cursor)
+
+
+def cursor_class(base: type = cursors.DictCursor) -> type:
+    """
+    The class of the cursors opened on a pooled connection, or of a `base`
+    a handler opens explicitly (like the unbuffered cursor of the export).
+    With metrics enabled every statement is timed by its cursor.
+    """
+    return _instrumented_cursor(base) if get_metrics().enabled else base
+
+
+def create_pool(config: Config) -> ConnectionPool:
+    return ConnectionPool(
+        min_size=config.database_pool_min_size,
+        max_size=config.database_pool_max_size,
+        timeout=config.database_pool_timeout,
+        ping_interval=config.database_pool_ping_interval,
+        host=config.database_host,
+        port=config.database_port,
+        user=config.database_user,
+        password=config.database_password,
+        db=config.database_db,
+        charset='utf8mb4',
+        cursorclass=cursor_class(),
+        # report matched rather than changed rows, so an UPDATE that sets the
+        # same values still tells whether the row exists
+        client_flag=CLIENT.FOUND_ROWS
+    )
+
+
+async def create_async_pool(config: Config) -> Any:
+    """
+    Create the aiomysql pool of the asgi app. It only serves reads, so its
+    connections run in autocommit mode, every statement reading a fresh
+    snapshot, and aiomysql never finds one returned in a transaction (which
+    it would close instead of pooling).
+    """
+    if aiomysql is None:
+        raise Exception("the asgi app requires aiomysql, install it with `pip install -r requirements-async.txt`")
+    return await aiomysql.create_pool(
+        minsize=config.database_pool_min_size,
+        maxsize=config.async_database_pool_max_size,
+        host=config.database_host,
+        port=config.database_port,
+        user=config.database_user,
+        password=config.database_password,
+        db=config.database_db,
+        charset='utf8mb4',
+        cursorclass=instrumented_async_cursor(aiomysql.DictCursor) if get_metrics().enabled else aiomysql.DictCursor,
+        client_flag=CLIENT.FOUND_ROWS,
+        autocommit=True
+    )
+
+
+def init_app(app: Flask, pool: ConnectionPool) -> None:
+    """
+    Register the pool on the app and return the request's connection (if one
+    was checked out) when the app context is torn down.
+    """
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(_release_db_conn)
+
+
+def get_db_conn() -> Connection:
+    """
+    Get the connection for the current request, checking one out of the pool
+    on first use. The same connection is reused for the rest of the request.
+    """
+    if 'db_conn' not in g:
+        try:
+            g.db_conn = current_app.extensions['db_pool'].acquire()
+        except DatabaseUnavailable as e:
+            raise ServiceUnavailable(str(e))
+    return g.db_conn
+
+
+def _release_db_conn(_: Optional[BaseException]) -> None:
+    db_conn = g.pop('db_conn', None)
+    if db_conn is not None:
+        current_app.extensions['db_pool'].release(db_conn)
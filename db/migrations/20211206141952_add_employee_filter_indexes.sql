@@ -0,0 +1,10 @@
+-- migrate:up
+ALTER TABLE employee
+    MODIFY role VARCHAR(255) NOT NULL,
+    ADD INDEX employee_role_idx (role),
+    ADD INDEX employee_end_at_idx (end_at);
+-- migrate:down
+ALTER TABLE employee
+    DROP INDEX employee_end_at_idx,
+    DROP INDEX employee_role_idx,
+    MODIFY role TEXT NOT NULL;
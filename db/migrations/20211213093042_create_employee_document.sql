@@ -0,0 +1,23 @@
+-- migrate:up
+CREATE TABLE employee_document (
+    employee_id BIGINT NOT NULL,
+    salary DECIMAL(10, 2) NOT NULL,
+    role VARCHAR(255) NOT NULL,
+    start_at DATE NOT NULL,
+    end_at DATE,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    user JSON NOT NULL,
+    department JSON NOT NULL,
+    address JSON NOT NULL,
+    lookup_username VARCHAR(255) NOT NULL UNIQUE,
+    lookup_email VARCHAR(255) NOT NULL UNIQUE,
+    lookup_department_id BIGINT,
+    PRIMARY KEY (employee_id),
+    INDEX employee_document_role_idx (role),
+    INDEX employee_document_end_at_idx (end_at),
+    INDEX employee_document_department_id_idx (lookup_department_id),
+    FOREIGN KEY (employee_id) REFERENCES employee(employee_id) ON DELETE CASCADE
+);
+-- migrate:down
+DROP TABLE employee_document;
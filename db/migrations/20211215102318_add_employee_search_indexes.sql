@@ -0,0 +1,16 @@
+-- migrate:up
+ALTER TABLE user
+    MODIFY first_name VARCHAR(255) NOT NULL,
+    MODIFY last_name VARCHAR(255) NOT NULL,
+    ADD INDEX user_first_name_idx (first_name),
+    ADD INDEX user_last_name_idx (last_name);
+ALTER TABLE user
+    ADD FULLTEXT INDEX user_search_ft_idx (first_name, last_name, username, email);
+-- migrate:down
+ALTER TABLE user
+    DROP INDEX user_search_ft_idx;
+ALTER TABLE user
+    DROP INDEX user_last_name_idx,
+    DROP INDEX user_first_name_idx,
+    MODIFY first_name TEXT NOT NULL,
+    MODIFY last_name TEXT NOT NULL;
@@ -47,5 +47,5 @@ aws s3 cp s3://marcuslee-aws-live-env/client.env.local web/.env.local
 cd web && pnpm i && pnpm build
 
 # run prod server
-cd .. && pipenv run python app.py
+cd .. && APP_ENV=production pipenv run gunicorn -c gunicorn.conf.py
 
@@ -0,0 +1,109 @@
+import argparse
+import time
+from typing import Iterable, Optional
+from pymysql import Connection
+from pymysql.cursors import DictCursor
+from config import Config
+from query import build_refresh_employee_documents_sql, count_employee_documents_sql, delete_orphan_employee_documents_sql, employee_document_source, employee_view_source, refresh_employee_document_range_sql, select_employee_id_range_sql
+
+# number of employees re-rendered per statement (and transaction) of a backfill
+BACKFILL_BATCH_SIZE = 1000
+
+
+class EmployeeDocuments:
+    """
+    The materialized employee read model. When enabled, every write to an
+    employee re-renders its document into the `employee_document` table in
+    the same transaction, and reads select the stored documents instead of
+    joining through the view. When disabled, reads go through the view and
+    writes leave the table alone, so it has to be backfilled before it is
+    enabled again.
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+    @property
+    def source(self) -> str:
+        return employee_document_source if self.enabled else employee_view_source
+
+    def refresh(self, cursor: DictCursor, key: str, values: Iterable) -> None:
+        """
+        Re-render the documents of the employees with the given employee_ids
+        or usernames (`key`), on the cursor of the transaction writing them.
+        """
+        values = [v for v in values if v is not None]
+        if not self.enabled or len(values) == 0:
+            return
+        cursor.execute(build_refresh_employee_documents_sql(key, len(values)), tuple(values))
+
+
+def backfill(db_conn: Connection, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Render the document of every employee in batches of employee_ids,
+    committing after each batch, then delete documents whose employee no
+    longer has one. Returns the number of documents stored.
+    """
+    cursor: DictCursor = db_conn.cursor(DictCursor)
+
+    try:
+        cursor.execute(select_employee_id_range_sql)
+        ids = cursor.fetchone()
+        if ids is not None and ids['min_id'] is not None:
+            for start in range(ids['min_id'], ids['max_id'] + 1, batch_size):
+                cursor.execute(refresh_employee_document_range_sql, (start, start + batch_size - 1))
+                db_conn.commit()
+        cursor.execute(delete_orphan_employee_documents_sql)
+        db_conn.commit()
+        cursor.execute(count_employee_documents_sql)
+        count = cursor.fetchone()['count']
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+    finally:
+        cursor.close()
+
+    return count
+
+
+_documents: Optional[EmployeeDocuments] = None
+
+
+def init_employee_documents(config: Config) -> EmployeeDocuments:
+    global _documents
+    _documents = EmployeeDocuments(config.employee_documents)
+    return _documents
+
+
+def get_employee_documents() -> EmployeeDocuments:
+    """
+    Get the read model set up by `init_employee_documents`, falling back to
+    reading through the view.
+    """
+    global _documents
+    if _documents is None:
+        _documents = EmployeeDocuments(False)
+    return _documents
+
+
+def backfill_if_enabled(db_conn: Connection) -> Optional[int]:
+    # rows inserted without the handlers (the seeders) have no documents yet
+    if not get_employee_documents().enabled:
+        return None
+    return backfill(db_conn)
+
+
+if __name__ == '__main__':
+    from db import create_pool
+
+    parser = argparse.ArgumentParser(description="Backfill the employee_document table from employee_view.")
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    config = Config()
+    pool = create_pool(config)
+    start = time.perf_counter()
+    with pool.connection() as db_conn:
+        count = backfill(db_conn, args.batch_size)
+    pool.close()
+    print(f"backfill `employee_document` with {count} documents in {time.perf_counter() - start:.1f}s - SUCCESS ✅")
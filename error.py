@@ -1,7 +1,5 @@
-from flask import Blueprint, jsonify
-from flask.helpers import make_response
-from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
-from jsonschema import ValidationError
+from flask import Blueprint
+from werkzeug.exceptions import BadRequest, InternalServerError, NotFound, PreconditionFailed, RequestEntityTooLarge, ServiceUnavailable
 
 blueprint = Blueprint('error_handlers', __name__)
 
@@ -16,14 +14,29 @@ def internal_server_error(e: InternalServerError):
     return ({"error": e.description}, e.code, e.response)
 
 
+@blueprint.app_errorhandler(ServiceUnavailable)
+def service_unavailable(e: ServiceUnavailable):
+    return ({"error": e.description}, e.code, e.response)
+
+
+@blueprint.app_errorhandler(RequestEntityTooLarge)
+def request_entity_too_large(e: RequestEntityTooLarge):
+    return ({"error": e.description}, e.code, e.response)
+
+
 @blueprint.app_errorhandler(BadRequest)
 def bad_request(e: BadRequest):
-    if isinstance(e.description, ValidationError):
-        original_error = e.description
-        return make_response(jsonify({"error": original_error.message}), 400)
+    return ({"error": e.description}, e.code, e.response)
+
+
+@blueprint.app_errorhandler(PreconditionFailed)
+def precondition_failed(e: PreconditionFailed):
     return ({"error": e.description}, e.code, e.response)
 
 
 blueprint.register_error_handler(NotFound, resource_not_found)
 blueprint.register_error_handler(InternalServerError, internal_server_error)
+blueprint.register_error_handler(ServiceUnavailable, service_unavailable)
+blueprint.register_error_handler(RequestEntityTooLarge, request_entity_too_large)
 blueprint.register_error_handler(BadRequest, bad_request)
+blueprint.register_error_handler(PreconditionFailed, precondition_failed)
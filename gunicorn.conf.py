@@ -0,0 +1,59 @@
+"""
+Production server config, run with `gunicorn -c gunicorn.conf.py`. Every
+setting can be overridden through the environment variables read below.
+
+The app is imported once in the master and forked into the workers, and each
+worker then starts its own connection pool, hashing processes and upload
+threads, none of which survive a fork.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app(start=False)'
+preload_app = True
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# requests mostly wait on mysql and s3, so every process serves several of
+# them on threads. keep DATABASE_POOL_MAX_SIZE >= threads so a thread never
+# waits on the pool
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# every worker starts its own password hashing processes (see hashing.py), so
+# unless PASSWORD_HASH_WORKERS is set the cores are shared out between the
+# workers. with more workers than cores that is 0, hashing on the request
+# threads, which argon2 does without holding the GIL
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(multiprocessing.cpu_count() // workers))
+
+# restart workers now and then (with jitter, so not all at once) to bound
+# the effect of any slow leak
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+# on SIGTERM workers stop accepting connections and get this long to finish
+# the requests in flight before they are killed
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# keep connections from the load balancer open between requests
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app import start_app
+    start_app(worker.app.wsgi())
+
+
+def worker_exit(server, worker):
+    # drain the avatar uploads and close the pools once requests have finished
+    from app import stop_app
+    stop_app(worker.app.wsgi())
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
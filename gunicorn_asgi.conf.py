@@ -0,0 +1,36 @@
+"""
+Server config of the asgi app (asgi.py), run with
+`gunicorn -c gunicorn_asgi.conf.py`. Gunicorn only manages the processes, each
+worker runs the app on uvicorn's event loop and starts its pools when the app
+starts serving (asgi lifespan), so nothing is preloaded in the master.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'asgi:create_asgi_app()'
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# one event loop per core holds the requests waiting on mysql, so there is no
+# need for the extra processes and threads of the sync app
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+
+# the writes hash passwords in processes started by every worker (see
+# hashing.py), share the cores out between the workers
+os.environ.setdefault('PASSWORD_HASH_WORKERS', str(multiprocessing.cpu_count() // workers))
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = '-'
+errorlog = '-'
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -1,28 +1,126 @@
-from typing import Any, Optional
-from boto3 import resource, client
-from base64 import b64decode
-from flask import jsonify
+import csv
+import io
+from datetime import datetime
+from typing import Any, Iterator, Optional, Union
+from flask import stream_with_context
 from flask.wrappers import Response
-from pymysql import Connection
-from pymysql.cursors import DictCursor
-from werkzeug.datastructures import MultiDict
-from werkzeug.exceptions import InternalServerError, NotFound
-from query import select_employee_view, select_employee_view_with_limit, select_employee_view_with_cursor_and_limit, select_employee_view_by_username_sql, delete_address_by_id_sql, delete_user_by_username_sql, insert_address_sql, insert_user_sql, insert_employee_sql, build_employee_view_update_query
-from helper import parse_cursor_pagination, parse_nested_json, parse_nested_json_from_list, hash_password
+from pymysql import Connection, IntegrityError, OperationalError
+from pymysql.cursors import DictCursor, SSDictCursor
+from werkzeug.datastructures import ETags, MultiDict
+from werkzeug.exceptions import BadRequest, InternalServerError, NotFound, PreconditionFailed, ServiceUnavailable
+from query import build_select_departments_by_name_sql, build_select_taken_usernames_and_emails_sql, build_select_users_by_username_sql, build_select_employee_by_sql, build_select_employee_export_sql, build_select_employee_page_query, build_select_employees_by_sql, build_select_employees_by_id_sql, build_search_employees_query, build_select_employee_stats_sql, compile_employee_projection, employee_document_columns, employee_stats_groups, delete_address_by_id_sql, delete_user_by_username_sql, insert_address_sql, insert_user_sql, insert_employee_sql, update_user_avatar_by_username_sql, select_department_id_by_name_sql, select_user_id_by_username_for_update_sql, select_employee_version_by_username_for_update_sql, employee_columns, user_columns, address_columns, employee_update_values, plan_employee_update
+from helper import EmployeeFields, SearchQuery, collation_key, make_etag, encode_cursor, encode_offset_cursor, parse_cursor_pagination, parse_employee_fields, parse_employee_filters, parse_search_query
+from model import EmployeeProjection, EmployeeRecord, decode_employee_projection, decode_employee_projections, decode_employee_row, decode_employee_rows, employee_version, project_employee
+from hashing import get_hashing_service
+from avatar import Avatar, decode_data_url
+from cache import EmployeeCache
+from db import ConnectionPool, cursor_class
+from document import get_employee_documents
+from storage import AvatarUploadQueue
+from validation import validate_create_employee, validation_error
+from serializer import get_json_provider, json_response
+from metrics import get_metrics, statement_label
+
+
+def _with_validators(response: Response, etag: str, last_modified: Optional[datetime]) -> Response:
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # clients may keep the document but have to revalidate it before use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _conditional_response(body: Any, etag: str, last_modified: Optional[datetime], if_none_match: Optional[ETags],
+                          response_class: type = Response) -> Response:
+    # a matching If-None-Match is answered before the body is serialized
+    if if_none_match is not None and if_none_match.contains_weak(etag):
+        return _with_validators(response_class(b'', status=304), etag, last_modified)
+    return _with_validators(json_response(body, response_class=response_class), etag, last_modified)
+
+
+def _lock_employee(cursor: DictCursor, username: str) -> dict[str, Any]:
+    """
+    Lock the employee until the end of the transaction and return its
+    address_id and the columns of its version.
+    """
+    cursor.execute(select_employee_version_by_username_for_update_sql, username)
+    row = cursor.fetchone()
+    if row is None:
+        raise NotFound(
+            f"unable to find employee with username '{username}'")
+    return row
+
+
+def _check_if_match(cursor: DictCursor, username: str, if_match: Optional[ETags], row: Optional[dict[str, Any]] = None) -> None:
+    """
+    Lock the employee (unless its locked `row` is given) and compare its
+    current etag with the If-Match header, so a write based on a stale copy
+    of the employee fails instead of silently overwriting a concurrent one.
+    Without the header nothing is checked (or locked).
+    """
+    if not if_match:
+        return
+    if row is None:
+        row = _lock_employee(cursor, username)
+    etag = make_etag([employee_version(
+        row['employee_id'], row['updated_at'], row['user_updated_at'], row['department_updated_at'])])
+    # the tag names a version of the employee rather than its bytes, so the
+    # weak tag of a compressed response matches as well
+    if not if_match.contains_weak(etag):
+        raise PreconditionFailed(
+            f"employee with username '{username}' has been modified")
+
+
+# seconds a readiness check waits for a pooled connection
+readiness_timeout = 1.0
+
+
+def handle_readiness(db_pool: ConnectionPool) -> Response:
+    # ready only if a connection can be checked out and reaches the server
+    try:
+        with db_pool.connection(readiness_timeout) as db_conn:
+            db_conn.ping(reconnect=False)
+    except Exception as e:
+        return json_response({'status': 'unavailable', 'error': str(e), 'pool': db_pool.stats()}, 503)
+    return json_response({'status': 'ready', 'pool': db_pool.stats()})
+
+
+def _employee_response(employee: Union[EmployeeRecord, EmployeeProjection], fields: Optional[EmployeeFields], if_none_match: Optional[ETags],
+                       response_class: type = Response) -> Response:
+    # a whole (cached) employee is narrowed to the fieldset, whose fields
+    # are part of the etag of what is returned
+    if fields is None:
+        return _conditional_response(employee, make_etag([employee.version]), employee.last_modified, if_none_match, response_class)
+    if isinstance(employee, EmployeeRecord):
+        employee = project_employee(employee, fields)
+    return _conditional_response(employee.data, make_etag([','.join(fields), employee.version]), employee.last_modified,
+                                 if_none_match, response_class)
 
-response_headers = {'content-type': 'application/json'}
 
+def _select_employee_sql(fields: Optional[EmployeeFields]) -> str:
+    if fields is None:
+        return build_select_employee_by_sql('username', get_employee_documents().source)
+    columns, source = compile_employee_projection(fields, get_employee_documents().source, True)
+    return build_select_employee_by_sql('username', source, columns)
+
+
+def handle_fetch_one_employee(db_conn: Connection, username: str, cache: Optional[EmployeeCache] = None, if_none_match: Optional[ETags] = None,
+                              fields: Optional[EmployeeFields] = None) -> Response:
+    resp, version = cache.get(username) if cache is not None else (None, None)
+    if resp is not None:
+        return _employee_response(resp, fields, if_none_match)
 
-def handle_fetch_one_employee(db_conn: Connection, username: str) -> Response:
     cursor: DictCursor = db_conn.cursor()
 
     try:
-        cursor.execute(select_employee_view_by_username_sql, (username))
+        # a sparse fieldset reads only its fields, which are not cached
+        cursor.execute(_select_employee_sql(fields), (username))
         result = cursor.fetchone()
         if result is None:
             raise NotFound(
                 f"unable to find employee with username '{username}'")
-        resp = parse_nested_json(result)
+        resp = decode_employee_row(result) if fields is None else decode_employee_projection(result)
     except NotFound as e:
         raise e
     except Exception as e:
@@ -30,72 +128,367 @@ def handle_fetch_one_employee(db_conn: Connection, username: str) -> Response:
     finally:
         cursor.close()
 
-    return jsonify(resp), 200, response_headers
+    if cache is not None and fields is None:
+        cache.set(username, resp, version)
 
+    return _employee_response(resp, fields, if_none_match)
 
-def handle_fetch_many_employee(db_conn: Connection, args: MultiDict[str, str]) -> Response:
-    cursor: DictCursor = db_conn.cursor()
+
+def handle_fetch_many_employee(db_conn: Connection, args: MultiDict[str, str], if_none_match: Optional[ETags] = None) -> Response:
     pagination = parse_cursor_pagination(args)
+    filters = parse_employee_filters(args)
+    fields = parse_employee_fields(args)
+    cursor: DictCursor = db_conn.cursor()
 
     try:
-        if pagination is None:
-            cursor.execute(select_employee_view)
-            result = cursor.fetchall()
-        elif pagination['cursor'] is None:
-            cursor.execute(select_employee_view_with_limit,
-                           (pagination['limit']))
+        # fetch one extra row to know whether there is a next page
+        query, params = build_select_employee_page_query(
+            pagination['cursor'], pagination['limit'] + 1, filters, *_employee_page_source(fields))
+        cursor.execute(query, params)
+        result = cursor.fetchall()
+    except Exception as e:
+        raise InternalServerError(str(e))
+    finally:
+        cursor.close()
+
+    return _conditional_response(*_employee_page(result, pagination['limit'], fields), if_none_match)
+
+
+def _employee_page_source(fields: Optional[EmployeeFields]) -> tuple[str, str]:
+    # the source and columns of a page of whole documents or of a fieldset
+    if fields is None:
+        return get_employee_documents().source, employee_document_columns
+    columns, source = compile_employee_projection(fields, get_employee_documents().source)
+    return source, columns
+
+
+def _employee_page(result: list[dict[str, Any]], limit: int, fields: Optional[EmployeeFields] = None) -> tuple[dict[str, Any], str, Optional[datetime]]:
+    # the query read one row more than the page, only to tell if there is a next one
+    has_more = len(result) > limit
+    if fields is None:
+        data = employees = decode_employee_rows(result[:limit])
+        last_id = data[-1].employee_id if len(data) > 0 else None
+    else:
+        employees = decode_employee_projections(result[:limit])
+        data = [employee.data for employee in employees]
+        last_id = data[-1]['employee_id'] if len(data) > 0 else None
+    next_cursor = encode_cursor(last_id) if has_more else None
+
+    # the page is identified by the versions of its employees (and the
+    # fields read of them) and where it ends
+    versions = [employee.version for employee in employees]
+    etag = make_etag([*versions, next_cursor or ''] if fields is None else [','.join(fields), *versions, next_cursor or ''])
+    last_modified = max((employee.last_modified for employee in employees), default=None)
+
+    return {
+        'data': data,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }, etag, last_modified
+
+
+def _parse_batch_get(body: dict[str, Any]) -> tuple[str, list[Any]]:
+    # the body holds either `usernames` or `employee_ids` (see schema.py)
+    return ('username', body['usernames']) if 'usernames' in body else ('employee_id', body['employee_ids'])
+
+
+def _cached_employees(key: str, values: list[Any], cache: Optional[EmployeeCache]) -> tuple[dict[Any, EmployeeRecord], dict[str, Optional[str]]]:
+    # the cache is keyed by username, employees fetched by id always miss it.
+    # the versions of the usernames missed are kept to cache what is read
+    found: dict[Any, EmployeeRecord] = {}
+    versions: dict[str, Optional[str]] = {}
+    if cache is not None and key == 'username':
+        for username in set(values):
+            resp, version = cache.get(username)
+            if resp is not None:
+                found[username] = resp
+            else:
+                versions[username] = version
+    return found, versions
+
+
+def _missing_employees(key: str, values: list[Any], found: dict[Any, EmployeeRecord]) -> list[Any]:
+    # every requested employee not cached, once
+    return list(dict.fromkeys(value for value in values if value not in found))
+
+
+def _batch_get_result(key: str, values: list[Any], found: dict[Any, EmployeeRecord], result: list[dict[str, Any]],
+                      cache: Optional[EmployeeCache], versions: dict[str, Optional[str]]) -> dict[str, Any]:
+    # usernames are matched by mysql (see `build_select_employees_by_sql`),
+    # each row names the requested username it was found by
+    for row, employee in zip(result, decode_employee_rows(result)):
+        requested = row['requested'] if key == 'username' else employee.employee_id
+        found[requested] = employee
+        if cache is not None and requested in versions:
+            cache.set(requested, employee, versions[requested])
+
+    # one entry per requested key, in request order, duplicates included
+    return {
+        'data': [{
+            key: value,
+            'found': value in found,
+            'employee': found.get(value),
+        } for value in values],
+    }
+
+
+def handle_batch_get_employees(db_conn: Connection, body: dict[str, Any], cache: Optional[EmployeeCache] = None) -> Response:
+    key, values = _parse_batch_get(body)
+    found, versions = _cached_employees(key, values, cache)
+    missing = _missing_employees(key, values, found)
+
+    result = []
+    if len(missing) > 0:
+        cursor: DictCursor = db_conn.cursor()
+
+        try:
+            cursor.execute(build_select_employees_by_sql(
+                key, len(missing), get_employee_documents().source), tuple(missing))
             result = cursor.fetchall()
-        else:
-            cursor.execute(select_employee_view_with_cursor_and_limit,
-                           (pagination['cursor'], pagination['limit']))
+        except Exception as e:
+            raise InternalServerError(str(e))
+        finally:
+            cursor.close()
+
+    return json_response(_batch_get_result(key, values, found, result, cache, versions))
+
+
+# most employees read from each index a search is answered by
+search_max_candidates = 1000
+
+# error code of a statement aborted by its MAX_EXECUTION_TIME
+_execution_time_exceeded = 3024
+
+
+def handle_search_employees(db_conn: Connection, args: MultiDict[str, str], timeout_ms: int) -> Response:
+    search = parse_search_query(args)
+    cursor: DictCursor = db_conn.cursor()
+
+    try:
+        # rank the matches on the base tables, then load the documents of
+        # only the page being returned
+        query, params = build_search_employees_query(
+            search['q'], search_max_candidates, search['limit'] + 1, search['offset'], timeout_ms)
+        cursor.execute(query, params)
+        employee_ids = [row['employee_id'] for row in cursor.fetchall()]
+
+        has_more = len(employee_ids) > search['limit']
+        employee_ids = employee_ids[:search['limit']]
+
+        result = []
+        if len(employee_ids) > 0:
+            cursor.execute(build_select_employees_by_id_sql(
+                len(employee_ids), get_employee_documents().source), tuple(employee_ids))
             result = cursor.fetchall()
+    except OperationalError as e:
+        if e.args[0] == _execution_time_exceeded:
+            raise ServiceUnavailable(f"search for '{search['q']}' took longer than {timeout_ms}ms")
+        raise InternalServerError(str(e))
     except Exception as e:
         raise InternalServerError(str(e))
     finally:
         cursor.close()
 
-    return jsonify(parse_nested_json_from_list(result)), 200, response_headers
+    return json_response(_search_page(search, employee_ids, result, has_more))
+
+
+def _search_page(search: SearchQuery, employee_ids: list[int], result: list[dict[str, Any]], has_more: bool) -> dict[str, Any]:
+    # the documents are read back by id, put them in rank order again
+    rank = {employee_id: i for i, employee_id in enumerate(employee_ids)}
+    result.sort(key=lambda row: rank[row['employee_id']])
+
+    return {
+        'data': decode_employee_rows(result),
+        'next_cursor': encode_offset_cursor(search['offset'] + search['limit']) if has_more else None,
+        'has_more': has_more,
+    }
+
 
+def _parse_stats_group_by(args: MultiDict[str, str]) -> str:
+    group_by = args.get('group_by', 'all')
+    if group_by not in employee_stats_groups:
+        raise BadRequest(
+            f"group_by must be one of {', '.join(employee_stats_groups)}")
+    return group_by
+
+
+def handle_fetch_employee_stats(db_conn: Connection, args: MultiDict[str, str], cache: Optional[EmployeeCache] = None) -> Response:
+    group_by = _parse_stats_group_by(args)
+
+    if cache is not None:
+        resp = cache.get_analytics(group_by)
+        if resp is not None:
+            return json_response(resp)
 
-def handle_create_one_employee(db_conn: Connection, body: Optional[Any], s3_bucket_id: str) -> Response:
     cursor: DictCursor = db_conn.cursor()
 
-    # hash the password
-    if 'password_hash' in body:
-        body['password_hash'] = hash_password(body['password'])
-        del body['password']
-
-    # upload image to s3 if not None
-    if 'avatar_image' in body and body['avatar_image'] is not None:
-        mime = body['avatar_image'].split(',')[0]
-        data = body['avatar_image'].split(',')[1]
-        file_extension = ''
-        if 'jpeg' in mime:
-            file_extension = 'jpeg'
-        elif 'png' in mime:
-            file_extension = 'png'
-        elif 'gif' in mime:
-            file_extension = 'gif'
-        elif 'svg' in mime:
-            file_extension = 'svg'
-
-        file_name_with_extension = f"{body['username']}_avatar.{file_extension}"
-        s3 = resource('s3')
-        s3.Bucket(s3_bucket_id).put_object(Key=file_name_with_extension, Body=b64decode(data))
-        # get bucket location
-        location = client('s3').get_bucket_location(Bucket=s3_bucket_id)['LocationConstraint']
-        # get upload's avatar url
-        body['avatar_url'] = f"https://{s3_bucket_id}.s3-{location}.amazonaws.com/{file_name_with_extension}"
-        del body['avatar_image']
+    try:
+        cursor.execute(build_select_employee_stats_sql(group_by), ())
+        result = cursor.fetchall()
+    except Exception as e:
+        raise InternalServerError(str(e))
+    finally:
+        cursor.close()
+
+    resp = {'group_by': group_by, 'groups': result}
+    if cache is not None:
+        cache.set_analytics(group_by, resp)
+
+    return json_response(resp)
+
+
+# number of rows read from the server-side cursor per streamed chunk
+export_chunk_size = 500
+
+# flattened columns of an exported employee, nested documents use dotted keys
+export_csv_columns = [
+    'employee_id', 'salary', 'role', 'start_at', 'end_at', 'created_at', 'updated_at',
+    'user.user_id', 'user.email', 'user.username', 'user.phone_number', 'user.first_name',
+    'user.last_name', 'user.dob', 'user.gender', 'user.avatar_url', 'user.avatar_status', 'user.created_at', 'user.updated_at',
+    'department.department_id', 'department.name', 'department.description',
+    'department.created_at', 'department.updated_at',
+    'address.address_id', 'address.city', 'address.line1', 'address.line2', 'address.state',
+    'address.country', 'address.postal_code',
+]
+
+
+def _flatten_employee(employee: EmployeeRecord) -> list[Any]:
+    row = []
+    for column in export_csv_columns:
+        value = employee
+        for key in column.split('.'):
+            value = getattr(value, key, None)
+        row.append(value)
+    return row
+
+
+def _export_ndjson(rows: Iterator[list[dict[str, Any]]]) -> Iterator[bytes]:
+    dumps = get_json_provider().dumps
+    for chunk in rows:
+        yield b"".join(dumps(decode_employee_row(row)) + b"\n" for row in chunk)
+
+
+def _export_csv(rows: Iterator[list[dict[str, Any]]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_csv_columns)
+    yield buffer.getvalue()
+    for chunk in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in chunk:
+            writer.writerow(_flatten_employee(decode_employee_row(row)))
+        yield buffer.getvalue()
+
+
+def handle_export_employees(db_conn: Connection, args: MultiDict[str, str]) -> Response:
+    export_format = args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        raise BadRequest(f"unsupported export format '{export_format}'")
+
+    def read_chunks() -> Iterator[list[dict[str, Any]]]:
+        # an unbuffered cursor streams rows from the server as they are read
+        # instead of materializing the whole result set in memory
+        cursor: SSDictCursor = db_conn.cursor(cursor_class(SSDictCursor))
+        metrics = get_metrics()
+        try:
+            query = build_select_employee_export_sql(get_employee_documents().source)
+            cursor.execute(query)
+            while True:
+                chunk = cursor.fetchmany(export_chunk_size)
+                if len(chunk) == 0:
+                    break
+                # the unbuffered cursor's rows are counted as they stream
+                if metrics.enabled:
+                    metrics.observe_query_rows(statement_label(query), len(chunk))
+                yield chunk
+        finally:
+            cursor.close()
+
+    if export_format == 'csv':
+        body = _export_csv(read_chunks())
+        mimetype = 'text/csv'
+    else:
+        body = _export_ndjson(read_chunks())
+        mimetype = 'application/x-ndjson'
+
+    # keep the request context (and its pooled connection) alive until the
+    # last chunk has been sent
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'content-disposition': f"attachment; filename=employees.{export_format}",
+    })
+
+
+def handle_avatar_uploaded(db_conn: Connection, username: str, avatar_url: Optional[str], avatar_variants: Optional[str], cache: Optional[EmployeeCache] = None) -> None:
+    cursor: DictCursor = db_conn.cursor()
+
+    try:
+        cursor.execute(update_user_avatar_by_username_sql,
+                       (avatar_url, avatar_variants, 'ready' if avatar_url is not None else 'failed', username))
+        get_employee_documents().refresh(cursor, 'username', [username])
+        db_conn.commit()
+    except Exception as e:
+        db_conn.rollback()
+        raise e
+    finally:
+        cursor.close()
+
+    if cache is not None:
+        cache.invalidate(username)
+
+
+def handle_upload_employee_avatar(db_conn: Connection, username: str, avatar: Avatar, avatar_uploads: AvatarUploadQueue, cache: Optional[EmployeeCache] = None) -> Response:
+    cursor: DictCursor = db_conn.cursor()
+
+    try:
+        cursor.execute(select_user_id_by_username_for_update_sql, username)
+        if cursor.fetchone() is None:
+            raise NotFound(
+                f"unable to find employee with username '{username}'")
+        cursor.execute(update_user_avatar_by_username_sql, (None, None, 'pending', username))
+        get_employee_documents().refresh(cursor, 'username', [username])
+    except NotFound as e:
+        db_conn.rollback()
+        raise e
+    except Exception as e:
+        db_conn.rollback()
+        raise InternalServerError(str(e))
+    finally:
+        db_conn.commit()
+        cursor.close()
+
+    avatar_uploads.enqueue(username, avatar)
+
+    if cache is not None:
+        cache.invalidate(username)
+
+    return json_response({'username': username, 'avatar_status': 'pending'}, 202)
+
+
+def _pop_avatar(body: dict[str, Any], avatar_uploads: AvatarUploadQueue) -> Optional[Avatar]:
+    # decode the avatar now, it is uploaded in the background once the
+    # employee is saved
+    avatar_image = body.pop('avatar_image', None)
+    return decode_data_url(avatar_image, avatar_uploads.max_size) if avatar_image is not None else None
+
+
+def handle_create_one_employee(db_conn: Connection, body: Optional[Any], avatar_uploads: AvatarUploadQueue, cache: Optional[EmployeeCache] = None) -> Response:
+    cursor: DictCursor = db_conn.cursor()
+
+    # start hashing the password in the background, it is only needed when
+    # the user is inserted
+    password_hash = get_hashing_service().submit(body.pop('password'))
+    body.pop('password_hash', None)
+
+    avatar = _pop_avatar(body, avatar_uploads)
 
     # init some variables (they will remain None if not created)
-    avatar_url = None
     address_id = None
     department_id = None
 
     try:
         # get the department_id if it is specified
-        if body['department'] is not None:
+        if body.get('department') is not None:
             cursor.execute(
                 "SELECT department_id FROM department WHERE name = %s", body['department'])
             res = cursor.fetchone()
@@ -105,7 +498,7 @@ def handle_create_one_employee(db_conn: Connection, body: Optional[Any], s3_buck
             department_id = res['department_id']
 
         # create the address if specified
-        if body['address'] is not None:
+        if body.get('address') is not None:
             address = body['address']
             cursor.execute(insert_address_sql, tuple({
                 'city': address['city'],
@@ -121,13 +514,14 @@ def handle_create_one_employee(db_conn: Connection, body: Optional[Any], s3_buck
         cursor.execute(insert_user_sql, tuple({
             'email': body['email'],
             'username': body['username'],
-            'password_hash': body['password_hash'],
+            'password_hash': password_hash.result(),
             'phone_number': body['phone_number'],
             'first_name': body['first_name'],
             'last_name': body['last_name'],
             'dob': body['dob'],
             'gender': body['gender'],
-            'avatar_url': avatar_url
+            'avatar_url': None,
+            'avatar_status': 'pending' if avatar is not None else 'none',
         }.values()))
         user_id = cursor.lastrowid
 
@@ -141,9 +535,11 @@ def handle_create_one_employee(db_conn: Connection, body: Optional[Any], s3_buck
             'address_id': address_id,
             'department_id': department_id
         }.values()))
+        documents = get_employee_documents()
+        documents.refresh(cursor, 'employee_id', [cursor.lastrowid])
 
         # fetch the created employee
-        cursor.execute(select_employee_view_by_username_sql, body['username'])
+        cursor.execute(build_select_employee_by_sql('username', documents.source), body['username'])
         result = cursor.fetchone()
         if result is None:
             raise Exception(
@@ -160,89 +556,232 @@ def handle_create_one_employee(db_conn: Connection, body: Optional[Any], s3_buck
         db_conn.commit()
         cursor.close()
 
-    return jsonify(result), 200, response_headers
+    if avatar is not None:
+        avatar_uploads.enqueue(body['username'], avatar)
 
-# columns in table
-employee_columns = ['salary', 'role', 'start_at', 'end_at']
-department_columns = ['name', 'description']
-address_columns = ['city', 'line1', 'line2', 'state', 'country', 'postal_code']
-user_columns = ['email', 'username', 'password_hash', 'phone_number',
-                'first_name', 'last_name', 'dob', 'gender', 'avatar_url']
+    if cache is not None:
+        cache.invalidate(body['username'])
+
+    return json_response(decode_employee_row(result))
+
+# maximum number of employees accepted by a single bulk create request, and
+# of bytes of its body (rows carry no avatars, a few hundred bytes each)
+bulk_create_max_size = 5000
+bulk_create_max_bytes = bulk_create_max_size * 2048
+
+# number of rows per multi-row INSERT statement of a bulk create
+bulk_insert_chunk_size = 500
+
+
+def _validate_bulk_employees(cursor: DictCursor, rows: list[Any]) -> tuple[dict[int, dict], dict[int, str], dict[str, int]]:
+    errors: dict[int, str] = {}
+    valid: dict[int, dict] = {}
+    usernames: set[str] = set()
+    emails: set[str] = set()
+
+    for index, row in enumerate(rows):
+        error = validation_error(validate_create_employee, row)
+        if error is not None:
+            errors[index] = error
+        elif row.get('avatar_image') is not None:
+            errors[index] = "avatar_image is not supported in bulk creates"
+        elif collation_key(row['username']) in usernames or collation_key(row['email']) in emails:
+            errors[index] = "duplicated username or email in request"
+        else:
+            usernames.add(collation_key(row['username']))
+            emails.add(collation_key(row['email']))
+            valid[index] = row
+
+    if len(valid) == 0:
+        return valid, errors, {}
+
+    # reject rows clashing with existing users in one round trip, matched
+    # by mysql as spelled in the request
+    cursor.execute(build_select_taken_usernames_and_emails_sql(len(valid), len(valid)),
+                   (*(r['username'] for r in valid.values()), *(r['email'] for r in valid.values())))
+    taken = {r['requested'] for r in cursor.fetchall()}
+
+    # resolve every referenced department once, keyed as spelled in the request
+    department_names = {r['department'] for r in valid.values() if r.get('department') is not None}
+    department_ids: dict[str, int] = {}
+    if len(department_names) > 0:
+        cursor.execute(build_select_departments_by_name_sql(len(department_names)), tuple(department_names))
+        department_ids = {r['requested']: r['department_id'] for r in cursor.fetchall()}
+
+    for index, row in list(valid.items()):
+        if row['username'] in taken or row['email'] in taken:
+            errors[index] = _bulk_taken_error(row)
+        elif row.get('department') is not None and row['department'] not in department_ids:
+            errors[index] = f"Unable to find department with name '{row['department']}'"
+        else:
+            continue
+        del valid[index]
+
+    return valid, errors, department_ids
+
+
+def _bulk_taken_error(row: dict[str, Any]) -> str:
+    return f"employee with username '{row['username']}' or email '{row['email']}' already exists"
+
+
+def _insert_bulk_employees(cursor: DictCursor, chunk: list[dict[str, Any]], department_ids: dict[str, int]) -> None:
+    # create the addresses one by one, reading back the id of each (the ids
+    # of a multi-row insert are not always consecutive)
+    address_ids: dict[str, int] = {}
+    for row in chunk:
+        if row.get('address') is not None:
+            cursor.execute(insert_address_sql, (
+                row['address']['city'],
+                row['address']['line1'],
+                row['address'].get('line2'),
+                row['address']['state'],
+                row['address']['country'],
+                row['address']['postal_code'],
+            ))
+            address_ids[row['username']] = cursor.lastrowid
+
+    # create the users, executemany batches them into multi-row inserts
+    password_hashes = get_hashing_service().hash_many(row['password'] for row in chunk)
+    cursor.executemany(insert_user_sql, [(
+        row['email'],
+        row['username'],
+        password_hash,
+        row['phone_number'],
+        row['first_name'],
+        row['last_name'],
+        row['dob'],
+        row['gender'],
+        None,
+        'none',
+    ) for row, password_hash in zip(chunk, password_hashes)])
+    cursor.execute(build_select_users_by_username_sql(len(chunk)),
+                   tuple(row['username'] for row in chunk))
+    user_ids = {r['username']: r['user_id'] for r in cursor.fetchall()}
+
+    # create the employees
+    cursor.executemany(insert_employee_sql, [(
+        row.get('salary', 0),
+        row['role'],
+        row['start_at'],
+        row.get('end_at'),
+        user_ids[row['username']],
+        address_ids.get(row['username']),
+        department_ids.get(row.get('department')),
+    ) for row in chunk])
+    get_employee_documents().refresh(cursor, 'username', [row['username'] for row in chunk])
+
+
+def handle_bulk_create_employees(db_conn: Connection, rows: list[Any], cache: Optional[EmployeeCache] = None) -> Response:
+    if len(rows) > bulk_create_max_size:
+        raise BadRequest(
+            f"cannot create more than {bulk_create_max_size} employees at once")
 
-def handle_update_one_employee(db_conn: Connection, username: str, body: dict, s3_bucket_id: str) -> Response:
     cursor: DictCursor = db_conn.cursor()
 
-    # upload image to s3 if not None
-    if 'avatar_image' in body and body['avatar_image'] is not None:
-        mime = body['avatar_image'].split(',')[0]
-        data = body['avatar_image'].split(',')[1]
-        file_extension = ''
-        if 'jpeg' in mime:
-            file_extension = 'jpeg'
-        elif 'png' in mime:
-            file_extension = 'png'
-        elif 'gif' in mime:
-            file_extension = 'gif'
-        elif 'svg' in mime:
-            file_extension = 'svg'
-
-        file_name_with_extension = f"{body['username']}_avatar.{file_extension}"
-        s3 = resource('s3')
-        s3.Bucket(s3_bucket_id).put_object(Key=file_name_with_extension, Body=b64decode(data))
-        # get bucket location
-        location = client('s3').get_bucket_location(Bucket=s3_bucket_id)['LocationConstraint']
-        # get upload's avatar url
-        body['avatar_url'] = f"https://{s3_bucket_id}.s3-{location}.amazonaws.com/{file_name_with_extension}"
-        del body['avatar_image']
-        del body['username']
-        
-    
-    if 'department' in body:
-        body['name'] = body.pop('department')
-
-    employee_params = [v for k,v in body.items() if k in employee_columns]
-    user_params = [v for k,v in body.items() if k in user_columns]
-    department_params = [v for k,v in body.items() if k in department_columns]
-    address_params = [v for k,v in body.items() if k in address_columns]
-
-    employee_query, user_query, department_query, address_query = build_employee_view_update_query(username, list(body))
-
-    if len(employee_params) > 0:
-        print(employee_query)
-        print(tuple([*employee_params, username]))
-    print()
-    if len(user_params) > 0:
-        print(user_query)
-        print(tuple([*user_params, username]))
-    print()
-    if len(department_params) > 0:
-        print(department_query)
-        print(tuple([*department_params, username]))
-    print()
-    if len(address_params) > 0:
-        print(address_query)
-        print(tuple([*address_params, username]))
+    try:
+        valid, errors, department_ids = _validate_bulk_employees(cursor, rows)
+        indexes = list(valid)
+
+        for start in range(0, len(indexes), bulk_insert_chunk_size):
+            chunk = indexes[start:start + bulk_insert_chunk_size]
+            cursor.execute("SAVEPOINT bulk_chunk")
+            try:
+                _insert_bulk_employees(cursor, [valid[i] for i in chunk], department_ids)
+            except IntegrityError:
+                # a username or email was taken since it was checked, insert
+                # the chunk row by row so only the clashing rows fail
+                cursor.execute("ROLLBACK TO SAVEPOINT bulk_chunk")
+                for i in chunk:
+                    cursor.execute("SAVEPOINT bulk_row")
+                    try:
+                        _insert_bulk_employees(cursor, [valid[i]], department_ids)
+                    except IntegrityError:
+                        cursor.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                        errors[i] = _bulk_taken_error(valid.pop(i))
+    except Exception as e:
+        db_conn.rollback()
+        raise InternalServerError(str(e))
+    finally:
+        db_conn.commit()
+        cursor.close()
+
+    created = [valid[i]['username'] for i in indexes if i in valid]
+    if cache is not None:
+        cache.invalidate(*created)
+
+    return json_response({
+        'created': created,
+        'errors': [{'index': i, 'error': errors[i]} for i in sorted(errors)],
+    })
+
+def _insert_update_address(cursor: DictCursor, username: str, values: dict[str, Any]) -> int:
+    """
+    Create the address of an employee that had none from the address fields
+    of an update, which then have to be complete.
+    """
+    missing = [c for c in address_columns if c != 'line2' and c not in values]
+    if len(missing) > 0:
+        raise BadRequest(
+            f"employee with username '{username}' has no address, {', '.join(missing)} are required to add one")
+    cursor.execute(insert_address_sql, tuple(values.get(c) for c in address_columns))
+    return cursor.lastrowid
+
+
+def handle_update_one_employee(db_conn: Connection, username: str, body: dict, avatar_uploads: AvatarUploadQueue, cache: Optional[EmployeeCache] = None, if_match: Optional[ETags] = None) -> Response:
+    new_username = body.get('username')
+
+    avatar = _pop_avatar(body, avatar_uploads)
+    if avatar is not None:
+        body['avatar_status'] = 'pending'
+
+    # hash the new password if it is being changed
+    if 'password' in body:
+        body['password_hash'] = get_hashing_service().hash(body.pop('password'))
+
+    if not any(k in body for k in [*employee_columns, *user_columns, *address_columns, 'address', 'department']):
+        raise BadRequest("no updatable fields were given")
+
+    values = employee_update_values(body)
+    updates_address = any(c in values for c in address_columns)
+    cursor: DictCursor = db_conn.cursor()
 
     try:
-        # update the employee
-        if len(employee_params) > 0:
-            cursor.execute(employee_query, tuple([*employee_params, username]))
-        # update the user
-        if len(user_params) > 0:
-            cursor.execute(user_query, tuple([*user_params, username]))
-        # update the department
-        if len(department_params) > 0:
-            cursor.execute(department_query, tuple([*department_params, username]))
-        # update the address
-        if len(address_params) > 0:
-            cursor.execute(address_query, tuple([*address_params, username]))
-
-        # fetch the updated employee
-        cursor.execute(select_employee_view_by_username_sql, username)
+        db_conn.begin()
+
+        # the employee is only locked up front to check its etag, or to find
+        # out whether the address fields update its address or create one
+        address_id = None
+        if if_match or updates_address:
+            row = _lock_employee(cursor, username)
+            _check_if_match(cursor, username, if_match, row)
+            if updates_address and row['address_id'] is None:
+                address_id = _insert_update_address(cursor, username, values)
+
+        department_id = None
+        if body.get('department') is not None:
+            cursor.execute(select_department_id_by_name_sql, body['department'])
+            res = cursor.fetchone()
+            if res is None:
+                raise BadRequest(
+                    f"Unable to find department with name '{body['department']}'")
+            department_id = res['department_id']
+
+        # one statement updates every table touched by the body, the
+        # connection reports matched (not changed) rows so 0 means not found
+        query, params = plan_employee_update(username, body, department_id, address_id)
+        if cursor.execute(query, params) == 0:
+            raise NotFound(
+                f"unable to find employee with username '{username}'")
+
+        # fetch the updated employee through its (possibly new) username
+        documents = get_employee_documents()
+        documents.refresh(cursor, 'username', [new_username if new_username is not None else username])
+        cursor.execute(build_select_employee_by_sql('username', documents.source),
+                       new_username if new_username is not None else username)
         result = cursor.fetchone()
-        if result is None:
-            raise Exception(
-                f"Failed to fetch the created employee with username {body['username']}")
+    except (BadRequest, NotFound, PreconditionFailed) as e:
+        db_conn.rollback()
+        raise e
     except Exception as e:
         db_conn.rollback()
         raise InternalServerError(str(e))
@@ -250,32 +789,40 @@ def handle_update_one_employee(db_conn: Connection, username: str, body: dict, s
         db_conn.commit()
         cursor.close()
 
-    return jsonify(result), 200, response_headers
+    if avatar is not None:
+        avatar_uploads.enqueue(new_username if new_username is not None else username, avatar)
+
+    if cache is not None:
+        cache.invalidate(username, new_username)
 
+    emp = decode_employee_row(result)
+    return _with_validators(json_response(emp), make_etag([emp.version]), emp.last_modified)
 
-def handle_delete_one_employee(db_conn: Connection, username: str) -> Response:
+
+def handle_delete_one_employee(db_conn: Connection, username: str, cache: Optional[EmployeeCache] = None, if_match: Optional[ETags] = None) -> Response:
     cursor: DictCursor = db_conn.cursor()
 
     try:
         # start transaction
         db_conn.begin()
+        _check_if_match(cursor, username, if_match)
 
         # fetch the employee
-        cursor.execute(select_employee_view_by_username_sql, (username))
+        cursor.execute(build_select_employee_by_sql('username', get_employee_documents().source), (username))
         result = cursor.fetchone()
         if result is None:
             raise NotFound(
                 f"unable to find employee with username '{username}'")
-        emp = parse_nested_json(result)
+        emp = decode_employee_row(result)
 
         # delete address if exist
-        if 'address' in emp and 'address_id' in emp['address']:
+        if emp.address is not None:
             cursor.execute(delete_address_by_id_sql,
-                           (emp['address']['address_id']))
+                           (emp.address.address_id))
 
-        # delete the employee
-        cursor.execute(delete_user_by_username_sql, emp['user']['user_id'])
-    except NotFound as e:
+        # delete the employee, its document goes with it through the cascade
+        cursor.execute(delete_user_by_username_sql, emp.user.username)
+    except (NotFound, PreconditionFailed) as e:
         db_conn.rollback()
         raise e
     except Exception as e:
@@ -285,4 +832,7 @@ def handle_delete_one_employee(db_conn: Connection, username: str) -> Response:
         db_conn.commit()
         cursor.close()
 
-    return jsonify(emp), 200, response_headers
+    if cache is not None:
+        cache.invalidate(username)
+
+    return json_response(emp)
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, List, Optional
+from argon2 import PasswordHasher
+from config import Config
+from metrics import get_metrics
+
+# hasher used inside the worker processes, set by the pool initializer
+_worker_hasher: Optional[PasswordHasher] = None
+
+# guards the lazy start of the process pools, renewed in a forked child in
+# case another thread held it while the process was forked
+_executor_lock = threading.Lock()
+
+
+def _renew_executor_lock() -> None:
+    global _executor_lock
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_renew_executor_lock)
+
+
+def _init_worker(time_cost: int, memory_cost: int, parallelism: int) -> None:
+    global _worker_hasher
+    _worker_hasher = PasswordHasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+
+def _hash_in_worker(password: str) -> str:
+    return _worker_hasher.hash(password)
+
+
+class PasswordHashingService:
+    """
+    Hashes passwords with argon2 in a pool of worker processes, so the
+    CPU-heavy hashing neither blocks the request thread nor is serialized by
+    the GIL. With `workers` set to 0 every hash is computed inline.
+
+    The process pool is only started on first use, so a service created
+    before a server forks its workers is safe to share. Its processes are
+    started by a forkserver rather than forked from the (threaded) server
+    process, which could copy locks held by its other threads.
+    """
+
+    def __init__(self, time_cost: int, memory_cost: int, parallelism: int, workers: int) -> None:
+        self.time_cost = time_cost
+        self.memory_cost = memory_cost
+        self.parallelism = parallelism
+        self.workers = workers
+        self._hasher = PasswordHasher(
+            time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # a pool inherited through fork is unusable, start a new one per
+        # process, once however many threads hash for the first time
+        with _executor_lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=_init_worker,
+                    initargs=(self.time_cost, self.memory_cost, self.parallelism))
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, password: str) -> Future:
+        """
+        Start hashing the password in the background and return a future
+        resolving to the encoded hash.
+        """
+        if self.workers == 0:
+            future: Future = Future()
+            future.set_result(self._hasher.hash(password))
+            return future
+        return self._get_executor().submit(_hash_in_worker, password)
+
+    def hash(self, password: str) -> str:
+        metrics = get_metrics()
+        if not metrics.enabled:
+            return self.submit(password).result()
+        start = time.perf_counter()
+        encoded = self.submit(password).result()
+        metrics.observe_password_hash('hash', time.perf_counter() - start)
+        return encoded
+
+    def hash_many(self, passwords: Iterable[str]) -> List[str]:
+        """
+        Hash a batch of passwords, spread across the worker processes. The
+        hashes are returned in the same order as the passwords.
+        """
+        passwords = list(passwords)
+        metrics = get_metrics()
+        start = time.perf_counter()
+        if self.workers == 0:
+            encoded = [self._hasher.hash(password) for password in passwords]
+        else:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            encoded = list(self._get_executor().map(_hash_in_worker, passwords, chunksize=chunksize))
+        if metrics.enabled:
+            metrics.observe_password_hash('hash_many', time.perf_counter() - start)
+        return encoded
+
+    def close(self) -> None:
+        with _executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown()
+
+
+_service: Optional[PasswordHashingService] = None
+
+
+def init_hashing_service(config: Config) -> PasswordHashingService:
+    global _service
+    _service = PasswordHashingService(
+        time_cost=config.argon2_time_cost,
+        memory_cost=config.argon2_memory_cost,
+        parallelism=config.argon2_parallelism,
+        workers=config.password_hash_workers,
+    )
+    return _service
+
+
+def get_hashing_service() -> PasswordHashingService:
+    """
+    Get the service set up by `init_hashing_service`, falling back to one
+    hashing inline with argon2's default parameters.
+    """
+    global _service
+    if _service is None:
+        ph = PasswordHasher()
+        _service = PasswordHashingService(
+            time_cost=ph.time_cost, memory_cost=ph.memory_cost, parallelism=ph.parallelism, workers=0)
+    return _service
@@ -1,10 +1,25 @@
 import json
-from typing import List, Optional, Text, Any, TypedDict
-from datetime import datetime
+import unicodedata
+from hashlib import blake2b
+from typing import IO, Iterable, Iterator, List, Optional, Any, Tuple, TypedDict
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
 from werkzeug.datastructures import MultiDict
-from argon2 import PasswordHasher
+from werkzeug.wrappers import Request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from hashing import get_hashing_service
+from query import employee_object_fields, employee_scalar_fields
+from serializer import get_json_provider
 
-ph = PasswordHasher()
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+MAX_SEARCH_QUERY_LENGTH = 100
+
+_cursor_prefix = 'employee_id:'
+_offset_cursor_prefix = 'offset:'
 
 
 class CursorPagination(TypedDict):
@@ -12,49 +27,171 @@ class CursorPagination(TypedDict):
     limit: int
 
 
-def parse_cursor_pagination(args: MultiDict[str, str]) -> Optional[CursorPagination]:
-    if 'limit' not in args:
-        return None
+class EmployeeFilters(TypedDict, total=False):
+    department: str
+    role: str
+    active: bool
+
+
+# a sparse fieldset: document fields, nested ones as `<object>.<field>`, in document order
+EmployeeFields = Tuple[str, ...]
+
+
+class SearchQuery(TypedDict):
+    q: str
+    offset: int
+    limit: int
+
+
+def encode_cursor(value: int, prefix: str = _cursor_prefix) -> str:
+    return urlsafe_b64encode(f"{prefix}{value}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, prefix: str = _cursor_prefix) -> int:
+    try:
+        decoded = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        if not decoded.startswith(prefix):
+            raise ValueError()
+        return int(decoded[len(prefix):])
+    except (BinasciiError, UnicodeDecodeError, ValueError):
+        raise BadRequest(f"invalid cursor '{cursor}'")
+
+
+def _parse_limit(args: MultiDict[str, str], default: int) -> int:
+    try:
+        limit = int(args['limit']) if 'limit' in args else default
+    except ValueError:
+        raise BadRequest(f"invalid limit '{args['limit']}'")
+    if limit < 1:
+        raise BadRequest("limit must be at least 1")
+    return limit
+
+
+def parse_cursor_pagination(args: MultiDict[str, str]) -> CursorPagination:
+    limit = _parse_limit(args, DEFAULT_PAGE_SIZE)
     return {
-        'cursor': int(args['cursor']) if 'cursor' in args else None,
-        'limit': int(args['limit']),
+        'cursor': decode_cursor(args['cursor']) if 'cursor' in args else None,
+        'limit': min(limit, MAX_PAGE_SIZE),
     }
 
 
-def date_hook(json_dict: dict[Text, Any]):
-    for (key, value) in json_dict.items():
-        try:
-            json_dict[key] = datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
-        except:
-            pass
-    return json_dict
+def parse_employee_filters(args: MultiDict[str, str]) -> EmployeeFilters:
+    filters: EmployeeFilters = {}
+    if 'department' in args:
+        filters['department'] = args['department']
+    if 'role' in args:
+        filters['role'] = args['role']
+    if 'active' in args:
+        if args['active'] not in ('true', 'false'):
+            raise BadRequest("active must be either 'true' or 'false'")
+        filters['active'] = args['active'] == 'true'
+    return filters
 
 
-def is_valid_json_string(value: Any) -> bool:
-    if not isinstance(value, str):
-        return False
+def parse_employee_fields(args: MultiDict[str, str]) -> Optional[EmployeeFields]:
+    # `role`, `user.first_name` or `address`; the employee_id is always read, pages are cursored by it
+    if 'fields' not in args:
+        return None
+    requested = {field.strip() for field in args['fields'].split(',')} - {''}
+    for field in requested:
+        name, _, key = field.partition('.')
+        if name in employee_scalar_fields and key == '':
+            continue
+        if name in employee_object_fields and (key == '' or key in employee_object_fields[name]):
+            continue
+        raise BadRequest(f"unknown field '{field}'")
+
+    fields = [field for field in employee_scalar_fields if field in requested or field == 'employee_id']
+    for name, keys in employee_object_fields.items():
+        fields.extend(f"{name}.{key}" for key in keys if name in requested or f"{name}.{key}" in requested)
+    return tuple(fields)
+
+
+def encode_offset_cursor(offset: int) -> str:
+    return encode_cursor(offset, _offset_cursor_prefix)
+
+
+def parse_search_query(args: MultiDict[str, str]) -> SearchQuery:
+    # ranked results are paged by offset, the cursor is opaque to clients
+    q = args.get('q', '').strip()
+    if len(q) == 0:
+        raise BadRequest("missing search query 'q'")
+    if len(q) > MAX_SEARCH_QUERY_LENGTH:
+        raise BadRequest(f"search query cannot be longer than {MAX_SEARCH_QUERY_LENGTH} characters")
+    offset = decode_cursor(args['cursor'], _offset_cursor_prefix) if 'cursor' in args else 0
+    if offset < 0:
+        raise BadRequest(f"invalid cursor '{args['cursor']}'")
+    return {
+        'q': q,
+        'offset': offset,
+        'limit': min(_parse_limit(args, DEFAULT_SEARCH_PAGE_SIZE), MAX_SEARCH_PAGE_SIZE),
+    }
 
-    if '{' not in value or '}' not in value:
-        return False
 
-    try:
-        json.loads(value)
-    except ValueError as e:
-        return False
+def make_etag(versions: Iterable[str]) -> str:
+    digest = blake2b(digest_size=16)
+    for version in versions:
+        digest.update(version.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def parse_json_list_body(request: Request, max_rows: int, max_size: int) -> List[Any]:
+    return parse_json_list(request.stream, request.mimetype, max_rows, max_size, request.content_length)
+
 
-    return True
+def parse_json_list(stream: IO[bytes], mimetype: str, max_rows: int, max_size: int, content_length: Optional[int] = None) -> List[Any]:
+    # a json array or ndjson, rejected as soon as it grows past the limits
+    if content_length is not None and content_length > max_size:
+        raise RequestEntityTooLarge(f"request body cannot be larger than {max_size} bytes")
 
+    if mimetype == 'application/x-ndjson':
+        return parse_ndjson(_read_lines(stream, max_size), max_rows)
+    if mimetype != 'application/json' and not (mimetype.startswith('application/') and mimetype.endswith('+json')):
+        raise BadRequest("request body must be an array")
 
-def parse_nested_json(value: dict[Text, Any]) -> dict[Text, Any]:
-    for item in value.items():
-        if is_valid_json_string(item[1]):
-            value[item[0]] = json.loads(item[1], object_hook=date_hook)
-    return value
+    try:
+        body = get_json_provider().loads(b''.join(_read_lines(stream, max_size)))
+    except ValueError:
+        raise BadRequest("Failed to decode JSON object")
+    if not isinstance(body, list):
+        raise BadRequest("request body must be an array")
+    if len(body) > max_rows:
+        raise BadRequest(f"request body cannot have more than {max_rows} rows")
+    return body
+
+
+def _read_lines(stream: IO[bytes], max_size: int) -> Iterator[bytes]:
+    size = 0
+    while True:
+        # a line can only be read up to what is left of `max_size`
+        line = stream.readline(max_size - size + 1)
+        if not line:
+            return
+        size += len(line)
+        if size > max_size:
+            raise RequestEntityTooLarge(f"request body cannot be larger than {max_size} bytes")
+        yield line
+
+
+def parse_ndjson(lines: Iterable[bytes], max_rows: int) -> List[Any]:
+    rows = []
+    try:
+        for line in lines:
+            if not line.strip():
+                continue
+            if len(rows) == max_rows:
+                raise BadRequest(f"request body cannot have more than {max_rows} rows")
+            rows.append(json.loads(line))
+    except ValueError as e:
+        raise BadRequest(f"invalid ndjson body: {e}")
+    return rows
 
 
-def parse_nested_json_from_list(values: List[dict[Text, Any]]) -> List[dict[Text, Any]]:
-    return [parse_nested_json(value) for value in values]
+def collation_key(value: str) -> str:
+    # unique names (usernames, emails, departments) compare ignoring case and accents in mysql
+    return ''.join(c for c in unicodedata.normalize('NFKD', value) if not unicodedata.combining(c)).casefold()
 
 
 def hash_password(text: str) -> str:
-    return ph.hash(text)
+    return get_hashing_service().hash(text)
@@ -0,0 +1,215 @@
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Any, Optional
+from flask import Flask, g, request
+from flask.wrappers import Response
+from config import Config
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    # metrics are optional, only METRICS=true needs the client
+    prometheus_client = None
+
+# buckets (in seconds) of the histograms timing work well below a request
+_fast_buckets = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5)
+
+
+class Metrics:
+    """
+    The instrumentation points of the app. This base class records nothing,
+    it is what `get_metrics` returns while metrics are disabled, and call
+    sites check `enabled` before taking any timing so a disabled app only
+    pays for that check.
+    """
+    enabled = False
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        pass
+
+    def observe_query(self, statement: str, seconds: float, rows: int) -> None:
+        pass
+
+    def observe_query_rows(self, statement: str, rows: int) -> None:
+        pass
+
+    def observe_pool_wait(self, seconds: float) -> None:
+        pass
+
+    def observe_s3_upload(self, outcome: str, seconds: float) -> None:
+        pass
+
+    def observe_password_hash(self, operation: str, seconds: float) -> None:
+        pass
+
+    def observe_json(self, operation: str, seconds: float) -> None:
+        pass
+
+    def render(self) -> tuple[bytes, str]:
+        raise NotImplementedError()
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Metrics kept with prometheus_client and rendered in its text format. When
+    PROMETHEUS_MULTIPROC_DIR is set, every process writes its samples there
+    and `render` aggregates the samples of all the server's workers. The
+    directory has to be emptied before the server starts.
+    """
+    enabled = True
+
+    def __init__(self) -> None:
+        registry = prometheus_client.CollectorRegistry()
+        self._registry = registry
+        self._requests = prometheus_client.Histogram(
+            'http_request_duration_seconds', 'Time spent serving a request, per route.',
+            ['method', 'route', 'status'], registry=registry)
+        self._queries = prometheus_client.Histogram(
+            'db_query_duration_seconds', 'Time spent executing a statement, per statement and table.',
+            ['statement'], buckets=_fast_buckets, registry=registry)
+        self._query_rows = prometheus_client.Counter(
+            'db_query_rows', 'Rows returned or affected by the statements.',
+            ['statement'], registry=registry)
+        self._pool_wait = prometheus_client.Histogram(
+            'db_pool_wait_seconds', 'Time spent waiting for a pooled connection.',
+            buckets=_fast_buckets, registry=registry)
+        self._s3_uploads = prometheus_client.Histogram(
+            's3_upload_duration_seconds', 'Time spent uploading an object to s3, retries included.',
+            ['outcome'], registry=registry)
+        self._password_hashes = prometheus_client.Histogram(
+            'password_hash_duration_seconds', 'Time spent waiting for argon2 hashes.',
+            ['operation'], registry=registry)
+        self._json = prometheus_client.Histogram(
+            'json_duration_seconds', 'Time spent encoding responses and decoding employee rows.',
+            ['operation'], buckets=_fast_buckets, registry=registry)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float) -> None:
+        self._requests.labels(method, route, status).observe(seconds)
+
+    def observe_query(self, statement: str, seconds: float, rows: int) -> None:
+        self._queries.labels(statement).observe(seconds)
+        self._query_rows.labels(statement).inc(rows)
+
+    def observe_query_rows(self, statement: str, rows: int) -> None:
+        self._query_rows.labels(statement).inc(rows)
+
+    def observe_pool_wait(self, seconds: float) -> None:
+        self._pool_wait.observe(seconds)
+
+    def observe_s3_upload(self, outcome: str, seconds: float) -> None:
+        self._s3_uploads.labels(outcome).observe(seconds)
+
+    def observe_password_hash(self, operation: str, seconds: float) -> None:
+        self._password_hashes.labels(operation).observe(seconds)
+
+    def observe_json(self, operation: str, seconds: float) -> None:
+        self._json.labels(operation).observe(seconds)
+
+    def render(self) -> tuple[bytes, str]:
+        registry = self._registry
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+_statement_verb = re.compile(r'^\s*(?:/\*.*?\*/\s*)?(\w+)', re.S)
+_statement_table = re.compile(r'\b(?:from|into|update)\s+`?(\w+)', re.I)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(query: str) -> str:
+    """
+    Label a statement by its verb and the first table it names, e.g.
+    'select employee_lookup_view', keeping the number of label values small
+    however many distinct queries the builders render.
+    """
+    verb = _statement_verb.match(query)
+    table = _statement_table.search(query)
+    label = verb.group(1).lower() if verb is not None else 'unknown'
+    return f"{label} {table.group(1)}" if table is not None else label
+
+
+# the rowcount of an unbuffered cursor (the rows are only known once read),
+# whose reader counts them with `observe_query_rows` instead
+_unbuffered_rowcount = 18446744073709551615
+
+
+def _statement_rows(cursor: Any) -> int:
+    return cursor.rowcount if 0 <= cursor.rowcount < _unbuffered_rowcount else 0
+
+
+def instrumented_cursor(cursor_class: type) -> type:
+    """
+    Subclass a pymysql cursor to time every statement and count its rows.
+    `executemany` runs through `execute`, so batches are recorded per
+    statement sent.
+    """
+    class InstrumentedCursor(cursor_class):
+        def execute(self, query: str, args: Any = None) -> int:
+            start = time.perf_counter()
+            try:
+                return super().execute(query, args)
+            finally:
+                _metrics.observe_query(statement_label(query), time.perf_counter() - start, _statement_rows(self))
+
+    return InstrumentedCursor
+
+
+def instrumented_async_cursor(cursor_class: type) -> type:
+    # `instrumented_cursor` for the aiomysql cursors of the asgi app
+    class InstrumentedCursor(cursor_class):
+        async def execute(self, query: str, args: Any = None) -> int:
+            start = time.perf_counter()
+            try:
+                return await super().execute(query, args)
+            finally:
+                _metrics.observe_query(statement_label(query), time.perf_counter() - start, _statement_rows(self))
+
+    return InstrumentedCursor
+
+
+_metrics: Metrics = Metrics()
+
+
+def init_metrics(config: Config) -> Metrics:
+    global _metrics
+    if not config.metrics:
+        _metrics = Metrics()
+    elif prometheus_client is None:
+        raise Exception("METRICS requires prometheus_client, install it with `pip install -r requirements-metrics.txt`")
+    else:
+        _metrics = PrometheusMetrics()
+    return _metrics
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def mark_process_dead(pid: int) -> None:
+    # drop the samples a dead worker left for the metrics of the others
+    if prometheus_client is not None and 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def init_app(app: Flask) -> None:
+    """
+    Time every request of the app, if metrics are enabled once it is
+    started.
+    """
+    @app.before_request
+    def start_timer() -> None:
+        if _metrics.enabled:
+            g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response: Response) -> Response:
+        start: Optional[float] = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            _metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - start)
+        return response
@@ -0,0 +1,216 @@
+import json
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, List, Optional, Sequence, Text
+from metrics import get_metrics
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    # orjson is an optional speedup, the stdlib parser gives the same result
+    _loads = json.loads
+
+
+# records decoded from the rows of employee_view, they declare __slots__ so a
+# page of employees does not carry a __dict__ per object
+
+
+@dataclass
+class UserRecord:
+    __slots__ = ('user_id', 'email', 'username', 'phone_number', 'first_name', 'last_name', 'dob',
+                 'gender', 'avatar_url', 'avatar_status', 'avatar_variants', 'created_at', 'updated_at')
+    user_id: int
+    email: str
+    username: str
+    phone_number: str
+    first_name: str
+    last_name: str
+    dob: str
+    gender: str
+    avatar_url: Optional[str]
+    avatar_status: str
+    avatar_variants: Optional[dict[str, str]]
+    created_at: datetime
+    updated_at: datetime
+
+
+@dataclass
+class DepartmentRecord:
+    __slots__ = ('department_id', 'name', 'description', 'created_at', 'updated_at')
+    department_id: int
+    name: str
+    description: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+
+@dataclass
+class AddressRecord:
+    __slots__ = ('address_id', 'city', 'line1', 'line2', 'state', 'country', 'postal_code')
+    address_id: int
+    city: str
+    line1: str
+    line2: Optional[str]
+    state: str
+    country: str
+    postal_code: str
+
+
+@dataclass
+class EmployeeRecord:
+    __slots__ = ('employee_id', 'salary', 'role', 'start_at', 'end_at', 'created_at', 'updated_at',
+                 'user', 'department', 'address')
+    employee_id: int
+    salary: Decimal
+    role: str
+    start_at: date
+    end_at: Optional[date]
+    created_at: datetime
+    updated_at: datetime
+    user: UserRecord
+    department: Optional[DepartmentRecord]
+    address: Optional[AddressRecord]
+
+    @property
+    def version(self) -> str:
+        return employee_version(self.employee_id, self.updated_at, self.user.updated_at,
+                                self.department.updated_at if self.department is not None else None)
+
+    @property
+    def last_modified(self) -> datetime:
+        return max(self.updated_at, self.user.updated_at,
+                   self.department.updated_at if self.department is not None else self.updated_at)
+
+
+@dataclass
+class EmployeeProjection:
+    """
+    The fields of an employee read by a sparse fieldset, nested like the
+    document, with the version and modification time of the parts read.
+    """
+    __slots__ = ('data', 'version', 'last_modified')
+    data: dict[str, Any]
+    version: str
+    last_modified: datetime
+
+
+def employee_version(employee_id: int, updated_at: datetime, user_updated_at: datetime, department_updated_at: Optional[datetime]) -> str:
+    # every write to an employee bumps one of these (microsecond) timestamps
+    return f"{employee_id}:{updated_at.isoformat()}:{user_updated_at.isoformat()}:" + \
+        (department_updated_at.isoformat() if department_updated_at is not None else '')
+
+
+def _projection_version(employee_id: int, updated_at: Sequence[Optional[datetime]]) -> tuple[str, datetime]:
+    # like `employee_version`, over the employee and only the objects read
+    version = ':'.join([str(employee_id), *(u.isoformat() if u is not None else '' for u in updated_at)])
+    return version, max(u for u in updated_at if u is not None)
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    # JSON_OBJECT renders DATETIME columns as 'YYYY-MM-DD HH:MM:SS.ffffff'
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _decode_user(text: Text) -> UserRecord:
+    u = _loads(text)
+    return UserRecord(
+        u['user_id'], u['email'], u['username'], u['phone_number'], u['first_name'], u['last_name'],
+        u['dob'], u['gender'], u['avatar_url'], u['avatar_status'], u['avatar_variants'],
+        _parse_datetime(u['created_at']), _parse_datetime(u['updated_at']))
+
+
+def _decode_department(text: Text) -> Optional[DepartmentRecord]:
+    d = _loads(text)
+    # the view left joins the department and the address, rendering a missing
+    # one as an object of nulls
+    if d['department_id'] is None:
+        return None
+    return DepartmentRecord(
+        d['department_id'], d['name'], d['description'],
+        _parse_datetime(d['created_at']), _parse_datetime(d['updated_at']))
+
+
+def _decode_address(text: Text) -> Optional[AddressRecord]:
+    a = _loads(text)
+    if a['address_id'] is None:
+        return None
+    return AddressRecord(
+        a['address_id'], a['city'], a['line1'], a['line2'], a['state'], a['country'], a['postal_code'])
+
+
+def decode_employee_row(row: dict[Text, Any]) -> EmployeeRecord:
+    """
+    Decode a row of employee_view. Only the user, department and address
+    columns hold json, each is parsed exactly once, and only the keys known
+    to be datetimes are converted.
+    """
+    return EmployeeRecord(
+        row['employee_id'], row['salary'], row['role'], row['start_at'], row['end_at'],
+        row['created_at'], row['updated_at'],
+        _decode_user(row['user']), _decode_department(row['department']), _decode_address(row['address']))
+
+
+def decode_employee_rows(rows: Iterable[dict[Text, Any]]) -> List[EmployeeRecord]:
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return [decode_employee_row(row) for row in rows]
+    start = time.perf_counter()
+    records = [decode_employee_row(row) for row in rows]
+    metrics.observe_json('decode', time.perf_counter() - start)
+    return records
+
+
+# nested fields JSON_OBJECT renders from DATETIME columns
+_nested_datetime_fields = ('created_at', 'updated_at')
+
+
+def decode_employee_projection(row: dict[Text, Any]) -> EmployeeProjection:
+    """
+    Decode a row selected by `compile_employee_projection`: the nested
+    objects hold only the requested fields (or are null, like a missing
+    department or address), and the `_<name>_updated_at` columns give the
+    version rather than being returned.
+    """
+    data: dict[str, Any] = {}
+    for key, value in row.items():
+        if key.startswith('_'):
+            continue
+        if key in ('user', 'department', 'address') and value is not None:
+            value = _loads(value)
+            for field in _nested_datetime_fields:
+                if field in value:
+                    value[field] = _parse_datetime(value[field])
+        data[key] = value
+    version, last_modified = _projection_version(row['employee_id'], (
+        row['_employee_updated_at'], row.get('_user_updated_at'), row.get('_department_updated_at')))
+    return EmployeeProjection(data, version, last_modified)
+
+
+def decode_employee_projections(rows: Iterable[dict[Text, Any]]) -> List[EmployeeProjection]:
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return [decode_employee_projection(row) for row in rows]
+    start = time.perf_counter()
+    projections = [decode_employee_projection(row) for row in rows]
+    metrics.observe_json('decode', time.perf_counter() - start)
+    return projections
+
+
+def project_employee(employee: EmployeeRecord, fields: Sequence[str]) -> EmployeeProjection:
+    # the projection of a whole (cached) employee, as it would have been read
+    data: dict[str, Any] = {}
+    for field in fields:
+        name, _, key = field.partition('.')
+        if key == '':
+            data[name] = getattr(employee, name)
+        elif getattr(employee, name) is None:
+            data[name] = None
+        else:
+            data.setdefault(name, {})[key] = getattr(getattr(employee, name), key)
+    version, last_modified = _projection_version(employee.employee_id, (
+        employee.updated_at,
+        employee.user.updated_at if 'user' in data else None,
+        employee.department.updated_at if data.get('department') is not None else None))
+    return EmployeeProjection(data, version, last_modified)
@@ -1,5 +1,7 @@
 # INSERT
-from typing import List
+import re
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
 
 
 insert_department_sql = """
@@ -32,7 +34,8 @@ insert_user_sql = """
         last_name,
         dob,
         gender,
-        avatar_url
+        avatar_url,
+        avatar_status
     ) VALUES (
         %s,
         %s,
@@ -42,6 +45,7 @@ insert_user_sql = """
         %s,
         %s,
         %s,
+        %s,
         %s
     )
 """
@@ -65,31 +69,393 @@ insert_employee_sql = """
     )
 """
 
+
+def build_bulk_insert_address_sql(rows: int) -> str:
+    # a single multi-row INSERT is a "simple insert" for innodb, so the
+    # generated address_ids are consecutive starting from LAST_INSERT_ID()
+    return "INSERT INTO address (city, line1, line2, state, country, postal_code) VALUES " + \
+        ", ".join(["(%s, %s, %s, %s, %s, %s)"] * rows)
+
 # SELECT
-select_employee_view_by_username_sql = """
-    SELECT *
-    FROM employee_view
-    WHERE JSON_EXTRACT(user, '$.username') = %s
-"""
-select_employee_view_by_email_sql = """
-    SELECT *
-    FROM employee_view
-    WHERE JSON_EXTRACT(user, '$.email') = %s
-"""
-select_employee_view = """
-    SELECT *
-    FROM employee_view
-"""
-select_employee_view_with_limit = """
-    SELECT *
-    FROM employee_view
-    LIMIT %s
+
+# columns of the employee document, in the same order as `employee_view`
+employee_document_columns = "employee_id, salary, role, start_at, end_at, created_at, updated_at, user, department, address"
+
+# lookup keys mapped to the indexed base-table columns exposed by `employee_lookup_view`
+employee_lookup_columns = {
+    'username': 'lookup_username',
+    'email': 'lookup_email',
+}
+
+# employee documents are read either from the view, rendering them on every
+# read, or from the `employee_document` table holding them pre-rendered. both
+# expose the document and lookup columns under the same names
+employee_view_source = 'employee_lookup_view'
+employee_document_source = 'employee_document'
+
+
+# fields of the employee document, the scalars and those of each nested
+# object, in document order. reads can be narrowed to any of them
+employee_scalar_fields = ('employee_id', 'salary', 'role', 'start_at', 'end_at', 'created_at', 'updated_at')
+employee_object_fields = {
+    'user': ('user_id', 'email', 'username', 'phone_number', 'first_name', 'last_name', 'dob', 'gender',
+             'avatar_url', 'avatar_status', 'avatar_variants', 'created_at', 'updated_at'),
+    'department': ('department_id', 'name', 'description', 'created_at', 'updated_at'),
+    'address': ('address_id', 'city', 'line1', 'line2', 'state', 'country', 'postal_code'),
+}
+
+# how the view joins each object to the employee. every employee has a user,
+# the department and address are optional (and rendered as objects of nulls)
+_employee_object_joins = {
+    'user': ('U', "INNER JOIN user U ON U.user_id = E.user_id"),
+    'department': ('D', "LEFT JOIN department D ON D.department_id = E.department_id"),
+    'address': ('A', "LEFT JOIN address A ON A.address_id = E.address_id"),
+}
+
+
+def _json_object(name: str, values: dict[str, str], missing: str) -> str:
+    # a department or address left joined without a match is rendered as
+    # null, like `decode_employee_row` returns it, not as an object of nulls
+    pairs = ', '.join(f"'{key}', {value}" for key, value in values.items())
+    return f"IF({missing}, NULL, JSON_OBJECT({pairs})) AS `{name}`"
+
+
+@lru_cache(maxsize=64)
+def compile_employee_projection(fields: Tuple[str, ...], source: str = employee_view_source, lookup: bool = False) -> tuple[str, str]:
+    # the columns and source of a sparse fieldset, joining only the objects
+    # read; cached per fieldset, so `fields` must be in the canonical order
+    # of `parse_employee_fields`
+    scalars = [field for field in fields if '.' not in field]
+    objects: dict[str, List[str]] = {}
+    for field in fields:
+        if '.' in field:
+            name, key = field.split('.', 1)
+            objects.setdefault(name, []).append(key)
+    versioned = [name for name in objects if 'updated_at' in employee_object_fields[name]]
+
+    if source == employee_document_source:
+        # the stored documents only need the requested keys picked out
+        columns = [*scalars, *(
+            _json_object(name, {key: f"`{name}`->'$.{key}'" for key in keys},
+                         f"JSON_TYPE(`{name}`->'$.{name}_id') = 'NULL'") for name, keys in objects.items())]
+        columns.append("updated_at AS _employee_updated_at")
+        columns.extend(f"CAST(`{name}`->>'$.updated_at' AS DATETIME(6)) AS _{name}_updated_at" for name in versioned)
+        return ', '.join(columns), source
+
+    selected = [f"E.{field} AS {field}" for field in employee_scalar_fields]
+    selected += ["E.department_id AS lookup_department_id", "E.updated_at AS _employee_updated_at"]
+    joins = [join for name, (alias, join) in _employee_object_joins.items()
+             if name in objects or (name == 'user' and lookup)]
+    if 'user' in objects or lookup:
+        selected += ["U.username AS lookup_username", "U.email AS lookup_email"]
+    for name, keys in objects.items():
+        alias = _employee_object_joins[name][0]
+        selected.append(_json_object(name, {key: f"{alias}.{key}" for key in keys}, f"{alias}.{name}_id IS NULL"))
+    selected.extend(f"{_employee_object_joins[name][0]}.updated_at AS _{name}_updated_at" for name in versioned)
+
+    columns = [*scalars, *(f"`{name}`" for name in objects), "_employee_updated_at",
+               *(f"_{name}_updated_at" for name in versioned)]
+    return ', '.join(columns), f"""(
+        SELECT {', '.join(selected)}
+        FROM employee E {' '.join(joins)}
+    ) AS employee_projection"""
+
+
+@lru_cache(maxsize=64)
+def build_select_employee_by_sql(key: str, source: str = employee_view_source, columns: str = employee_document_columns) -> str:
+    # filtering on the base-table column (rather than JSON_EXTRACT over the
+    # document) lets mysql merge the view and resolve the row by the unique
+    # index, so the documents are only built for the matched employee
+    if key not in employee_lookup_columns:
+        raise Exception(f"unable to lookup employee by '{key}'")
+    return f"""
+    SELECT {columns}
+    FROM {source}
+    WHERE {employee_lookup_columns[key]} = %s
 """
-select_employee_view_with_cursor_and_limit = """
-    SELECT *
-    FROM employee_view
-    WHERE employee_id > %s
+
+
+select_employee_view_by_username_sql = build_select_employee_by_sql('username')
+select_employee_view_by_email_sql = build_select_employee_by_sql('email')
+
+
+def build_select_employee_export_sql(source: str = employee_view_source) -> str:
+    return f"""
+    SELECT {employee_document_columns}
+    FROM {source}
+    ORDER BY employee_id
+"""
+
+
+select_employee_export_sql = build_select_employee_export_sql()
+select_employee_version_by_username_for_update_sql = """
+    SELECT e.employee_id, e.address_id, e.updated_at, u.updated_at AS user_updated_at, d.updated_at AS department_updated_at
+    FROM `employee` AS e
+        JOIN `user` AS u ON u.user_id = e.user_id
+        LEFT JOIN `department` AS d ON d.department_id = e.department_id
+    WHERE u.username = %s
+    FOR UPDATE
+"""
+select_user_id_by_username_for_update_sql = """
+    SELECT user_id
+    FROM user
+    WHERE username = %s
+    FOR UPDATE
+"""
+select_department_id_by_name_sql = """
+    SELECT department_id
+    FROM department
+    WHERE name = %s
+"""
+
+
+def _requested_values(count: int) -> str:
+    # a derived table of the requested values, joined to match them through
+    # mysql's collation (ignoring case and accents) rather than in python
+    return " UNION ALL ".join(["SELECT %s AS value"] * count)
+
+
+def build_select_departments_by_name_sql(names: int) -> str:
+    return f"""
+    SELECT requested.value AS requested, department_id
+    FROM ({_requested_values(names)}) AS requested
+        JOIN department ON department.name = requested.value
+"""
+
+
+def build_select_users_by_username_sql(usernames: int) -> str:
+    return f"SELECT user_id, username FROM user WHERE username IN ({_get_placeholders(usernames)})"
+
+
+def build_select_taken_usernames_and_emails_sql(usernames: int, emails: int) -> str:
+    # the requested usernames and emails some user already has
+    return f"""
+    SELECT requested.value AS requested
+    FROM ({_requested_values(usernames)}) AS requested
+        JOIN user ON user.username = requested.value
+    UNION
+    SELECT requested.value AS requested
+    FROM ({_requested_values(emails)}) AS requested
+        JOIN user ON user.email = requested.value
+"""
+
+
+def build_select_employee_page_query(cursor: Optional[int], limit: int, filters: dict[str, Any], source: str = employee_view_source,
+                                     columns: str = employee_document_columns) -> tuple[str, tuple]:
+    # keyset pagination: every filter is on an indexed base-table column and
+    # rows are always ordered by the primary key so pages are stable
+    conditions: List[str] = []
+    params: List[Any] = []
+
+    if cursor is not None:
+        conditions.append("employee_id > %s")
+        params.append(cursor)
+    if 'department' in filters:
+        conditions.append(
+            "lookup_department_id = (SELECT department_id FROM department WHERE name = %s)")
+        params.append(filters['department'])
+    if 'role' in filters:
+        conditions.append("role = %s")
+        params.append(filters['role'])
+    if 'active' in filters:
+        conditions.append("(end_at IS NULL OR end_at > CURRENT_DATE)"
+                          if filters['active'] else "end_at <= CURRENT_DATE")
+
+    where = f"WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+    params.append(limit)
+
+    return f"""
+    SELECT {columns}
+    FROM {source}
+    {where}
+    ORDER BY employee_id
     LIMIT %s
+""", tuple(params)
+
+
+# keys employees are fetched in batches by, mapped to indexed columns of both sources
+employee_batch_columns = {
+    'employee_id': 'employee_id',
+    **employee_lookup_columns,
+}
+
+
+def build_select_employees_by_sql(key: str, count: int, source: str = employee_view_source) -> str:
+    # usernames and emails match through mysql's collation, each row carries
+    # the `requested` value it matched
+    if key not in employee_batch_columns:
+        raise Exception(f"unable to lookup employees by '{key}'")
+    if key == 'employee_id':
+        return f"""
+    SELECT {employee_document_columns}
+    FROM {source}
+    WHERE employee_id IN ({_get_placeholders(count)})
+"""
+    return f"""
+    SELECT requested.value AS requested, {employee_document_columns}
+    FROM ({_requested_values(count)}) AS requested
+        JOIN {source} ON {employee_batch_columns[key]} = requested.value
+"""
+
+
+def build_select_employees_by_id_sql(count: int, source: str = employee_view_source) -> str:
+    return build_select_employees_by_sql('employee_id', count, source)
+
+
+# columns covered by the full-text index of `user`
+_search_fulltext_columns = "u.first_name, u.last_name, u.username, u.email"
+
+# prefix-matched columns and the score a match adds to an employee's rank
+_search_prefix_columns = [
+    ('u.username', 4),
+    ('u.email', 3),
+    ('u.first_name', 2),
+    ('u.last_name', 2),
+]
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_search_employees_query(q: str, candidates: int, limit: int, offset: int, timeout_ms: int) -> tuple[str, tuple]:
+    # every branch reads at most `candidates` rows by one index, and mysql
+    # aborts the statement after `timeout_ms`
+
+    # every word must match the start of an indexed word, operators in the
+    # query are dropped rather than interpreted
+    against = " ".join(f"+{word}*" for word in re.findall(r"\w+", q))
+    prefix = _escape_like(q) + '%'
+
+    branches = [f"""(
+        SELECT e.employee_id, MATCH({_search_fulltext_columns}) AGAINST (%s IN BOOLEAN MODE) AS score
+        FROM `user` AS u JOIN `employee` AS e ON e.user_id = u.user_id
+        WHERE MATCH({_search_fulltext_columns}) AGAINST (%s IN BOOLEAN MODE)
+        ORDER BY score DESC
+        LIMIT %s
+    )"""]
+    params: List[Any] = [against, against, candidates]
+    for column, score in _search_prefix_columns:
+        branches.append(f"""(
+        SELECT e.employee_id, {score} AS score
+        FROM `user` AS u JOIN `employee` AS e ON e.user_id = u.user_id
+        WHERE {column} LIKE %s
+        LIMIT %s
+    )""")
+        params.extend([prefix, candidates])
+    branches.append("""(
+        SELECT employee_id, 1 AS score
+        FROM `employee`
+        WHERE role LIKE %s
+        LIMIT %s
+    )""")
+    params.extend([prefix, candidates, limit, offset])
+
+    return f"""
+    SELECT /*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */ employee_id, SUM(score) AS score
+    FROM ({" UNION ALL ".join(branches)}) AS hits
+    GROUP BY employee_id
+    ORDER BY score DESC, employee_id
+    LIMIT %s OFFSET %s
+""", tuple(params)
+
+
+# expressions employees are grouped by in the analytics, None counts everyone as one group
+employee_stats_groups = {
+    'all': None,
+    'department': "d.name",
+    'role': "e.role",
+    'start_month': "DATE_FORMAT(e.start_at, '%%Y-%%m')",
+}
+
+# salary percentiles computed per group (nearest rank)
+employee_stats_percentiles = [50, 90, 99]
+
+
+@lru_cache(maxsize=8)
+def build_select_employee_stats_sql(group_by: str) -> str:
+    # one pass over the base tables; execute it with (empty) params, it escapes `%`
+    if group_by not in employee_stats_groups:
+        raise Exception(f"unable to group employee stats by '{group_by}'")
+    expr = employee_stats_groups[group_by] or "NULL"
+    join = "LEFT JOIN `department` AS d ON d.department_id = e.department_id" if group_by == 'department' else ""
+    percentiles = ",\n        ".join(
+        f"MAX(CASE WHEN salary_rank = CEIL(group_size * {p / 100}) THEN salary END) AS salary_p{p}"
+        for p in employee_stats_percentiles)
+
+    return f"""
+    SELECT grp AS `group`,
+        COUNT(*) AS headcount,
+        COUNT(CASE WHEN active THEN 1 END) AS active,
+        COUNT(CASE WHEN NOT active THEN 1 END) AS ended,
+        SUM(salary) AS salary_sum,
+        ROUND(AVG(salary), 2) AS salary_avg,
+        MIN(salary) AS salary_min,
+        MAX(salary) AS salary_max,
+        {percentiles}
+    FROM (
+        SELECT {expr} AS grp,
+            e.salary,
+            (e.end_at IS NULL OR e.end_at > CURRENT_DATE) AS active,
+            ROW_NUMBER() OVER (PARTITION BY {expr} ORDER BY e.salary) AS salary_rank,
+            COUNT(*) OVER (PARTITION BY {expr}) AS group_size
+        FROM `employee` AS e
+        {join}
+    ) AS s
+    GROUP BY grp
+    ORDER BY grp
+"""
+
+
+# UPDATE (avatar uploads)
+update_user_avatar_by_username_sql = """
+    UPDATE user
+    SET avatar_url = COALESCE(%s, avatar_url),
+        avatar_variants = COALESCE(%s, avatar_variants),
+        avatar_status = %s
+    WHERE username = %s
+"""
+
+# REPLACE (employee documents)
+
+# keys an employee document can be refreshed by, mapped to their view columns
+employee_document_keys = {
+    'employee_id': 'employee_id',
+    'username': 'lookup_username',
+}
+
+
+def build_refresh_employee_documents_sql(key: str, count: int) -> str:
+    # re-render the documents from the view, replacing the stored ones. rows
+    # are matched on the primary key and the unique lookups, so a document is
+    # replaced even if the employee's username or email has changed
+    if key not in employee_document_keys:
+        raise Exception(f"unable to refresh employee documents by '{key}'")
+    return f"""
+    REPLACE INTO {employee_document_source} ({employee_document_columns}, lookup_username, lookup_email, lookup_department_id)
+    SELECT {employee_document_columns}, lookup_username, lookup_email, lookup_department_id
+    FROM {employee_view_source}
+    WHERE {employee_document_keys[key]} IN ({_get_placeholders(count)})
+"""
+
+
+refresh_employee_document_range_sql = f"""
+    REPLACE INTO {employee_document_source} ({employee_document_columns}, lookup_username, lookup_email, lookup_department_id)
+    SELECT {employee_document_columns}, lookup_username, lookup_email, lookup_department_id
+    FROM {employee_view_source}
+    WHERE employee_id BETWEEN %s AND %s
+"""
+select_employee_id_range_sql = """
+    SELECT MIN(employee_id) AS min_id, MAX(employee_id) AS max_id
+    FROM employee
+"""
+count_employee_documents_sql = f"""
+    SELECT COUNT(*) AS count
+    FROM {employee_document_source}
+"""
+delete_orphan_employee_documents_sql = f"""
+    DELETE FROM {employee_document_source}
+    WHERE employee_id NOT IN (SELECT employee_id FROM {employee_view_source})
 """
 
 # DELETE
@@ -106,34 +472,62 @@ delete_user_by_username_sql = """
 
 # columns in table
 employee_columns = ['salary', 'role', 'start_at', 'end_at']
-department_columns = ['name', 'description']
 address_columns = ['city', 'line1', 'line2', 'state', 'country', 'postal_code']
 user_columns = ['email', 'username', 'password_hash', 'phone_number',
-                'first_name', 'last_name', 'dob', 'gender', 'avatar_url']
+                'first_name', 'last_name', 'dob', 'gender', 'avatar_url', 'avatar_status']
+# the rows an employee points at, resolved by the handler before updating
+employee_reference_columns = ['department_id', 'address_id']
+
+
+@lru_cache(maxsize=256)
+def compile_employee_update(columns: Tuple[str, ...]) -> str:
+    # cached per column set, so `columns` must be in the canonical order of
+    # `plan_employee_update`
+    if len(columns) == 0:
+        raise Exception("update columns cannot be empty")
+
+    joins = ["JOIN `user` AS u ON u.user_id = e.user_id"]
+    assignments = []
+
+    if any(c in address_columns for c in columns):
+        joins.append("JOIN `address` AS a ON a.address_id = e.address_id")
+
+    for column in columns:
+        if column in employee_columns or column in employee_reference_columns:
+            assignments.append(f"e.{column}")
+        elif column in user_columns:
+            assignments.append(f"u.{column}")
+        elif column in address_columns:
+            assignments.append(f"a.{column}")
+    assignments = [f"{a} = %s" for a in assignments]
+    # address has no updated_at of its own, so the employee's version is
+    # bumped by every update (it is part of the employee's etag)
+    assignments.append("e.updated_at = CURRENT_TIMESTAMP(6)")
+
+    return f"UPDATE `employee` AS e {' '.join(joins)} SET {', '.join(assignments)} WHERE u.username = %s"
 
-def build_employee_view_update_query(username: str, params: List[str]) -> tuple[str, str, str, str]:
-    if len(params) == 0:
-        raise Exception("update params cannot be empty")
 
-    employee_params = [p for p in params if p in employee_columns]
-    user_params = [p for p in params if p in user_columns]
-    department_params = [p for p in params if p in department_columns]
-    address_params = [p for p in params if p in address_columns]
+def employee_update_values(body: dict[str, Any]) -> dict[str, Any]:
+    # the nested address object and the older flat address keys are both accepted
+    return {**body, **(body.get('address') or {})}
 
-    update_employee_sql = "UPDATE `employee` AS e, `user` AS u SET " + \
-            _get_dynamic_update_params(employee_params) + f" WHERE e.user_id = u.user_id AND u.username = %s"
 
-    update_user_params = "UPDATE `user` SET " + \
-            _get_dynamic_update_params(user_params) + f" WHERE username = %s"
+def plan_employee_update(username: str, body: dict[str, Any], department_id: Optional[int] = None, address_id: Optional[int] = None) -> tuple[str, tuple]:
+    # `address_id` is the address just created for an employee that had none,
+    # its fields are then not updated again
+    values = employee_update_values(body)
 
-    update_department_params = "UPDATE `department` AS d, `user` AS u, `employee` AS e SET " + \
-            _get_dynamic_update_params(department_params) + f" WHERE u.username = %s AND u.user_id = e.user_id AND e.department_id = d.department_id"
+    columns = [c for c in [*employee_columns, *user_columns] if c in values]
+    if address_id is None:
+        columns += [c for c in address_columns if c in values]
+    params = [values[c] for c in columns]
+    for column, value in (('department_id', department_id), ('address_id', address_id)):
+        if value is not None:
+            columns.append(column)
+            params.append(value)
 
-    update_address_params = "UPDATE `address` AS a, `user` AS u, `employee` AS e SET " + \
-            _get_dynamic_update_params(address_params) + f" WHERE u.username = %s AND u.user_id = e.user_id AND e.department_id = d.department_id"
+    return compile_employee_update(tuple(columns)), (*params, username)
 
-    return update_employee_sql, update_user_params, update_department_params, update_address_params
 
-def _get_dynamic_update_params(params: List[str]) -> str:
-    # this construct the middle part of the query
-    return "".join(map(lambda x: f"{x} = %s, ", params))[:-2]
+def _get_placeholders(count: int) -> str:
+    return ", ".join(["%s"] * count)
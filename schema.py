@@ -1,7 +1,8 @@
 email_regex = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
 msia_phone_regex = r'^(\+?6?01)[0|1|2|3|4|6|7|8|9]\-*[0-9]{7,8}$'
 gender_regex = r'^(male|female)$'
-base64_image_regex = r'(data:image\/[^;]+;base64[^"]+)'
+# only the data url header is matched, the payload itself is checked when decoded
+base64_image_regex = r'^data:image\/[a-zA-Z0-9.+-]+;base64,'
 date_regex = r'^\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$'
 
 create_or_update_employee_base_schema = {
@@ -56,6 +57,25 @@ create_employee_schema = {
 
 update_employee_schema = {
     'type': create_or_update_employee_base_schema['type'],
-    'properties': create_or_update_employee_base_schema['properties'],
+    'properties': {
+        **create_or_update_employee_base_schema['properties'],
+        # the older flat address keys, still accepted next to `address`
+        **create_or_update_employee_base_schema['properties']['address']['properties'],
+    },
+    # every other key would be written as a column (password_hash, the avatar
+    # status set by the uploads...)
+    'additionalProperties': False,
     'required': []
 }
+
+batch_get_employees_schema = {
+    'type': 'object',
+    'properties': {
+        # at most 100 employees are fetched at once
+        'usernames': {'type': 'array', 'items': {'type': 'string'}, 'minItems': 1, 'maxItems': 100},
+        'employee_ids': {'type': 'array', 'items': {'type': 'integer'}, 'minItems': 1, 'maxItems': 100},
+    },
+    'additionalProperties': False,
+    # employees are looked up either by username or by id
+    'oneOf': [{'required': ['usernames']}, {'required': ['employee_ids']}],
+}
@@ -1,60 +1,142 @@
+"""
+Seed the database with fake departments and employees, after removing the
+existing ones. The login credentials of the fake users are saved to
+FAKE_USER_CSV.
+
+    python seed_db.py                                # 50 employees
+    python seed_db.py --count 1000000 --hash-pool 100
+
+The fakes are generated in batches across `--workers` processes while the
+previous batches are inserted, each batch with multi-row inserts in its own
+transaction. Hashing a password with argon2 takes far longer than inserting
+its user, so for large counts `--hash-pool` hashes only that many passwords
+once and hands them out round-robin (the credentials saved stay valid).
+"""
+import argparse
 import csv
-from typing import List, OrderedDict
+import os
+import time
+from multiprocessing import Pool
+from typing import Any, List
 from faker import Faker
-from pymysql import connections
-from argon2 import PasswordHasher
+from pymysql import Connection, connections, cursors
 from config import Config
-from query import insert_employee_sql, insert_address_sql, insert_user_sql, insert_department_sql
-
-# initialize faker instance
-fake = Faker()
-
-# initialize password hasher
-ph = PasswordHasher()
-
-# initialize the config (setup environment var)
-config = Config()
-
-# connect to rds (mysql)
-db_conn = connections.Connection(
-    host=config.database_host,
-    port=3306,
-    user=config.database_user,
-    password=config.database_password,
-    db=config.database_db
-)
+from hashing import get_hashing_service, init_hashing_service
+from helper import collation_key
+from document import backfill_if_enabled, init_employee_documents
+from query import build_bulk_insert_address_sql, build_select_users_by_username_sql, insert_employee_sql, insert_user_sql, insert_department_sql
 
 # constants
 NUM_DEPARTMENT = 5
 NUM_EMPLOYEES = 50
+BATCH_SIZE = 1000
 
 FAKE_USER_CSV = "./fake_user.csv"
 
-# generate fake users
-fake_users = [{
-    "email": fake.email(),
-    "username": fake.simple_profile()['username'],
-    "password_hash": fake.password(),
-    "phone_number": f"+601{fake.random_int(min=0, max=9)}-{fake.random_number(digits=7)}",
-    "first_name": fake.first_name(),
-    "last_name": fake.last_name(),
-    "dob": fake.date_of_birth(maximum_age=50),
-    "gender": 'male' if fake.simple_profile()['sex'] == 'M' else 'female',
-    "avatar_url": fake.image_url(),
-} for _ in range(NUM_EMPLOYEES)]
 
-fake_department_ids: List[int] = []
+def generate_employees(batch: tuple[int, int, int]) -> List[dict[str, Any]]:
+    """
+    Generate the fake employees [first, first + count) in a worker process.
+    Every batch seeds its own faker, so the fakes do not depend on which
+    worker generated them, and the index makes usernames and emails unique.
+    """
+    first, count, departments = batch
+    # unweighted picks (of names, cities...) are several times faster
+    fake = Faker(use_weighting=False)
+    fake.seed_instance(first)
+
+    employees = []
+    for i in range(first, first + count):
+        username = f"{fake.user_name()}{i}"
+        dob = fake.date_of_birth(maximum_age=50)
+        start_at = fake.date_between(start_date=dob)
+        employees.append({
+            'address': (fake.city(), fake.street_address(),
+                        fake.street_name() if fake.random.random() < 0.3 else None,
+                        fake.state(), fake.country(), fake.postcode()),
+            'email': f"{username}@{fake.free_email_domain()}",
+            'username': username,
+            'password': fake.password(),
+            'phone_number': f"+601{fake.random_int(min=0, max=9)}-{fake.random_number(digits=7, fix_len=True)}",
+            'first_name': fake.first_name(),
+            'last_name': fake.last_name(),
+            'dob': dob,
+            'gender': fake.random_element(elements=('male', 'female')),
+            'avatar_url': fake.image_url(),
+            'salary': fake.random_int(min=2000, max=9999),
+            'role': fake.random_element(elements=('manager', 'admin', 'cashier', 'runner')),
+            'start_at': start_at,
+            'end_at': fake.date_between(start_date=start_at) if fake.random.random() < 0.3 else None,
+            'department': fake.random_int(min=0, max=departments - 1),
+        })
+    return employees
+
+
+def insert_employees(cursor: cursors.DictCursor, employees: List[dict[str, Any]], password_hashes: List[str], department_ids: List[int]) -> None:
+    """
+    Insert a batch of generated employees (with their addresses and users)
+    using one multi-row insert per table. `department` of an employee is an
+    index into `department_ids`.
+    """
+    # the address_ids of a multi-row insert are consecutive
+    cursor.execute(build_bulk_insert_address_sql(len(employees)), tuple(
+        value for employee in employees for value in employee['address']))
+    first_address_id = cursor.lastrowid
+
+    # executemany batches the users into multi-row inserts
+    cursor.executemany(insert_user_sql, [(
+        employee['email'],
+        employee['username'],
+        password_hash,
+        employee['phone_number'],
+        employee['first_name'],
+        employee['last_name'],
+        employee['dob'],
+        employee['gender'],
+        employee['avatar_url'],
+        'ready' if employee['avatar_url'] is not None else 'none',
+    ) for employee, password_hash in zip(employees, password_hashes)])
+    cursor.execute(build_select_users_by_username_sql(len(employees)),
+                   tuple(employee['username'] for employee in employees))
+    user_ids = {row['username']: row['user_id'] for row in cursor.fetchall()}
+
+    cursor.executemany(insert_employee_sql, [(
+        employee['salary'],
+        employee['role'],
+        employee['start_at'],
+        employee['end_at'],
+        user_ids[employee['username']],
+        first_address_id + i,
+        department_ids[employee['department']],
+    ) for i, employee in enumerate(employees)])
+
+
+def department_names(fake: Faker, count: int) -> List[str]:
+    # department names are unique, so a city drawn again gets a number
+    names: List[str] = []
+    keys = set()
+    for _ in range(count):
+        city = name = fake.city()
+        suffix = 1
+        while collation_key(name) in keys:
+            suffix += 1
+            name = f"{city} {suffix}"
+        keys.add(collation_key(name))
+        names.append(name)
+    return names
 
 
 # insert fake data into `department` table
-def seed_department():
+def seed_department(db_conn: Connection, count: int) -> List[int]:
+    fake = Faker()
     cursor = db_conn.cursor()
     try:
-        for _ in range(NUM_DEPARTMENT):
-            cursor.execute(insert_department_sql,
-                           (fake.city(), fake.sentence()))
-            fake_department_ids.append(cursor.lastrowid)
-            print(f"seed `department` with id {cursor.lastrowid} - SUCCESS ✅")
+        department_ids = []
+        for name in department_names(fake, count):
+            cursor.execute(insert_department_sql, (name, fake.sentence()))
+            department_ids.append(cursor.lastrowid)
+        print(f"seed `department` with {count} rows - SUCCESS ✅")
+        return department_ids
     except Exception as e:
         raise e
     finally:
@@ -62,85 +144,63 @@ def seed_department():
         cursor.close()
 
 
-# insert fake data into `address` table
-def seed_address():
-    cursor = db_conn.cursor()
-    try:
-        for fake_user in fake_users:
-            cursor.execute(
-                insert_address_sql,
-                (fake.city(), fake.street_address(), fake.random_element(elements=OrderedDict([(fake.street_name(), 0.3), (None, 0.7)])),
-                 fake.state(), fake.country(), fake.postcode()))
-            fake_user['address_id'] = cursor.lastrowid
-            print(f"seed `address` with id {cursor.lastrowid} - SUCCESS ✅")
-    except Exception as e:
-        raise e
-    finally:
-        db_conn.commit()
-        cursor.close()
+# insert fake data into `address`, `user` and `employee` tables
+def seed_employee(db_conn: Connection, count: int, department_ids: List[int], batch_size: int, workers: int, hash_pool: int) -> None:
+    hashing_service = get_hashing_service()
 
+    # hash a pool of passwords once instead of one per user
+    pool_passwords: List[str] = []
+    pool_hashes: List[str] = []
+    if hash_pool > 0:
+        fake = Faker()
+        pool_passwords = [fake.password() for _ in range(hash_pool)]
+        pool_hashes = hashing_service.hash_many(pool_passwords)
 
-# insert fake data into `user` table
-def seed_user():
-    # hash the password
-    for fake_user in fake_users:
-        fake_user['password_hash'] = ph.hash(fake_user['password_hash'])
+    batches = [(first, min(batch_size, count - first), len(department_ids)) for first in range(0, count, batch_size)]
+    start = time.perf_counter()
+    done = 0
 
-    # insert user and get the user_id
-    cursor = db_conn.cursor()
-    try:
-        for fake_user in fake_users:
-            cursor.execute(
-                insert_user_sql,
-                (fake_user['email'], fake_user['username'], fake_user['password_hash'], fake_user['phone_number'],
-                 fake_user['first_name'], fake_user['last_name'], fake_user['dob'], fake_user['gender'], fake_user['avatar_url'])
-            )
-            fake_user['user_id'] = cursor.lastrowid
-            print(f"seed `user` with id {cursor.lastrowid} - SUCCESS ✅")
-    except Exception as e:
-        raise e
-    finally:
-        db_conn.commit()
-        cursor.close()
+    cursor = db_conn.cursor(cursors.DictCursor)
+    with open(FAKE_USER_CSV, 'w') as f, Pool(workers) as generators:
+        writer = csv.DictWriter(f, fieldnames=['username', 'password'])
+        writer.writeheader()
+        try:
+            # the workers generate the next batches while this one is inserted
+            for employees in generators.imap(generate_employees, batches):
+                if hash_pool > 0:
+                    for i, employee in enumerate(employees, done):
+                        employee['password'] = pool_passwords[i % hash_pool]
+                    password_hashes = [pool_hashes[i % hash_pool] for i in range(done, done + len(employees))]
+                else:
+                    password_hashes = hashing_service.hash_many(employee['password'] for employee in employees)
 
+                insert_employees(cursor, employees, password_hashes, department_ids)
+                db_conn.commit()
 
-# insert fake data into `employee` table
-def seed_employee():
-    # generate fake employee data
-    fake_employees = [{
-        'salary': fake.random_int(min=2000, max=9999),
-        'role': fake.random_element(elements=('manager', 'admin', 'cashier', 'runner')),
-        'start_at': fake.date_between(start_date=fake_user['dob']),
-        'end_at': None,
-        'user_id': fake_user['user_id'],
-        'address_id': fake_user['address_id'],
-        'department_id': fake.random_element(elements=tuple(fake_department_ids))
-    } for fake_user in fake_users]
-    # update the 'end_at' to be after 'start_at'
-    for fake_employee in fake_employees:
-        fake_employee['end_at'] = fake.random_element(elements=OrderedDict(
-            [(fake.date_between(start_date=fake_employee['start_at']), 0.3), (None, 0.7)])),
+                # save fake_user login credentials to a csv file
+                writer.writerows({'username': employee['username'], 'password': employee['password']} for employee in employees)
 
-    cursor = db_conn.cursor()
-    try:
-        for fake_employee in fake_employees:
-            cursor.execute(insert_employee_sql, tuple(fake_employee.values()))
-            print(f"seed `employee` with id {cursor.lastrowid} - SUCCESS ✅")
-    except Exception as e:
-        raise e
-    finally:
-        db_conn.commit()
-        cursor.close()
+                done += len(employees)
+                print(f"\rseed `employee` {done}/{count} ({done / (time.perf_counter() - start):.0f} rows/s)", end='', flush=True)
+        except Exception as e:
+            db_conn.rollback()
+            raise e
+        finally:
+            cursor.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\rseed `employee` with {count} rows in {elapsed:.1f}s ({count / elapsed:.0f} rows/s) - SUCCESS ✅")
 
 
-def seed():
-    seed_department()
-    seed_address()
-    seed_user()
-    seed_employee()
+def seed(db_conn: Connection, count: int, departments: int, batch_size: int, workers: int, hash_pool: int) -> None:
+    department_ids = seed_department(db_conn, departments)
+    seed_employee(db_conn, count, department_ids, batch_size, workers, hash_pool)
+    documents = backfill_if_enabled(db_conn)
+    if documents is not None:
+        print(f"seed `employee_document` with {documents} documents - SUCCESS ✅")
 
 
-def clean():
+def clean(db_conn: Connection) -> None:
     cursor = db_conn.cursor()
     try:
         cursor.execute("DELETE FROM employee")
@@ -159,16 +219,39 @@ def clean():
 
 
 if __name__ == "__main__":
-    # save fake_user login credentials to a csv file
-    with open(FAKE_USER_CSV, 'w') as f:
-        writer = csv.DictWriter(f, fieldnames=['username', 'password'])
-        writer.writeheader()
-        for fake_user in fake_users:
-            writer.writerow(
-                {'username': fake_user['username'], 'password': fake_user['password_hash']})
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=NUM_EMPLOYEES, help='number of employees')
+    parser.add_argument('--departments', type=int, default=NUM_DEPARTMENT, help='number of departments')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='employees per insert and transaction')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes generating the fakes')
+    parser.add_argument('--hash-pool', type=int, default=0,
+                        help='number of distinct passwords to hash and reuse (0 hashes every password)')
+    args = parser.parse_args()
+
+    # initialize the config (setup environment var)
+    config = Config()
 
-    # clean the db
-    clean()
+    # initialize password hasher
+    init_hashing_service(config)
 
-    # seed the db
-    seed()
+    # initialize the employee read model
+    init_employee_documents(config)
+
+    # connect to rds (mysql)
+    db_conn = connections.Connection(
+        host=config.database_host,
+        port=config.database_port,
+        user=config.database_user,
+        password=config.database_password,
+        db=config.database_db
+    )
+
+    try:
+        # clean the db
+        clean(db_conn)
+
+        # seed the db
+        seed(db_conn, args.count, args.departments, args.batch_size, args.workers, args.hash_pool)
+    finally:
+        get_hashing_service().close()
+        db_conn.close()
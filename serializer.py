@@ -0,0 +1,219 @@
+import gzip
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+from flask import Flask, current_app, has_app_context, json, request
+from flask.wrappers import Response
+from werkzeug.http import http_date
+from config import Config
+from metrics import get_metrics
+
+try:
+    import orjson
+except ImportError:
+    # without orjson responses are encoded with flask's json encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    # without brotli large responses are only ever gzipped
+    brotli = None
+
+
+class JSONProvider:
+    """
+    The interface a json provider has to implement. `dumps` returns the
+    encoded document as utf-8 bytes, ready to be used as a response body.
+    """
+
+    name = ''
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: Any) -> Any:
+        raise NotImplementedError
+
+
+class FlaskJSONProvider(JSONProvider):
+    """
+    Encodes with flask's json module (and so the app's json_encoder), in the
+    compact, unsorted utf-8 form orjson produces, so both providers return
+    the same bytes.
+    """
+
+    name = 'flask'
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':'), sort_keys=False, ensure_ascii=False).encode()
+
+    def loads(self, data: Any) -> Any:
+        return json.loads(data)
+
+
+_default_provider = FlaskJSONProvider()
+
+
+_weekdays = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_months = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _http_date(value: date) -> str:
+    # the same string werkzeug's http_date gives for the naive (utc) dates and
+    # datetimes read from mysql, formatted without its timezone conversions
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return http_date(value)
+        clock = f"{value.hour:02d}:{value.minute:02d}:{value.second:02d}"
+    else:
+        clock = '00:00:00'
+    return f"{_weekdays[value.weekday()]}, {value.day:02d} {_months[value.month - 1]} {value.year:04d} {clock} GMT"
+
+
+def _orjson_default(obj: Any) -> Any:
+    # match the output of flask's encoder so clients see the same documents
+    if isinstance(obj, date):
+        return _http_date(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Encodes with orjson, which serializes dicts, lists and the __slots__
+    dataclass records in native code. Dates and decimals are passed back to
+    python so they are encoded exactly as flask's encoder would.
+    """
+
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        if orjson is None:
+            raise Exception("JSON_PROVIDER is 'orjson' but the 'orjson' package is not installed")
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def loads(self, data: Any) -> Any:
+        return orjson.loads(data)
+
+
+class ResponseCompression:
+    """
+    Compresses json responses of at least `min_size` bytes with brotli (when
+    installed) or gzip, whichever the client accepts. Streamed responses and
+    responses that are already encoded are left untouched.
+    """
+
+    def __init__(self, min_size: int, gzip_level: int, brotli_quality: int) -> None:
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, accept_encoding: Any) -> Optional[str]:
+        if brotli is not None and accept_encoding['br'] > 0:
+            return 'br'
+        if accept_encoding['gzip'] > 0:
+            return 'gzip'
+        return None
+
+    @staticmethod
+    def _skip(response: Any) -> bool:
+        return (response.mimetype != 'application/json' or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code == 204)
+
+    def compress(self, response: Response, accept_encoding: Any) -> Response:
+        if self._skip(response) or response.is_streamed or response.direct_passthrough:
+            return response
+        return self._compress_body(response, response.get_data(), accept_encoding)
+
+    async def compress_async(self, response: Any, accept_encoding: Any) -> Any:
+        """
+        `compress` for the responses of the asgi app, whose body is read
+        with a coroutine.
+        """
+        if self._skip(response):
+            return response
+        return self._compress_body(response, await response.get_data(), accept_encoding)
+
+    def _compress_body(self, response: Any, body: bytes, accept_encoding: Any) -> Any:
+        if len(body) < self.min_size:
+            return response
+
+        # the body depends on accept-encoding even when it is not compressed
+        response.vary.add('Accept-Encoding')
+        encoding = self._choose_encoding(accept_encoding)
+        if encoding == 'br':
+            response.set_data(brotli.compress(body, quality=self.brotli_quality))
+        elif encoding == 'gzip':
+            response.set_data(gzip.compress(body, compresslevel=self.gzip_level))
+        else:
+            return response
+
+        response.headers['Content-Encoding'] = encoding
+        # the compressed bytes differ from the ones a strong etag was made
+        # for, so the etag is only a weak validator from here on
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def create_json_provider(config: Config) -> JSONProvider:
+    if config.json_provider == 'orjson':
+        return OrjsonProvider()
+    if config.json_provider == 'flask':
+        return FlaskJSONProvider()
+    raise Exception(f"unknown JSON_PROVIDER '{config.json_provider}'")
+
+
+def create_compression(config: Config) -> Optional[ResponseCompression]:
+    if config.compress_min_size <= 0:
+        return None
+    return ResponseCompression(config.compress_min_size, config.compress_gzip_level, config.compress_brotli_quality)
+
+
+def init_app(app: Flask, provider: JSONProvider, compression: Optional[ResponseCompression] = None) -> None:
+    """
+    Register the json provider used by `json_response` and, if given, compress
+    large json responses after every request.
+    """
+    app.extensions['json_provider'] = provider
+
+    if compression is not None:
+        @app.after_request
+        def compress_response(response: Response) -> Response:
+            return compression.compress(response, request.accept_encodings)
+
+
+def set_default_json_provider(provider: JSONProvider) -> None:
+    """
+    Set the json provider used outside of a flask app context, by the asgi
+    app and the handlers it runs on threads.
+    """
+    global _default_provider
+    _default_provider = provider
+
+
+def get_json_provider() -> JSONProvider:
+    if not has_app_context():
+        return _default_provider
+    return current_app.extensions.get('json_provider') or _default_provider
+
+
+def json_response(obj: Any, status: int = 200, headers: Optional[dict[str, str]] = None, response_class: type = Response) -> Response:
+    """
+    A faster jsonify, encoding the object with the app's json provider. The
+    asgi app passes its own `response_class`.
+    """
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return response_class(get_json_provider().dumps(obj), status=status, headers=headers, mimetype='application/json')
+    start = time.perf_counter()
+    body = get_json_provider().dumps(obj)
+    metrics.observe_json('encode', time.perf_counter() - start)
+    return response_class(body, status=status, headers=headers, mimetype='application/json')
+
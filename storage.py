@@ -0,0 +1,121 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+from boto3 import client
+from botocore.config import Config as BotoConfig
+from avatar import Avatar, make_variants
+from config import Config
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class S3Storage:
+    """
+    A long-lived, thread-safe wrapper around a single s3 client. The bucket
+    region used to build public urls is looked up once and cached.
+    """
+
+    def __init__(self, bucket_id: str, max_attempts: int, max_connections: int, endpoint_url: Optional[str] = None) -> None:
+        self.bucket_id = bucket_id
+        self.max_attempts = max_attempts
+        self.endpoint_url = endpoint_url
+        self._client = client('s3', endpoint_url=endpoint_url, config=BotoConfig(
+            max_pool_connections=max_connections,
+            retries={'total_max_attempts': max_attempts, 'mode': 'standard'},
+        ))
+        self._region: Optional[str] = None
+        self._region_lock = threading.Lock()
+
+    def region(self) -> str:
+        if self._region is None:
+            with self._region_lock:
+                if self._region is None:
+                    location = self._client.get_bucket_location(Bucket=self.bucket_id)['LocationConstraint']
+                    # buckets in us-east-1 report no location constraint
+                    self._region = location if location is not None else 'us-east-1'
+        return self._region
+
+    def url_for(self, key: str) -> str:
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket_id}/{key}"
+        return f"https://{self.bucket_id}.s3-{self.region()}.amazonaws.com/{key}"
+
+    def put(self, key: str, body: bytes, content_type: str) -> str:
+        """
+        Upload an object and return its public url. Failures are retried by
+        botocore (up to `max_attempts`, with exponential backoff).
+        """
+        metrics = get_metrics()
+        start = time.perf_counter()
+        try:
+            self._client.put_object(Bucket=self.bucket_id, Key=key, Body=body, ContentType=content_type)
+        except Exception as e:
+            if metrics.enabled:
+                metrics.observe_s3_upload('error', time.perf_counter() - start)
+            raise e
+        if metrics.enabled:
+            metrics.observe_s3_upload('ok', time.perf_counter() - start)
+        return self.url_for(key)
+
+
+class AvatarUploadQueue:
+    """
+    Uploads avatars, along with resized webp variants of them, on a pool of
+    background threads so requests do not wait on s3. Once an upload finishes
+    (or finally fails), `on_complete` is called with the username, the avatar
+    url (None on failure) and a json object mapping each variant size to its
+    url. Avatars larger than `max_size` bytes are rejected before they are
+    decoded.
+    """
+
+    def __init__(self, storage: S3Storage, workers: int, max_size: int, variant_sizes: List[int],
+                 on_complete: Callable[[str, Optional[str], Optional[str]], None]) -> None:
+        self.storage = storage
+        self.max_size = max_size
+        self.variant_sizes = variant_sizes
+        self.on_complete = on_complete
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='avatar-upload')
+
+    def _upload(self, username: str, avatar: Avatar) -> Optional[str]:
+        key = f"{username}_avatar.{avatar.extension}"
+        try:
+            avatar_url = self.storage.put(key, avatar.body, avatar.content_type)
+        except Exception as e:
+            logger.error("failed to upload avatar '%s': %s", key, e)
+            avatar_url = None
+
+        variant_urls: dict[str, str] = {}
+        if avatar_url is not None:
+            for size, body in make_variants(avatar, self.variant_sizes).items():
+                try:
+                    variant_urls[str(size)] = self.storage.put(
+                        f"{username}_avatar_{size}.webp", body, 'image/webp')
+                except Exception as e:
+                    logger.error("failed to upload %spx avatar variant of '%s': %s", size, username, e)
+
+        try:
+            self.on_complete(username, avatar_url,
+                             json.dumps(variant_urls) if avatar_url is not None else None)
+        except Exception:
+            logger.exception("failed to record avatar upload of '%s'", username)
+        return avatar_url
+
+    def enqueue(self, username: str, avatar: Avatar) -> Future:
+        return self._executor.submit(self._upload, username, avatar)
+
+    def close(self) -> None:
+        # wait for the queued uploads so no employee is left pending
+        self._executor.shutdown(wait=True)
+
+
+def create_storage(config: Config) -> S3Storage:
+    return S3Storage(
+        bucket_id=config.s3_bucket_id,
+        max_attempts=config.s3_upload_max_attempts,
+        max_connections=config.s3_upload_workers,
+        endpoint_url=config.s3_endpoint_url or None,
+    )
@@ -0,0 +1,34 @@
+import json
+from datetime import datetime
+import pytest
+
+NOW = datetime(2021, 12, 20, 10, 0, 0, 123456)
+
+
+@pytest.fixture
+def employee_row():
+    """
+    Build a row of employee_lookup_view (or employee_document) the way mysql
+    returns it, for the fake connections of the handler tests.
+    """
+    def build(employee_id=1, username='alice', address_id=3, department_id=None, **columns):
+        return {
+            'employee_id': employee_id, 'salary': 3000, 'role': 'admin', 'start_at': '2020-01-01', 'end_at': None,
+            'created_at': NOW, 'updated_at': NOW,
+            'user': json.dumps({
+                'user_id': employee_id + 1, 'email': f'{username}@example.com', 'username': username,
+                'phone_number': '+6012-3456789', 'first_name': 'Alice', 'last_name': 'Tan', 'dob': '1990-01-01',
+                'gender': 'female', 'avatar_url': None, 'avatar_status': 'none', 'avatar_variants': None,
+                'created_at': str(NOW), 'updated_at': str(NOW)}),
+            'department': json.dumps({
+                'department_id': department_id, 'name': 'Sales' if department_id is not None else None,
+                'description': None, 'created_at': str(NOW) if department_id is not None else None,
+                'updated_at': str(NOW) if department_id is not None else None}),
+            'address': json.dumps({
+                'address_id': address_id, 'city': 'Kuala Lumpur' if address_id is not None else None,
+                'line1': '1 Jalan' if address_id is not None else None, 'line2': None,
+                'state': 'WP' if address_id is not None else None, 'country': 'Malaysia' if address_id is not None else None,
+                'postal_code': '50000' if address_id is not None else None}),
+            **columns,
+        }
+    return build
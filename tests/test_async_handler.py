@@ -0,0 +1,113 @@
+import asyncio
+import json
+import pytest
+from pymysql import OperationalError
+from werkzeug.exceptions import NotFound
+import async_handler
+from cache import EmployeeCache, MemoryBackend
+
+
+class FakeCursor:
+    # an aiomysql cursor answering every statement with the given rows
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    async def execute(self, query, args=None):
+        self.conn.executed.append((query, args))
+        self.result = self.conn.rows
+
+    async def fetchone(self):
+        return self.result[0] if self.result else None
+
+    async def fetchall(self):
+        return self.result
+
+    async def close(self):
+        self.conn.closed_cursors += 1
+
+
+class FakeConnection:
+    def __init__(self, rows=(), down=False):
+        self.rows = list(rows)
+        self.down = down
+        self.executed = []
+        self.closed_cursors = 0
+
+    async def cursor(self):
+        return FakeCursor(self)
+
+    async def ping(self, reconnect=True):
+        if self.down:
+            raise OperationalError(2013, "Lost connection to MySQL server during query")
+
+
+class FakePool:
+    size, freesize, maxsize = 2, 1, 10
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.released = []
+
+    async def acquire(self):
+        return self.conn
+
+    def release(self, conn):
+        self.released.append(conn)
+
+
+def _json(resp):
+    return json.loads(asyncio.run(resp.get_data()))
+
+
+def _cache():
+    return EmployeeCache(MemoryBackend(100), ttl=60, analytics_ttl=10)
+
+
+def test_ready_when_a_pooled_connection_reaches_the_server():
+    pool = FakePool(FakeConnection())
+    resp = asyncio.run(async_handler.handle_readiness(pool))
+    assert resp.status_code == 200
+    assert _json(resp) == {'status': 'ready', 'pool': {'size': 2, 'idle': 1, 'in_use': 1, 'max_size': 10}}
+    assert pool.released == [pool.conn]
+
+
+def test_unavailable_when_the_server_is_unreachable():
+    pool = FakePool(FakeConnection(down=True))
+    resp = asyncio.run(async_handler.handle_readiness(pool))
+    assert resp.status_code == 503
+    assert _json(resp)['status'] == 'unavailable'
+    assert pool.released == [pool.conn]
+
+
+def test_fetch_one_decodes_the_row_and_caches_it(employee_row):
+    conn, cache = FakeConnection([employee_row()]), _cache()
+    resp = asyncio.run(async_handler.handle_fetch_one_employee(conn, 'alice', cache))
+    assert resp.status_code == 200
+    assert _json(resp)['user']['username'] == 'alice'
+    assert conn.executed[0][1] == 'alice' and conn.closed_cursors == 1
+
+    conn.executed.clear()
+    resp = asyncio.run(async_handler.handle_fetch_one_employee(conn, 'alice', cache))
+    assert _json(resp)['user']['username'] == 'alice'
+    assert conn.executed == []
+
+
+def test_fetch_one_of_an_unknown_username_is_not_found():
+    conn = FakeConnection()
+    with pytest.raises(NotFound):
+        asyncio.run(async_handler.handle_fetch_one_employee(conn, 'nobody'))
+    assert conn.closed_cursors == 1
+
+
+def test_batch_get_queries_only_the_missing_usernames(employee_row):
+    cache = _cache()
+    conn = FakeConnection([employee_row(requested='alice')])
+    asyncio.run(async_handler.handle_batch_get_employees(conn, {'usernames': ['alice']}, cache))
+
+    conn = FakeConnection([employee_row(employee_id=5, username='bobby', requested='bobby')])
+    resp = asyncio.run(async_handler.handle_batch_get_employees(conn, {'usernames': ['alice', 'bobby', 'carol']}, cache))
+    assert conn.executed[0][1] == ('bobby', 'carol')
+    data = _json(resp)['data']
+    assert [entry['found'] for entry in data] == [True, True, False]
+    assert data[1]['employee']['user']['username'] == 'bobby'
@@ -0,0 +1,136 @@
+import base64
+import io
+import pytest
+from werkzeug.exceptions import BadRequest, LengthRequired, RequestEntityTooLarge
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+from avatar import Avatar, decode_data_url, make_variants, read_avatar_stream, read_avatar_upload, sniff_image_type
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# the variants are only made with pillow installed
+needs_pillow = pytest.mark.skipif(Image is None, reason="pillow is not installed")
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+
+
+def _data_url(body, mime='image/png'):
+    return f"data:{mime};base64," + base64.b64encode(body).decode()
+
+
+@pytest.mark.parametrize('head, extension', [
+    (b'\xff\xd8\xff\xe0', 'jpeg'),
+    (PNG, 'png'),
+    (b'GIF89a', 'gif'),
+    (b'RIFF\x00\x00\x00\x00WEBPVP8 ', 'webp'),
+    (b'  <svg xmlns="http://www.w3.org/2000/svg">', 'svg'),
+    (b'<?xml version="1.0"?><svg>', 'svg'),
+    (b'%PDF-1.4', None),
+])
+def test_image_type_is_sniffed_from_the_bytes(head, extension):
+    assert sniff_image_type(head) == extension
+
+
+def test_data_url_is_decoded():
+    avatar = decode_data_url(_data_url(PNG), 1024)
+    assert (avatar.extension, avatar.content_type, avatar.body) == ('png', 'image/png', PNG)
+
+
+def test_data_url_type_comes_from_the_bytes_not_the_header():
+    assert decode_data_url(_data_url(PNG, 'image/jpeg'), 1024).extension == 'png'
+
+
+def test_data_url_larger_than_the_max_is_rejected_before_decoding():
+    with pytest.raises(RequestEntityTooLarge):
+        decode_data_url(_data_url(PNG), len(PNG) - 1)
+
+
+@pytest.mark.parametrize('data_url', [
+    'data:image/png,' + base64.b64encode(PNG).decode(),
+    'data:image/png;base64,' + base64.b64encode(PNG).decode()[:-1],
+    'data:image/png;base64,' + '!' * 8,
+    _data_url(b'not an image'),
+])
+def test_invalid_data_url_is_a_bad_request(data_url):
+    with pytest.raises(BadRequest):
+        decode_data_url(data_url, 1024)
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, body):
+        super().__init__(body)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def test_stream_is_rejected_once_it_grows_past_the_max():
+    stream = CountingStream(PNG * 10000)
+    with pytest.raises(RequestEntityTooLarge):
+        read_avatar_stream(stream, 64 * 1024)
+    assert stream.reads == 2
+
+
+def test_stream_with_a_declared_length_past_the_max_is_not_read():
+    stream = CountingStream(PNG)
+    with pytest.raises(RequestEntityTooLarge):
+        read_avatar_stream(stream, 10, len(PNG))
+    assert stream.reads == 0
+
+
+def _multipart_request(body, **kwargs):
+    return Request(EnvironBuilder(method='PUT', data={'avatar': (io.BytesIO(body), 'avatar.png')}, **kwargs).get_environ())
+
+
+def test_multipart_upload_is_read():
+    assert read_avatar_upload(_multipart_request(PNG), 1024).body == PNG
+
+
+def test_multipart_upload_past_the_max_is_rejected_before_the_form_is_parsed():
+    request = _multipart_request(PNG * 1000)
+    with pytest.raises(RequestEntityTooLarge):
+        read_avatar_upload(request, 1024)
+    assert 'files' not in request.__dict__
+
+
+def test_multipart_upload_without_a_length_is_rejected():
+    request = _multipart_request(PNG)
+    request.environ.pop('CONTENT_LENGTH')
+    with pytest.raises(LengthRequired):
+        read_avatar_upload(request, 1024)
+
+
+def _png(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), 'red').save(buffer, format='PNG')
+    return Avatar('png', 'image/png', buffer.getvalue())
+
+
+@needs_pillow
+def test_variants_are_resized_from_the_avatar():
+    variants = make_variants(_png(300), [64, 128])
+    assert sorted(variants) == [64, 128]
+    assert Image.open(io.BytesIO(variants[64])).size == (64, 64)
+
+
+@needs_pillow
+def test_variants_made_before_a_resize_fails_are_kept(monkeypatch):
+    fit = ImageOps.fit
+
+    def failing_fit(image, size, *args):
+        if size == (64, 64):
+            raise OSError("image file is truncated")
+        return fit(image, size, *args)
+
+    monkeypatch.setattr(ImageOps, 'fit', failing_fit)
+    assert sorted(make_variants(_png(300), [64, 128])) == [128]
+
+
+@needs_pillow
+def test_unreadable_avatar_has_no_variants():
+    assert make_variants(Avatar('png', 'image/png', PNG), [64]) == {}
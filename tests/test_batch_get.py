@@ -0,0 +1,26 @@
+from handler import _batch_get_result, _cached_employees, _missing_employees
+from query import build_select_employees_by_sql, employee_view_source
+
+
+def test_usernames_are_matched_by_mysql():
+    sql = ' '.join(build_select_employees_by_sql('username', 2, employee_view_source).split())
+    assert sql.startswith("SELECT requested.value AS requested,")
+    assert "FROM (SELECT %s AS value UNION ALL SELECT %s AS value) AS requested" in sql
+
+
+def test_employee_ids_are_matched_by_the_primary_key():
+    sql = ' '.join(build_select_employees_by_sql('employee_id', 2, employee_view_source).split())
+    assert "requested" not in sql
+    assert sql.endswith("WHERE employee_id IN (%s, %s)")
+
+
+def test_rows_are_found_by_the_requested_username(employee_row):
+    values = ['Alice', 'alice', 'Álice', 'bob']
+    found, versions = _cached_employees('username', values, None)
+    missing = _missing_employees('username', values, found)
+    assert missing == values
+    # mysql's collation matches all three spellings to the one employee
+    result = [employee_row(requested=value) for value in values[:3]]
+    data = _batch_get_result('username', values, found, result, None, versions)['data']
+    assert [entry['found'] for entry in data] == [True, True, True, False]
+    assert all(entry['employee'].user.username == 'alice' for entry in data[:3])
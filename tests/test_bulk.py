@@ -0,0 +1,137 @@
+import unicodedata
+import pytest
+from pymysql import IntegrityError
+import hashing
+from handler import handle_bulk_create_employees
+from hashing import PasswordHashingService
+
+
+def _collate(value):
+    # mysql's utf8mb4_0900_ai_ci, ignoring case and accents
+    return ''.join(c for c in unicodedata.normalize('NFKD', value) if not unicodedata.combining(c)).casefold()
+
+
+class BulkCursor:
+    """
+    Answers the statements of a bulk create like mysql would, with the users
+    of `conn.users` (matched through the collation) and one department,
+    `Sales`. Users in `conn.racing` are only seen by the unique index.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+        self._result = []
+
+    def execute(self, query, args=()):
+        query = ' '.join(query.split())
+        self.conn.statements.append(query)
+        self._result = []
+        if query.startswith('SELECT requested.value AS requested FROM'):
+            half = len(args) // 2
+            self._result = [{'requested': value} for value in args[:half] if _collate(value) in self.conn.users] + \
+                [{'requested': value} for value in args[half:] if _collate(value) in self.conn.emails]
+        elif query.startswith('SELECT requested.value AS requested, department_id'):
+            self._result = [{'requested': value, 'department_id': 7} for value in args if _collate(value) == 'sales']
+        elif query.startswith('SELECT user_id, username FROM user'):
+            self._result = [{'user_id': self.conn.users[_collate(value)], 'username': value} for value in args]
+        elif query.startswith('INSERT INTO address'):
+            # ids are not consecutive, other sessions insert in between
+            self.conn.next_id += 10
+            self.lastrowid = self.conn.next_id
+        elif query.startswith('INSERT INTO employee'):
+            self.conn.employees.append(args)
+        elif query.startswith('ROLLBACK TO SAVEPOINT'):
+            self.conn.users = dict(self.conn.saved_users)
+        elif query.startswith('SAVEPOINT'):
+            self.conn.saved_users = dict(self.conn.users)
+        return len(self._result)
+
+    def executemany(self, query, args):
+        if 'INSERT INTO user' in query:
+            keys = [_collate(row[1]) for row in args]
+            if len(set(keys)) < len(keys) or any(k in self.conn.users or k in self.conn.racing for k in keys):
+                raise IntegrityError(1062, "Duplicate entry for key 'user.username'")
+            for key in keys:
+                self.conn.next_id += 1
+                self.conn.users[key] = self.conn.next_id
+            self.conn.statements.append('INSERT INTO user')
+            return len(args)
+        for row in args:
+            self.execute(query, row)
+        return len(args)
+
+    def fetchall(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class BulkConnection:
+    def __init__(self, users=(), racing=()):
+        self.users = {_collate(u): i for i, u in enumerate(users, 1)}
+        self.emails = {_collate(f'{u}@example.com') for u in users}
+        self.racing = {_collate(u) for u in racing}
+        self.saved_users = {}
+        self.next_id = 100
+        self.statements = []
+        self.employees = []
+
+    def cursor(self):
+        return BulkCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        raise AssertionError("the batch must not be rolled back")
+
+
+@pytest.fixture(autouse=True)
+def fast_hashing(monkeypatch):
+    monkeypatch.setattr(hashing, '_service', PasswordHashingService(time_cost=1, memory_cost=1024, parallelism=1, workers=0))
+
+
+def _row(username, **fields):
+    return {'email': f'{username}@example.com', 'username': username, 'password': 'a password', 'phone_number': '+6012-3456789',
+            'first_name': 'Alice', 'last_name': 'Tan', 'gender': 'female', 'dob': '1990-01-01', 'role': 'admin',
+            'start_at': '2020-01-01', **fields}
+
+
+def _create(conn, rows):
+    return handle_bulk_create_employees(conn, rows).get_json()
+
+
+def test_duplicates_in_the_body_compare_like_mysql():
+    resp = _create(BulkConnection(), [_row('alice'), _row('Alice'), _row('Álice')])
+    assert resp['created'] == ['alice']
+    assert [e['index'] for e in resp['errors']] == [1, 2]
+
+
+def test_existing_users_are_matched_by_mysql():
+    resp = _create(BulkConnection(users=['alice']), [_row('Alice'), _row('bobby')])
+    assert resp['created'] == ['bobby']
+    assert resp['errors'] == [{'index': 0, 'error': "employee with username 'Alice' or email 'Alice@example.com' already exists"}]
+
+
+def test_department_is_matched_by_mysql():
+    conn = BulkConnection()
+    resp = _create(conn, [_row('alice', department='sales')])
+    assert resp['created'] == ['alice']
+    assert conn.employees[0][-1] == 7
+
+
+def test_user_taken_after_validation_fails_only_its_row():
+    conn = BulkConnection(racing=['bobby'])
+    resp = _create(conn, [_row('alice'), _row('bobby'), _row('carol')])
+    assert resp['created'] == ['alice', 'carol']
+    assert [e['index'] for e in resp['errors']] == [1]
+    assert 'ROLLBACK TO SAVEPOINT bulk_chunk' in conn.statements
+
+
+def test_address_ids_are_read_back_per_row():
+    address = {'city': 'Ipoh', 'line1': '2 Jalan', 'state': 'Perak', 'country': 'Malaysia', 'postal_code': '30000'}
+    conn = BulkConnection()
+    _create(conn, [_row('alice', address=address), _row('bobby'), _row('carol', address=address)])
+    assert [employee[5] for employee in conn.employees] == [110, None, 120]
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+from cache import EmployeeCache, MemoryBackend
+
+
+def _cache():
+    return EmployeeCache(MemoryBackend(100), ttl=60, analytics_ttl=10)
+
+
+def _employee(username):
+    return SimpleNamespace(user=SimpleNamespace(username=username))
+
+
+def test_read_through_is_served_from_any_case():
+    cache = _cache()
+    employee, version = cache.get('Alice')
+    assert employee is None
+    cache.set('Alice', _employee('alice'), version)
+    assert cache.get('ALICE')[0] is not None
+    assert cache.stats()['hits'] == 1
+
+
+def test_invalidation_in_another_case_drops_the_entry():
+    cache = _cache()
+    cache.set('alice', _employee('alice'), cache.get('alice')[1])
+    cache.invalidate('ALICE')
+    assert cache.get('alice')[0] is None
+
+
+def test_read_racing_a_write_does_not_reinstate_stale_data():
+    cache = _cache()
+    # a read misses and queries mysql...
+    _, version = cache.get('alice')
+    # ...while a write commits and invalidates...
+    cache.invalidate('alice')
+    # ...then the read caches what it read before the write
+    cache.set('alice', _employee('alice'), version)
+    assert cache.get('alice')[0] is None
+
+    # the next read-through is cached again
+    _, version = cache.get('alice')
+    cache.set('alice', _employee('alice'), version)
+    assert cache.get('alice')[0] is not None
+
+
+def test_collation_matches_of_another_username_are_not_cached():
+    cache = _cache()
+    # mysql finds 'alice' for 'álice', which her writes would not invalidate
+    cache.set('álice', _employee('alice'), cache.get('álice')[1])
+    assert cache.get('álice')[0] is None
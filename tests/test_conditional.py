@@ -0,0 +1,39 @@
+import pytest
+from flask import Flask, request
+from handler import _conditional_response
+from serializer import FlaskJSONProvider, ResponseCompression, init_app
+
+BODY = {'data': [{'employee_id': i, 'role': 'admin'} for i in range(100)]}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_app(app, FlaskJSONProvider(), ResponseCompression(1024, 6, 4))
+
+    @app.route('/employees')
+    def employees():
+        return _conditional_response(BODY, 'v1', None, request.if_none_match)
+
+    return app.test_client()
+
+
+def test_matching_if_none_match_is_not_modified(client):
+    etag = client.get('/employees').headers['ETag']
+    resp = client.get('/employees', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_stale_if_none_match_sends_the_body(client):
+    resp = client.get('/employees', headers={'If-None-Match': '"v0"'})
+    assert resp.status_code == 200
+    assert resp.json == BODY
+
+
+def test_compressed_response_has_a_weak_etag_that_still_matches(client):
+    resp = client.get('/employees', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.headers['ETag'] == 'W/"v1"'
+    resp = client.get('/employees', headers={'If-None-Match': resp.headers['ETag'], 'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 304
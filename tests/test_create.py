@@ -0,0 +1,52 @@
+import pytest
+import hashing
+from handler import handle_create_one_employee
+from hashing import PasswordHashingService
+
+
+class CreateCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+
+    def execute(self, query, args=None):
+        query = ' '.join(query.split())
+        self.conn.statements.append(query)
+        self.lastrowid = len(self.conn.statements)
+        return 1
+
+    def fetchone(self):
+        return self.conn.employee_row(address_id=None)
+
+    def close(self):
+        pass
+
+
+class CreateConnection:
+    def __init__(self, employee_row):
+        self.employee_row = employee_row
+        self.statements = []
+
+    def cursor(self):
+        return CreateCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        raise AssertionError("the create must not be rolled back")
+
+
+@pytest.fixture(autouse=True)
+def fast_hashing(monkeypatch):
+    monkeypatch.setattr(hashing, '_service', PasswordHashingService(time_cost=1, memory_cost=1024, parallelism=1, workers=0))
+
+
+def test_employee_without_a_department_or_address_is_created(employee_row):
+    conn = CreateConnection(employee_row)
+    resp = handle_create_one_employee(conn, {
+        'email': 'alice@example.com', 'username': 'alice', 'password': 'a password', 'phone_number': '+6012-3456789',
+        'first_name': 'Alice', 'last_name': 'Tan', 'gender': 'female', 'dob': '1990-01-01', 'role': 'admin',
+        'start_at': '2020-01-01'}, avatar_uploads=None)
+    assert resp.status_code == 200
+    assert [s.split()[0] + ' ' + s.split()[2] for s in conn.statements[:2]] == ['INSERT user', 'INSERT employee']
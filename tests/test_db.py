@@ -0,0 +1,97 @@
+import time
+from types import SimpleNamespace
+import pytest
+from flask import Flask
+from pymysql import OperationalError
+from pymysql.cursors import DictCursor, SSDictCursor
+from werkzeug.exceptions import ServiceUnavailable
+import db
+
+
+def test_cursors_are_plain_with_metrics_disabled():
+    assert db.cursor_class() is DictCursor
+    assert db.cursor_class(SSDictCursor) is SSDictCursor
+
+
+def test_export_cursor_is_instrumented_with_metrics_enabled(monkeypatch):
+    monkeypatch.setattr(db, 'get_metrics', lambda: SimpleNamespace(enabled=True))
+    cursor_class = db.cursor_class(SSDictCursor)
+    assert issubclass(cursor_class, SSDictCursor) and cursor_class is not SSDictCursor
+    assert db.cursor_class(SSDictCursor) is cursor_class
+
+
+class FakeConnection:
+    def __init__(self):
+        self.open = True
+        self.pings = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.open = False
+
+
+class FakePool(db.ConnectionPool):
+    # connects through a fake factory, failing like pymysql while `down`
+    down = False
+
+    def _connect(self):
+        if self.down:
+            raise OperationalError(2003, "Can't connect to MySQL server")
+        return FakeConnection()
+
+
+def _pool(**kwargs):
+    return FakePool(**{'min_size': 0, 'max_size': 1, 'timeout': 0.05, 'ping_interval': 60, **kwargs})
+
+
+def test_acquire_times_out_when_every_connection_is_in_use():
+    pool = _pool()
+    pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+
+
+def test_release_rolls_back_and_pools_the_connection():
+    pool = _pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    assert conn.rollbacks == 1
+    assert pool.acquire() is conn
+    assert pool.stats() == {'size': 1, 'idle': 0, 'in_use': 1, 'max_size': 1}
+
+
+def test_closed_connection_is_discarded_on_release():
+    pool = _pool()
+    conn = pool.acquire()
+    conn.close()
+    pool.release(conn)
+    assert pool.stats()['size'] == 0
+    assert pool.acquire() is not conn
+
+
+def test_idle_connection_is_pinged_before_it_is_handed_out():
+    pool = _pool(ping_interval=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    time.sleep(0.001)
+    assert pool.acquire().pings == 1
+
+
+def test_database_down_is_a_service_unavailable():
+    pool = _pool()
+    pool.down = True
+    with pytest.raises(db.DatabaseUnavailable):
+        pool.acquire()
+    # the failed connection does not hold a slot
+    assert pool.stats()['size'] == 0
+
+    app = Flask(__name__)
+    db.init_app(app, pool)
+    with app.app_context(), pytest.raises(ServiceUnavailable):
+        db.get_db_conn()
@@ -0,0 +1,89 @@
+import pytest
+from document import EmployeeDocuments, backfill
+from query import build_refresh_employee_documents_sql, employee_document_columns
+
+
+def _sql(query):
+    return ' '.join(query.split())
+
+
+@pytest.mark.parametrize('key, column', [('employee_id', 'employee_id'), ('username', 'lookup_username')])
+def test_documents_are_upserted_from_the_view(key, column):
+    query = _sql(build_refresh_employee_documents_sql(key, 2))
+    columns = f"{employee_document_columns}, lookup_username, lookup_email, lookup_department_id"
+    assert query == _sql(f"""
+        REPLACE INTO employee_document ({columns})
+        SELECT {columns} FROM employee_lookup_view WHERE {column} IN (%s, %s)""")
+
+
+def test_documents_cannot_be_refreshed_by_anything_else():
+    with pytest.raises(Exception):
+        build_refresh_employee_documents_sql('email', 1)
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._result = None
+
+    def execute(self, query, args=None):
+        query = _sql(query)
+        self.conn.statements.append((query.split()[0], args))
+        if 'MIN(employee_id)' in query:
+            self._result = self.conn.id_range
+        elif 'COUNT(*)' in query:
+            self._result = {'count': 42}
+
+    def fetchone(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self, id_range=None):
+        self.id_range = id_range
+        self.statements = []
+
+    def cursor(self, cursor_class=None):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.statements.append(('COMMIT', None))
+
+    def rollback(self):
+        self.statements.append(('ROLLBACK', None))
+
+
+def test_refresh_runs_on_the_writing_cursor_only_when_enabled():
+    conn = RecordingConnection()
+    EmployeeDocuments(False).refresh(conn.cursor(), 'username', ['alice'])
+    EmployeeDocuments(True).refresh(conn.cursor(), 'username', [None])
+    assert conn.statements == []
+    EmployeeDocuments(True).refresh(conn.cursor(), 'username', ['alice', None, 'bobby'])
+    assert conn.statements == [('REPLACE', ('alice', 'bobby'))]
+
+
+def test_documents_are_read_from_the_table_only_when_enabled():
+    assert EmployeeDocuments(True).source == 'employee_document'
+    assert EmployeeDocuments(False).source == 'employee_lookup_view'
+
+
+def test_backfill_commits_per_batch_then_drops_orphans():
+    conn = RecordingConnection({'min_id': 5, 'max_id': 2400})
+    assert backfill(conn, batch_size=1000) == 42
+    assert conn.statements == [
+        ('SELECT', None),
+        ('REPLACE', (5, 1004)), ('COMMIT', None),
+        ('REPLACE', (1005, 2004)), ('COMMIT', None),
+        ('REPLACE', (2005, 3004)), ('COMMIT', None),
+        ('DELETE', None), ('COMMIT', None),
+        ('SELECT', None),
+    ]
+
+
+def test_backfill_of_no_employees_only_drops_orphans():
+    conn = RecordingConnection({'min_id': None, 'max_id': None})
+    assert backfill(conn) == 42
+    assert [s for s, _ in conn.statements] == ['SELECT', 'DELETE', 'COMMIT', 'SELECT']
@@ -0,0 +1,52 @@
+"""
+Query plans checked against a real mysql, the one of the environment
+(DATABASE_*) or else the benchmark database (`make bench-up bench-seed`).
+Skipped when neither is reachable or seeded.
+"""
+import os
+import pytest
+import pymysql
+from pymysql.cursors import DictCursor
+from query import build_select_employee_by_sql, employee_view_source
+
+BENCH_ENV = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'bench.env')
+
+
+def _database_env() -> dict[str, str]:
+    if 'DATABASE_HOST' in os.environ:
+        return os.environ
+    with open(BENCH_ENV) as f:
+        return dict(line.strip().split('=', 1) for line in f if '=' in line and not line.startswith('#'))
+
+
+@pytest.fixture(scope='module')
+def cursor():
+    env = _database_env()
+    try:
+        conn = pymysql.connect(
+            host=env['DATABASE_HOST'], port=int(env.get('DATABASE_PORT', '3306')), user=env['DATABASE_USER'],
+            password=env['DATABASE_PASSWORD'], db=env['DATABASE_DB'], cursorclass=DictCursor, connect_timeout=2)
+    except pymysql.err.OperationalError as e:
+        pytest.skip(f"no mysql to explain the queries on: {e}")
+    with conn, conn.cursor() as cursor:
+        yield cursor
+
+
+@pytest.fixture(scope='module')
+def user(cursor):
+    # mysql reads a unique key lookup while planning, so explaining one that
+    # matches nothing only reports an impossible WHERE
+    cursor.execute("SELECT username, email FROM user LIMIT 1")
+    row = cursor.fetchone()
+    if row is None:
+        pytest.skip("no seeded employee to explain the lookups with")
+    return row
+
+
+@pytest.mark.parametrize('key', ['username', 'email'])
+def test_employee_lookup_uses_the_unique_user_index(cursor, user, key):
+    cursor.execute('EXPLAIN ' + build_select_employee_by_sql(key, employee_view_source), user[key])
+    plan = cursor.fetchall()
+    # the view is merged, so the user row is resolved through its unique index
+    assert [row['key'] for row in plan if row['key'] == key] == [key], plan
+    assert all(row['type'] != 'ALL' for row in plan), plan
@@ -0,0 +1,51 @@
+import threading
+import time
+from argon2 import PasswordHasher
+import hashing
+from hashing import PasswordHashingService
+
+
+def _service(workers):
+    return PasswordHashingService(time_cost=1, memory_cost=1024, parallelism=1, workers=workers)
+
+
+def test_hashes_in_forkserver_processes():
+    service = _service(2)
+    try:
+        hashes = service.hash_many(['first password', 'second password'])
+        assert service._get_executor()._mp_context.get_start_method() == 'forkserver'
+    finally:
+        service.close()
+    assert PasswordHasher().verify(hashes[0], 'first password')
+    assert PasswordHasher().verify(hashes[1], 'second password')
+
+
+def test_hashes_inline_without_workers():
+    service = _service(0)
+    assert PasswordHasher().verify(service.hash('a password'), 'a password')
+    assert service._executor is None
+
+
+def test_threads_hashing_first_share_one_pool(monkeypatch):
+    created = []
+    barrier = threading.Barrier(8)
+
+    class SlowPool:
+        def __init__(self, **kwargs):
+            # widen the window between the check and the assignment
+            time.sleep(0.05)
+            created.append(self)
+
+    monkeypatch.setattr(hashing, 'ProcessPoolExecutor', SlowPool)
+    service = _service(2)
+
+    def first_use():
+        barrier.wait()
+        service._get_executor()
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
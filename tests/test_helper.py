@@ -0,0 +1,97 @@
+import io
+import pytest
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from helper import decode_cursor, encode_cursor, encode_offset_cursor, parse_cursor_pagination, parse_employee_filters, parse_json_list, parse_search_query
+
+
+def _parse(body, mimetype='application/json', max_rows=3, max_size=100, content_length=None):
+    return parse_json_list(io.BytesIO(body), mimetype, max_rows, max_size, content_length)
+
+
+def test_json_array_and_ndjson_bodies():
+    assert _parse(b'[{"a": 1}, {"a": 2}]') == [{'a': 1}, {'a': 2}]
+    assert _parse(b'{"a": 1}\n\n{"a": 2}\n', 'application/x-ndjson') == [{'a': 1}, {'a': 2}]
+
+
+def test_body_must_be_an_array():
+    with pytest.raises(BadRequest):
+        _parse(b'{"a": 1}')
+    with pytest.raises(BadRequest):
+        _parse(b'[1, 2]', 'text/plain')
+
+
+def test_declared_length_over_the_limit_is_rejected_unread():
+    stream = io.BytesIO(b'[]')
+    with pytest.raises(RequestEntityTooLarge):
+        parse_json_list(stream, 'application/json', 3, 100, 101)
+    assert stream.tell() == 0
+
+
+@pytest.mark.parametrize('mimetype', ['application/json', 'application/x-ndjson'])
+def test_body_over_the_limit_is_rejected_while_read(mimetype):
+    body = b'\n'.join([b'{"a": "' + b'x' * 40 + b'"}'] * 3)
+    with pytest.raises(RequestEntityTooLarge):
+        _parse(body, mimetype)
+
+
+def test_ndjson_stops_at_the_row_after_the_limit():
+    body = io.BytesIO(b'{"a": 1}\n{"a": 2}\n{"a": 3}\n' + b'x' * 50)
+    with pytest.raises(BadRequest):
+        parse_json_list(body, 'application/x-ndjson', 2, 100)
+    # the rest of the body is never parsed
+    assert body.read(1) == b'x'
+
+
+def test_json_array_over_the_row_limit_is_rejected():
+    with pytest.raises(BadRequest):
+        _parse(b'[1, 2, 3, 4]')
+
+
+def test_cursor_round_trips():
+    assert decode_cursor(encode_cursor(1234)) == 1234
+    assert decode_cursor(encode_offset_cursor(40), 'offset:') == 40
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', encode_offset_cursor(40), encode_cursor(1)[:-2], ''])
+def test_invalid_cursors_are_bad_requests(cursor):
+    with pytest.raises(BadRequest):
+        decode_cursor(cursor)
+
+
+def test_pagination_defaults_and_bounds():
+    assert parse_cursor_pagination(MultiDict()) == {'cursor': None, 'limit': 100}
+    assert parse_cursor_pagination(MultiDict({'limit': '5000'}))['limit'] == 1000
+    assert parse_cursor_pagination(MultiDict({'cursor': encode_cursor(7), 'limit': '10'})) == {'cursor': 7, 'limit': 10}
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'ten'])
+def test_invalid_limits_are_bad_requests(limit):
+    with pytest.raises(BadRequest):
+        parse_cursor_pagination(MultiDict({'limit': limit}))
+
+
+def test_employee_filters():
+    assert parse_employee_filters(MultiDict({'department': 'Sales', 'role': 'admin', 'active': 'false'})) == {
+        'department': 'Sales', 'role': 'admin', 'active': False}
+    assert parse_employee_filters(MultiDict({'active': 'true'})) == {'active': True}
+    with pytest.raises(BadRequest):
+        parse_employee_filters(MultiDict({'active': 'yes'}))
+
+
+def test_search_query_defaults_and_offset_cursor():
+    assert parse_search_query(MultiDict({'q': ' alice '})) == {'q': 'alice', 'offset': 0, 'limit': 20}
+    assert parse_search_query(MultiDict({'q': 'alice', 'cursor': encode_offset_cursor(40), 'limit': '500'})) == {
+        'q': 'alice', 'offset': 40, 'limit': 100}
+
+
+@pytest.mark.parametrize('args', [
+    {},
+    {'q': '   '},
+    {'q': 'a' * 101},
+    {'q': 'alice', 'cursor': encode_cursor(40)},
+    {'q': 'alice', 'cursor': encode_offset_cursor(-1)},
+])
+def test_invalid_search_queries_are_bad_requests(args):
+    with pytest.raises(BadRequest):
+        parse_search_query(MultiDict(args))
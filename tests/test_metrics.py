@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+import flask
+import pytest
+from flask import Flask
+from pymysql import OperationalError
+from werkzeug.datastructures import MultiDict
+from pymysql.cursors import DictCursor, SSDictCursor
+import metrics
+from handler import handle_export_employees
+from metrics import PrometheusMetrics, instrumented_cursor, statement_label
+
+
+class FakeConnection:
+    """
+    Answers every statement with `affected_rows` like pymysql's result, an
+    unbuffered one reporting 18446744073709551615.
+    """
+
+    def __init__(self, affected_rows):
+        self.affected_rows = affected_rows
+        self._result = None
+
+    def query(self, sql, unbuffered=False):
+        self._result = SimpleNamespace(
+            affected_rows=self.affected_rows, description=None, insert_id=0, rows=None, warning_count=0, has_next=False,
+            _finish_unbuffered_query=lambda: None)
+
+
+@pytest.fixture
+def prometheus(monkeypatch):
+    recorder = PrometheusMetrics()
+    monkeypatch.setattr(metrics, '_metrics', recorder)
+    return recorder
+
+
+def _rows(recorder, statement):
+    return recorder._registry.get_sample_value('db_query_rows_total', {'statement': statement})
+
+
+def _queries(recorder, statement):
+    return recorder._registry.get_sample_value('db_query_duration_seconds_count', {'statement': statement})
+
+
+def test_buffered_statement_counts_its_rows(prometheus):
+    cursor = instrumented_cursor(DictCursor)(FakeConnection(3))
+    cursor.execute("UPDATE `employee` SET salary = 1")
+    assert _queries(prometheus, 'update employee') == 1
+    assert _rows(prometheus, 'update employee') == 3
+
+
+def test_unbuffered_statement_leaves_its_rows_to_the_reader(prometheus):
+    cursor = instrumented_cursor(SSDictCursor)(FakeConnection(18446744073709551615))
+    cursor.execute("SELECT * FROM employee_view")
+    assert _queries(prometheus, 'select employee_view') == 1
+    assert _rows(prometheus, 'select employee_view') == 0
+
+
+class ExportCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, args=None):
+        return 18446744073709551615
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+def test_export_counts_the_streamed_rows(prometheus, employee_row):
+    rows = [employee_row(employee_id=i) for i in range(1200)]
+    conn = SimpleNamespace(cursor=lambda cursor_class: ExportCursor(rows))
+    with Flask(__name__).test_request_context():
+        response = handle_export_employees(conn, MultiDict())
+        b''.join(response.response)
+    assert _rows(prometheus, 'select employee_lookup_view') == 1200
+
+
+@pytest.mark.parametrize('query, label', [
+    ("SELECT * FROM employee_lookup_view WHERE username = %s", 'select employee_lookup_view'),
+    ("  INSERT INTO `user` (email) VALUES (%s)", 'insert user'),
+    ("/*+ MAX_EXECUTION_TIME(250) */ UPDATE employee SET role = %s", 'update employee'),
+    ("DELETE FROM address WHERE address_id = %s", 'delete address'),
+    ("SAVEPOINT bulk_chunk", 'savepoint'),
+    ("", 'unknown'),
+])
+def test_statements_are_labelled_by_verb_and_table(query, label):
+    assert statement_label(query) == label
+
+
+def test_requests_are_labelled_by_route_not_path(prometheus):
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route('/employee/<string:username>')
+    def employee(username):
+        return {'username': username}
+
+    client = app.test_client()
+    client.get('/employee/alice')
+    client.get('/employee/bobby')
+    client.get('/nowhere')
+    registry = prometheus._registry
+    assert registry.get_sample_value('http_request_duration_seconds_count', {
+        'method': 'GET', 'route': '/employee/<string:username>', 'status': '200'}) == 2
+    assert registry.get_sample_value('http_request_duration_seconds_count', {
+        'method': 'GET', 'route': 'unmatched', 'status': '404'}) == 1
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, '_metrics', metrics.Metrics())
+    app = Flask(__name__)
+    metrics.init_app(app)
+    app.route('/healthz')(lambda: {'status': 'ok'})
+    with app.test_client() as client:
+        client.get('/healthz')
+        assert 'request_start' not in flask.g
+
+
+def test_failed_statement_is_still_timed(prometheus):
+    class FailingConnection(FakeConnection):
+        def query(self, sql, unbuffered=False):
+            raise OperationalError(3024, "Query execution was interrupted")
+
+    cursor = instrumented_cursor(DictCursor)(FailingConnection(0))
+    with pytest.raises(OperationalError):
+        cursor.execute("SELECT employee_id FROM employee")
+    assert _queries(prometheus, 'select employee') == 1
@@ -0,0 +1,51 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from model import AddressRecord, DepartmentRecord, UserRecord, decode_employee_projection, decode_employee_row, project_employee
+from serializer import FlaskJSONProvider
+
+NOW = datetime(2021, 12, 20, 10, 0, 0, 123456)
+
+
+def test_projection_of_a_missing_department_is_null():
+    projection = decode_employee_projection({
+        'employee_id': 1, 'department': None, '_employee_updated_at': NOW, '_department_updated_at': None})
+    assert projection.data == {'employee_id': 1, 'department': None}
+
+
+def test_view_row_is_decoded_into_typed_records(employee_row):
+    employee = decode_employee_row(employee_row(department_id=7, salary=Decimal('3000.50')))
+    assert employee.salary == Decimal('3000.50')
+    assert employee.user == UserRecord(
+        2, 'alice@example.com', 'alice', '+6012-3456789', 'Alice', 'Tan', '1990-01-01', 'female', None, 'none', None, NOW, NOW)
+    assert employee.department == DepartmentRecord(7, 'Sales', None, NOW, NOW)
+    assert employee.address == AddressRecord(3, 'Kuala Lumpur', '1 Jalan', None, 'WP', 'Malaysia', '50000')
+    assert employee.version == f"1:{NOW.isoformat()}:{NOW.isoformat()}:{NOW.isoformat()}"
+
+
+def test_missing_department_and_address_decode_to_none(employee_row):
+    employee = decode_employee_row(employee_row(address_id=None))
+    assert employee.department is None and employee.address is None
+    assert employee.version == f"1:{NOW.isoformat()}:{NOW.isoformat()}:"
+
+
+def test_decoded_employee_encodes_like_the_view_document(employee_row):
+    row = employee_row(department_id=7)
+    document = json.loads(FlaskJSONProvider().dumps(decode_employee_row(row)))
+    assert document['user'] == {**json.loads(row['user']), 'created_at': 'Mon, 20 Dec 2021 10:00:00 GMT',
+                                'updated_at': 'Mon, 20 Dec 2021 10:00:00 GMT'}
+    assert document['department']['name'] == 'Sales'
+    assert document['address']['city'] == 'Kuala Lumpur'
+
+
+def test_projection_row_decodes_like_a_projected_employee(employee_row):
+    # the same fields read through a fieldset or narrowed from the cached employee
+    fields = ('employee_id', 'role', 'user.username', 'user.updated_at', 'department.name')
+    employee = decode_employee_row(employee_row(department_id=7))
+    projection = decode_employee_projection({
+        'employee_id': 1, 'role': 'admin',
+        'user': json.dumps({'username': 'alice', 'updated_at': str(NOW)}),
+        'department': json.dumps({'name': 'Sales'}),
+        '_employee_updated_at': NOW, '_user_updated_at': NOW, '_department_updated_at': NOW,
+    })
+    assert projection == project_employee(employee, fields)
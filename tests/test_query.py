@@ -0,0 +1,159 @@
+from types import SimpleNamespace
+import pytest
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest
+from cache import EmployeeCache, MemoryBackend
+from handler import handle_fetch_employee_stats, handle_fetch_many_employee
+from helper import encode_cursor
+from query import build_search_employees_query, build_select_employee_page_query, build_select_employee_stats_sql, compile_employee_projection, employee_document_source
+
+
+def test_projection_keeps_employees_without_a_department_or_address():
+    columns, source = compile_employee_projection(('employee_id', 'department.name', 'address.city'))
+    assert "LEFT JOIN department D ON D.department_id = E.department_id" in source
+    assert "LEFT JOIN address A ON A.address_id = E.address_id" in source
+    assert "WHERE" not in source
+
+
+def test_projection_of_scalars_joins_nothing():
+    columns, source = compile_employee_projection(('employee_id', 'role'))
+    assert "JOIN" not in source
+    assert "WHERE" not in source
+
+
+def test_projection_of_documents_reads_the_table():
+    columns, source = compile_employee_projection(('employee_id', 'department.name'), employee_document_source)
+    assert source == employee_document_source
+
+
+def test_projection_renders_a_missing_department_as_null():
+    columns, source = compile_employee_projection(('employee_id', 'department.name'))
+    assert "IF(D.department_id IS NULL, NULL, JSON_OBJECT('name', D.name)) AS `department`" in source
+
+
+def test_projection_of_documents_renders_a_missing_department_as_null():
+    columns, source = compile_employee_projection(('employee_id', 'department.name'), employee_document_source)
+    assert ("IF(JSON_TYPE(`department`->'$.department_id') = 'NULL', NULL, "
+            "JSON_OBJECT('name', `department`->'$.name')) AS `department`") in columns
+
+
+def _sql(query):
+    return ' '.join(query.split())
+
+
+def test_first_page_has_no_conditions():
+    query, params = build_select_employee_page_query(None, 11, {})
+    assert _sql(query).endswith("FROM employee_lookup_view ORDER BY employee_id LIMIT %s")
+    assert params == (11,)
+
+
+def test_page_after_a_cursor_with_filters():
+    query, params = build_select_employee_page_query(42, 11, {'department': 'Sales', 'role': 'admin', 'active': True})
+    assert ("WHERE employee_id > %s AND lookup_department_id = (SELECT department_id FROM department WHERE name = %s) "
+            "AND role = %s AND (end_at IS NULL OR end_at > CURRENT_DATE) ORDER BY employee_id LIMIT %s") in _sql(query)
+    assert params == (42, 'Sales', 'admin', 11)
+
+
+def test_inactive_filter():
+    query, params = build_select_employee_page_query(None, 11, {'active': False})
+    assert "WHERE end_at <= CURRENT_DATE" in _sql(query)
+
+
+class PageCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def execute(self, query, params):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows[:self.params[-1]]
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('count, has_more', [(3, True), (2, False)])
+def test_page_reads_one_more_row_to_tell_if_there_is_a_next_one(employee_row, count, has_more):
+    cursor = PageCursor([employee_row(employee_id=i) for i in range(1, count + 1)])
+    with Flask(__name__).test_request_context():
+        page = handle_fetch_many_employee(SimpleNamespace(cursor=lambda: cursor), MultiDict({'limit': '2'})).get_json()
+    assert cursor.params == (3,)
+    assert [e['employee_id'] for e in page['data']] == [1, 2]
+    assert page['has_more'] is has_more
+    assert page['next_cursor'] == (encode_cursor(2) if has_more else None)
+
+
+def test_search_ranks_a_bounded_union_under_a_time_limit():
+    query, params = build_search_employees_query('ali tan', 1000, 21, 40, 250)
+    query = _sql(query)
+    assert query.startswith("SELECT /*+ MAX_EXECUTION_TIME(250) */ employee_id, SUM(score) AS score FROM (")
+    assert query.count("UNION ALL") == 5
+    assert query.endswith("GROUP BY employee_id ORDER BY score DESC, employee_id LIMIT %s OFFSET %s")
+    # the full-text branch, the four prefix branches and the role branch, each capped
+    assert params == ('+ali* +tan*', '+ali* +tan*', 1000, *['ali tan%', 1000] * 5, 21, 40)
+
+
+def test_search_drops_operators_and_escapes_like_wildcards():
+    query, params = build_search_employees_query('50%_off -"x"', 1000, 21, 0, 250)
+    assert params[0] == '+50* +_off* +x*'
+    assert params[3] == '50\\%\\_off -"x"%'
+
+
+@pytest.mark.parametrize('group_by, expr, join', [
+    ('all', "NULL", False),
+    ('department', "d.name", True),
+    ('role', "e.role", False),
+    ('start_month', "DATE_FORMAT(e.start_at, '%%Y-%%m')", False),
+])
+def test_stats_are_grouped_in_one_pass(group_by, expr, join):
+    query = _sql(build_select_employee_stats_sql(group_by))
+    assert f"SELECT {expr} AS grp," in query
+    assert f"ROW_NUMBER() OVER (PARTITION BY {expr} ORDER BY e.salary) AS salary_rank" in query
+    assert ("LEFT JOIN `department` AS d ON d.department_id = e.department_id" in query) is join
+    assert "MAX(CASE WHEN salary_rank = CEIL(group_size * 0.9) THEN salary END) AS salary_p90" in query
+    assert query.endswith("GROUP BY grp ORDER BY grp")
+
+
+def test_stats_sql_is_executed_with_params_to_unescape_percent():
+    assert "DATE_FORMAT(e.start_at, '%Y-%m')" in build_select_employee_stats_sql('start_month') % ()
+
+
+def test_stats_cannot_be_grouped_by_anything_else():
+    with pytest.raises(Exception):
+        build_select_employee_stats_sql('salary')
+
+
+class StatsCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params):
+        self.conn.queries += 1
+
+    def fetchall(self):
+        return [{'group': 'admin', 'headcount': 2}]
+
+    def close(self):
+        pass
+
+
+def test_stats_group_by_is_validated_and_cached_per_group():
+    conn = SimpleNamespace(queries=0)
+    conn.cursor = lambda: StatsCursor(conn)
+    cache = EmployeeCache(MemoryBackend(100), ttl=60, analytics_ttl=10)
+    with Flask(__name__).test_request_context():
+        with pytest.raises(BadRequest):
+            handle_fetch_employee_stats(conn, MultiDict({'group_by': 'salary'}), cache)
+        first = handle_fetch_employee_stats(conn, MultiDict({'group_by': 'role'}), cache).get_json()
+        assert handle_fetch_employee_stats(conn, MultiDict({'group_by': 'role'}), cache).get_json() == first
+        assert conn.queries == 1
+        handle_fetch_employee_stats(conn, MultiDict(), cache)
+        assert conn.queries == 2
+        # any write drops the analytics
+        cache.invalidate('alice')
+        handle_fetch_employee_stats(conn, MultiDict({'group_by': 'role'}), cache)
+        assert conn.queries == 3
+    assert first == {'group_by': 'role', 'groups': [{'group': 'admin', 'headcount': 2}]}
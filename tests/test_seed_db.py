@@ -0,0 +1,27 @@
+from faker import Faker
+from helper import collation_key
+from seed_db import department_names
+
+
+class RepeatingFake:
+    # draws the same few cities over and over, in different spellings
+    def __init__(self, cities):
+        self.cities = cities
+        self.drawn = 0
+
+    def city(self):
+        self.drawn += 1
+        return self.cities[(self.drawn - 1) % len(self.cities)]
+
+
+def test_department_names_are_unique_under_mysql_collation():
+    names = department_names(RepeatingFake(['Penang', 'penang', 'Pénang', 'Ipoh']), 6)
+    assert names == ['Penang', 'penang 2', 'Pénang 3', 'Ipoh', 'Penang 4', 'penang 5']
+    assert len({collation_key(name) for name in names}) == 6
+
+
+def test_department_names_outnumber_faker_cities():
+    fake = Faker()
+    fake.seed_instance(0)
+    names = department_names(fake, 2000)
+    assert len({collation_key(name) for name in names}) == 2000
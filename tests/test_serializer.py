@@ -0,0 +1,75 @@
+import gzip
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import pytest
+from flask import Flask
+from werkzeug.http import parse_accept_header
+from flask.wrappers import Response
+from model import decode_employee_row
+from serializer import FlaskJSONProvider, OrjsonProvider, ResponseCompression, brotli, orjson
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+@pytest.mark.parametrize('obj', [
+    {'salary': Decimal('3000.50'), 'zero': Decimal('0'), 'negative': Decimal('-1.25')},
+    {'start_at': date(2020, 1, 2), 'end_at': None},
+    {'created_at': datetime(2021, 12, 20, 10, 0, 0, 123456), 'aware': datetime(2021, 12, 20, 18, 0, tzinfo=timezone.utc)},
+    {'name': 'Zoë', 'nested': [{'b': 1, 'a': 2.5}, None, True]},
+])
+def test_orjson_matches_flask_byte_for_byte(app, obj):
+    assert OrjsonProvider().dumps(obj) == FlaskJSONProvider().dumps(obj)
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+def test_orjson_matches_flask_for_an_employee(app, employee_row):
+    employee = decode_employee_row(employee_row(salary=Decimal('4200.00'), start_at=date(2020, 1, 1)))
+    assert OrjsonProvider().dumps([employee]) == FlaskJSONProvider().dumps([employee])
+
+
+def _accept(header):
+    return parse_accept_header(header)
+
+
+def _response(size):
+    return Response(b'[' + b'1,' * (size // 2) + b'1]', mimetype='application/json')
+
+
+def test_large_response_is_gzipped_when_accepted():
+    response = ResponseCompression(100, 6, 4).compress(_response(1000), _accept('gzip, deflate'))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert gzip.decompress(response.get_data()) == _response(1000).get_data()
+
+
+def test_small_response_is_left_alone():
+    response = ResponseCompression(100, 6, 4).compress(_response(10), _accept('gzip'))
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' not in response.vary
+
+
+@pytest.mark.parametrize('header', ['', 'identity', 'gzip;q=0'])
+def test_large_response_is_sent_plain_without_an_accepted_encoding(header):
+    response = ResponseCompression(100, 6, 4).compress(_response(1000), _accept(header))
+    assert 'Content-Encoding' not in response.headers
+    # a cache must still tell the plain and the compressed bodies apart
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_brotli_is_preferred_when_installed():
+    response = ResponseCompression(100, 6, 4).compress(_response(1000), _accept('gzip, br'))
+    assert response.headers['Content-Encoding'] == ('br' if brotli is not None else 'gzip')
+
+
+def test_streamed_and_non_json_responses_are_left_alone():
+    compression = ResponseCompression(100, 6, 4)
+    streamed = Response(iter([b'1' * 1000]), mimetype='application/json')
+    assert 'Content-Encoding' not in compression.compress(streamed, _accept('gzip')).headers
+    html = Response(b'1' * 1000, mimetype='text/html')
+    assert 'Content-Encoding' not in compression.compress(html, _accept('gzip')).headers
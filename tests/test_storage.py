@@ -0,0 +1,139 @@
+import io
+import json
+import threading
+from unittest import mock
+import pytest
+from boto3 import client
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from avatar import Avatar
+from storage import AvatarUploadQueue, S3Storage
+
+BUCKET_ID = 'avatars'
+REGION = 'ap-southeast-1'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', REGION)
+    with mock_aws():
+        s3 = client('s3', region_name=REGION)
+        s3.create_bucket(Bucket=BUCKET_ID, CreateBucketConfiguration={'LocationConstraint': REGION})
+        yield s3
+
+
+class _EmptyBody:
+    def stream(self, **kwargs):
+        return iter([b''])
+
+
+def _png(size: int = 64) -> bytes:
+    Image = pytest.importorskip('PIL.Image')
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), 'red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_put_uploads_the_object_and_returns_its_url(s3):
+    storage = S3Storage(BUCKET_ID, max_attempts=2, max_connections=1)
+
+    url = storage.put('alice_avatar.png', b'avatar', 'image/png')
+
+    assert url == f"https://{BUCKET_ID}.s3-{REGION}.amazonaws.com/alice_avatar.png"
+    stored = s3.get_object(Bucket=BUCKET_ID, Key='alice_avatar.png')
+    assert stored['Body'].read() == b'avatar'
+    assert stored['ContentType'] == 'image/png'
+
+
+def test_put_raises_when_the_upload_fails(s3):
+    storage = S3Storage('missing-bucket', max_attempts=2, max_connections=1)
+
+    with pytest.raises(ClientError):
+        storage.put('alice_avatar.png', b'avatar', 'image/png')
+
+
+def test_put_is_attempted_max_attempts_times(s3):
+    storage = S3Storage(BUCKET_ID, max_attempts=3, max_connections=1)
+    attempts = []
+
+    def unavailable(request, **kwargs):
+        attempts.append(request)
+        return AWSResponse(request.url, 503, {}, _EmptyBody())
+
+    storage._client.meta.events.register_first('before-send.s3.PutObject', unavailable)
+    with mock.patch('time.sleep'), pytest.raises(ClientError):
+        storage.put('alice_avatar.png', b'avatar', 'image/png')
+
+    # botocore's retries are the only ones, there is no second layer on top
+    assert len(attempts) == 3
+
+
+def test_url_for_with_an_endpoint_does_not_look_up_the_region(s3):
+    storage = S3Storage(BUCKET_ID, max_attempts=1, max_connections=1, endpoint_url='http://localhost:5001/')
+
+    with mock.patch.object(storage._client, 'get_bucket_location') as get_bucket_location:
+        assert storage.url_for('alice_avatar.png') == f"http://localhost:5001/{BUCKET_ID}/alice_avatar.png"
+    get_bucket_location.assert_not_called()
+
+
+def test_region_is_looked_up_once(s3):
+    storage = S3Storage(BUCKET_ID, max_attempts=1, max_connections=1)
+
+    with mock.patch.object(storage._client, 'get_bucket_location', wraps=storage._client.get_bucket_location) as get_bucket_location:
+        threads = [threading.Thread(target=storage.url_for, args=(f"{i}.png",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert storage.url_for('alice_avatar.png') == f"https://{BUCKET_ID}.s3-{REGION}.amazonaws.com/alice_avatar.png"
+    assert get_bucket_location.call_count == 1
+
+
+def test_region_of_a_us_east_1_bucket(s3):
+    s3_us = client('s3', region_name='us-east-1')
+    s3_us.create_bucket(Bucket='us-avatars')
+    storage = S3Storage('us-avatars', max_attempts=1, max_connections=1)
+
+    assert storage.region() == 'us-east-1'
+
+
+def test_upload_queue_reports_the_avatar_and_its_variants(s3):
+    completed = []
+    queue = AvatarUploadQueue(S3Storage(BUCKET_ID, max_attempts=1, max_connections=1), workers=1,
+                              max_size=1024 * 1024, variant_sizes=[32],
+                              on_complete=lambda *args: completed.append(args))
+
+    url = queue.enqueue('alice', Avatar('png', 'image/png', _png())).result()
+    queue.close()
+
+    assert url == f"https://{BUCKET_ID}.s3-{REGION}.amazonaws.com/alice_avatar.png"
+    assert completed == [('alice', url, json.dumps({'32': f"https://{BUCKET_ID}.s3-{REGION}.amazonaws.com/alice_avatar_32.webp"}))]
+    assert s3.get_object(Bucket=BUCKET_ID, Key='alice_avatar_32.webp')['ContentType'] == 'image/webp'
+
+
+def test_upload_queue_reports_a_failed_upload(s3):
+    completed = []
+    queue = AvatarUploadQueue(S3Storage('missing-bucket', max_attempts=1, max_connections=1), workers=1,
+                              max_size=1024 * 1024, variant_sizes=[32],
+                              on_complete=lambda *args: completed.append(args))
+
+    assert queue.enqueue('alice', Avatar('png', 'image/png', b'\x89PNG')).result() is None
+    queue.close()
+
+    assert completed == [('alice', None, None)]
+
+
+def test_upload_queue_survives_a_failing_callback(s3, caplog):
+    def on_complete(*args):
+        raise Exception("database is down")
+
+    queue = AvatarUploadQueue(S3Storage(BUCKET_ID, max_attempts=1, max_connections=1), workers=1,
+                              max_size=1024 * 1024, variant_sizes=[], on_complete=on_complete)
+
+    assert queue.enqueue('alice', Avatar('png', 'image/png', b'\x89PNG')).result() is not None
+    queue.close()
+
+    assert "failed to record avatar upload of 'alice'" in caplog.text
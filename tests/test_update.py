@@ -0,0 +1,163 @@
+from datetime import datetime
+import pytest
+from werkzeug.exceptions import BadRequest, NotFound, PreconditionFailed
+from werkzeug.http import parse_etags
+from handler import handle_update_one_employee
+from helper import make_etag
+from model import employee_version
+
+NOW = datetime(2021, 12, 20, 10, 0, 0, 123456)
+
+
+class RecordingCursor:
+    """
+    Records the statements of a handler and answers them like mysql would
+    for one employee, `alice`, and one department, `Sales`.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lastrowid = None
+        self._result = None
+
+    def execute(self, query, args=None):
+        query = ' '.join(query.split())
+        self.conn.statements.append(query)
+        self._result = None
+        if 'FOR UPDATE' in query:
+            if args == 'alice':
+                self._result = {'employee_id': 1, 'address_id': self.conn.address_id,
+                                'updated_at': NOW, 'user_updated_at': NOW, 'department_updated_at': None}
+        elif query.startswith('SELECT department_id FROM department'):
+            if args == 'Sales':
+                self._result = {'department_id': 7}
+        elif query.startswith('INSERT INTO address'):
+            self.lastrowid = 9
+            return 1
+        elif query.startswith('UPDATE'):
+            return 1 if args[-1] == 'alice' else 0
+        elif query.startswith('SELECT'):
+            self._result = self.conn.employee_row(address_id=self.conn.address_id)
+        return 1 if self._result is not None else 0
+
+    def fetchone(self):
+        return self._result
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self, employee_row, address_id=3):
+        self.employee_row = employee_row
+        self.address_id = address_id
+        self.statements = []
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def begin(self):
+        self.statements.append('BEGIN')
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+    def rollback(self):
+        self.statements.append('ROLLBACK')
+
+
+def _kinds(statements):
+    kinds = []
+    for statement in statements:
+        if 'FOR UPDATE' in statement:
+            kinds.append('SELECT FOR UPDATE')
+        elif statement.startswith('SELECT department_id'):
+            kinds.append('SELECT department')
+        else:
+            kinds.append(' '.join(statement.split()[:2]) if statement.startswith('INSERT') else statement.split()[0])
+    return kinds
+
+
+def _update(conn, body, username='alice'):
+    return handle_update_one_employee(conn, username, body, avatar_uploads=None)
+
+
+def test_user_fields_only_update_in_one_statement(employee_row):
+    conn = RecordingConnection(employee_row)
+    _update(conn, {'first_name': 'Alicia', 'role': 'manager'})
+    assert _kinds(conn.statements) == ['BEGIN', 'UPDATE', 'SELECT', 'COMMIT']
+    assert conn.statements[1] == ("UPDATE `employee` AS e JOIN `user` AS u ON u.user_id = e.user_id "
+                                  "SET e.role = %s, u.first_name = %s, e.updated_at = CURRENT_TIMESTAMP(6) WHERE u.username = %s")
+
+
+def test_department_is_looked_up_before_the_update(employee_row):
+    conn = RecordingConnection(employee_row)
+    _update(conn, {'department': 'Sales'})
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT department', 'UPDATE', 'SELECT', 'COMMIT']
+    assert conn.statements[2] == ("UPDATE `employee` AS e JOIN `user` AS u ON u.user_id = e.user_id "
+                                  "SET e.department_id = %s, e.updated_at = CURRENT_TIMESTAMP(6) WHERE u.username = %s")
+
+
+def test_unknown_department_is_a_bad_request(employee_row):
+    conn = RecordingConnection(employee_row)
+    with pytest.raises(BadRequest):
+        _update(conn, {'department': 'Marketing'})
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT department', 'ROLLBACK', 'COMMIT']
+
+
+def test_address_is_updated_in_place(employee_row):
+    conn = RecordingConnection(employee_row)
+    _update(conn, {'address': {'city': 'Ipoh', 'line1': '2 Jalan', 'state': 'Perak', 'country': 'Malaysia', 'postal_code': '30000'}})
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT FOR UPDATE', 'UPDATE', 'SELECT', 'COMMIT']
+    assert "JOIN `address` AS a ON a.address_id = e.address_id" in conn.statements[2]
+
+
+def test_address_is_created_for_an_employee_without_one(employee_row):
+    conn = RecordingConnection(employee_row, address_id=None)
+    _update(conn, {'address': {'city': 'Ipoh', 'line1': '2 Jalan', 'state': 'Perak', 'country': 'Malaysia', 'postal_code': '30000'}})
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT FOR UPDATE', 'INSERT INTO', 'UPDATE', 'SELECT', 'COMMIT']
+    assert conn.statements[3] == ("UPDATE `employee` AS e JOIN `user` AS u ON u.user_id = e.user_id "
+                                  "SET e.address_id = %s, e.updated_at = CURRENT_TIMESTAMP(6) WHERE u.username = %s")
+
+
+def test_partial_address_of_an_employee_without_one_is_a_bad_request(employee_row):
+    conn = RecordingConnection(employee_row, address_id=None)
+    with pytest.raises(BadRequest):
+        _update(conn, {'city': 'Ipoh'})
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT FOR UPDATE', 'ROLLBACK', 'COMMIT']
+
+
+def test_mixed_update_in_one_statement(employee_row):
+    conn = RecordingConnection(employee_row)
+    _update(conn, {'salary': 4000, 'last_name': 'Lim', 'city': 'Ipoh', 'department': 'Sales'})
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT FOR UPDATE', 'SELECT department', 'UPDATE', 'SELECT', 'COMMIT']
+    assert conn.statements[3] == (
+        "UPDATE `employee` AS e JOIN `user` AS u ON u.user_id = e.user_id JOIN `address` AS a ON a.address_id = e.address_id "
+        "SET e.salary = %s, u.last_name = %s, a.city = %s, e.department_id = %s, e.updated_at = CURRENT_TIMESTAMP(6) "
+        "WHERE u.username = %s")
+
+
+def test_unknown_employee_is_not_found(employee_row):
+    conn = RecordingConnection(employee_row)
+    with pytest.raises(NotFound):
+        _update(conn, {'role': 'manager'}, username='bob')
+    assert _kinds(conn.statements) == ['BEGIN', 'UPDATE', 'ROLLBACK', 'COMMIT']
+
+
+def _current_etag():
+    return make_etag([employee_version(1, NOW, NOW, None)])
+
+
+def test_stale_if_match_is_a_failed_precondition(employee_row):
+    conn = RecordingConnection(employee_row)
+    with pytest.raises(PreconditionFailed):
+        handle_update_one_employee(conn, 'alice', {'role': 'manager'}, None, if_match=parse_etags('"stale"'))
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT FOR UPDATE', 'ROLLBACK', 'COMMIT']
+
+
+@pytest.mark.parametrize('header', ['"{}"', 'W/"{}"'])
+def test_current_if_match_updates(employee_row, header):
+    # a compressed GET hands out the weak form of the tag
+    conn = RecordingConnection(employee_row)
+    handle_update_one_employee(conn, 'alice', {'role': 'manager'}, None, if_match=parse_etags(header.format(_current_etag())))
+    assert _kinds(conn.statements) == ['BEGIN', 'SELECT FOR UPDATE', 'UPDATE', 'SELECT', 'COMMIT']
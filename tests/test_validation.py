@@ -0,0 +1,23 @@
+import pytest
+from validation import validate_batch_get_employees, validate_update_employee, validation_error
+
+
+def test_update_accepts_the_nested_and_the_flat_address():
+    assert validation_error(validate_update_employee, {'role': 'admin', 'address': {
+        'city': 'Kuala Lumpur', 'line1': '1 Jalan', 'state': 'WP', 'country': 'Malaysia', 'postal_code': '50000'}}) is None
+    assert validation_error(validate_update_employee, {'city': 'Kuala Lumpur', 'postal_code': '50000'}) is None
+
+
+@pytest.mark.parametrize('key', ['avatar_status', 'avatar_variants', 'avatar_url', 'password_hash'])
+def test_update_rejects_the_columns_set_by_the_app(key):
+    assert validation_error(validate_update_employee, {key: 'x'}) is not None
+
+
+def test_update_checks_the_flat_address_keys():
+    assert validation_error(validate_update_employee, {'postal_code': '1'}) is not None
+
+
+def test_batch_get_fetches_at_most_100_employees():
+    assert validation_error(validate_batch_get_employees, {'usernames': ['alice'] * 100}) is None
+    assert validation_error(validate_batch_get_employees, {'usernames': ['alice'] * 101}) is not None
+    assert validation_error(validate_batch_get_employees, {'employee_ids': list(range(101))}) is not None
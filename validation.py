@@ -0,0 +1,43 @@
+from functools import wraps
+from typing import Any, Callable, List, Optional
+from flask import request
+from werkzeug.exceptions import BadRequest
+import fastjsonschema
+from schema import batch_get_employees_schema, create_employee_schema, update_employee_schema
+
+# the schemas are compiled once into plain python validators at import time
+validate_create_employee = fastjsonschema.compile(create_employee_schema)
+validate_update_employee = fastjsonschema.compile(update_employee_schema)
+validate_batch_get_employees = fastjsonschema.compile(batch_get_employees_schema)
+
+
+def validation_error(validate: Callable[[Any], Any], data: Any) -> Optional[str]:
+    """
+    Run a compiled validator and return its error message, or None if the
+    data is valid.
+    """
+    try:
+        validate(data)
+    except fastjsonschema.JsonSchemaValueException as e:
+        return e.message
+    return None
+
+
+def expects_json(validate: Callable[[Any], Any], ignore_for: List[str] = []):
+    """
+    Decorate a route so its json body is parsed and checked with a compiled
+    validator before the route runs. Methods in `ignore_for` are not checked.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method not in ignore_for:
+                data = request.get_json(silent=True)
+                if data is None:
+                    raise BadRequest("Failed to decode JSON object")
+                error = validation_error(validate, data)
+                if error is not None:
+                    raise BadRequest(error)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
@@ -32,6 +32,23 @@ export type EmployeeFormModel = {
   endAt: number | null
 }
 
+// an employee may have no address or department, the form starts them empty
+export const emptyAddress = (): EmployeeFormModel['address'] => ({
+  city: '',
+  country: '',
+  line1: '',
+  line2: '',
+  postal_code: '',
+  state: '',
+})
+
+export const emptyDepartment = (): EmployeeFormModel['department'] => ({
+  name: '',
+  description: '',
+  created_at: '',
+  updated_at: '',
+})
+
 export const useEmployeeFormModel = () => ref<EmployeeFormModel>({
   user: {
     first_name: '',
@@ -44,20 +61,8 @@ export const useEmployeeFormModel = () => ref<EmployeeFormModel>({
     avatar_image: '',
     avatar_url: '',
   },
-  address: {
-    city: '',
-    country: '',
-    line1: '',
-    line2: '',
-    postal_code: '',
-    state: '',
-  },
-  department: {
-    name: '',
-    description: '',
-    created_at: '',
-    updated_at: '',
-  },
+  address: emptyAddress(),
+  department: emptyDepartment(),
   salary: null as number | null,
   role: '',
   startAt: null as number | null,
@@ -32,6 +32,8 @@ export type User = {
   gender: string
   phone_number: string
   avatar_url: string | null
+  avatar_status: 'none' | 'pending' | 'ready' | 'failed'
+  avatar_variants: Record<string, string> | null
   updated_at: string
   created_at: string
 }
@@ -41,10 +43,16 @@ export type EmployeeView = {
   role: string
   salary: string
   user: User
-  address: Address
-  department: Department
+  address: Address | null
+  department: Department | null
   start_at: string
   end_at: string | null
   created_at: string
   updated_at: string
 }
+
+export type Page<T> = {
+  data: T[]
+  next_cursor: string | null
+  has_more: boolean
+}